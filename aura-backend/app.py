@@ -3,21 +3,26 @@ from flask import Flask, jsonify, request
 from flask_cors import CORS
 from werkzeug.security import generate_password_hash, check_password_hash
 import database as db
+import dashboard_cache
 import simulator
 from intelligent_core import process_user_intent
-import threading
-import model_trainer
-from flask import send_file
-import report_generator
-import matplotlib
-matplotlib.use('Agg')  # Use a non-GUI backend for matplotlib
+from flask import send_file, stream_with_context
+import training_jobs
+# report_generator (matplotlib/fpdf) is imported inside its route, and
+# training runs in separate processes, so booting a worker never loads TensorFlow.
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
-from datetime import timedelta
-from config import JWT_SECRET_KEY, CORS_ORIGINS
+from datetime import datetime, timedelta, timezone
+from config import JWT_SECRET_KEY, CORS_ORIGINS, BULK_API_KEY, BULK_PREDICTION_MAX_ITEMS, DOSE_SWEEP_MAX_POINTS
+import hmac
+from prediction_service import predict_batch
+from recommendation_service import recommend_batch
+import numpy as np
+from logging_config import get_logger, LOG_DEBUG_PAYLOADS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 
 app = Flask(__name__)
+logger = get_logger("api")
 
 # JWT configuration
 app.config["JWT_SECRET_KEY"] = JWT_SECRET_KEY
@@ -75,15 +80,11 @@ def register():
         return jsonify({"error": "Username already taken"}), 409
 
     hashed_password = generate_password_hash(password)
-    conn = db.get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO users (username, password_hash, name, age, gender, phone_number, weight_kg, height_cm) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
-        (username, hashed_password, name, age, gender, phone, weight, height)
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    with db.db_cursor() as cur:
+        cur.execute(
+            "INSERT INTO users (username, password_hash, name, age, gender, phone_number, weight_kg, height_cm) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+            (username, hashed_password, name, age, gender, phone, weight, height)
+        )
     return jsonify({"message": "User registered successfully!"}), 201
 
 @app.route("/login", methods=['POST'])
@@ -113,8 +114,6 @@ def login():
 @limiter.limit("30 per minute")
 @jwt_required()
 def handle_chat_intent():
-    print("\n" + "="*50)
-    print("--- Received request at /api/chat ---")
     data = request.get_json()
     if not isinstance(data, dict):
         return jsonify({"error": "Invalid JSON body"}), 400
@@ -123,7 +122,7 @@ def handle_chat_intent():
     user_id = data.get('user_id')
 
     if not user_message or not user_id:
-        print("--- [ERROR] Request is missing 'message' or 'user_id'. ---")
+        logger.warning("Chat request is missing 'message' or 'user_id'")
         return jsonify({"error": "A 'message' and 'user_id' are required"}), 400
         
     try:
@@ -136,63 +135,51 @@ def handle_chat_intent():
     if jwt_user_id != user_id_int:
         return jsonify({"error": "Unauthorized user context"}), 403
 
-    print(f"--- [INPUT] User ID: {user_id_int}, Message: '{user_message}'")
+    logger.info("Chat request for user %s (%d chars)", user_id_int, len(user_message))
     
     # --- Step 1: Get Glucose History ---
     glucose_history = db.get_recent_glucose_readings(user_id_int, limit=12)
     if not glucose_history or len(glucose_history) < 12:
-        print(f"--- [DATA] Found only {len(glucose_history)} readings. Using fallback mock data for AI. ---")
+        logger.info("Found only %d readings for user %s. Using fallback mock data for AI.", len(glucose_history), user_id_int)
         glucose_history = [120, 122, 125, 126, 128, 129, 130, 131, 130, 128, 126, 124]
-    else:
-        print(f"--- [DATA] Found {len(glucose_history)} recent glucose readings. ---")
 
     # --- Step 2: Call the AI Core ---
-    print("--- [AI] Calling 'process_user_intent'... ---")
     ai_response = process_user_intent(
         user_id=user_id_int,
         user_text=user_message,
         glucose_history=glucose_history
     )
     
-    # --- !! CRITICAL DEBUGGING STEP !! ---
-    # We will now print the entire raw response from the AI to see exactly what it contains.
-    import json
-    print("--- [AI] Raw response from AI Core:")
-    print(json.dumps(ai_response, indent=2))
-    # ----------------------------------------
+    # Full AI responses contain health data; only dump them when explicitly enabled.
+    if LOG_DEBUG_PAYLOADS:
+        logger.debug("Raw response from AI Core", extra={"payload": ai_response})
 
     # --- Step 3: Save Detected Meals to Database ---
-    print("--- [DATABASE] Checking AI response for meals to save... ---")
     try:
         # More robust check: ensure keys exist before accessing them
         if "parsed_info" in ai_response and "foods_detected" in ai_response["parsed_info"]:
             foods_to_log = ai_response["parsed_info"]["foods_detected"]
             
             if foods_to_log: # Check if the list is not empty
-                print(f"--- [DATABASE] Found {len(foods_to_log)} food item(s). Proceeding to save. ---")
                 for food_item in foods_to_log:
                     description = f"{food_item.get('quantity', 1)}x {food_item.get('food', 'Unknown Food')}"
                     carb_value = food_item.get('carbs', 0)
                     
-                    print(f"--- [DATABASE] Saving: User='{user_id_int}', Desc='{description}', Carbs='{carb_value}'")
                     db.add_log_entry(
                         user_id=user_id_int,
                         log_type='meal',
                         description=description,
                         value=carb_value
                     )
-                print("--- [DATABASE] All detected meals have been saved. ---")
+                logger.info("Saved %d detected meal(s) for user %s", len(foods_to_log), user_id_int)
             else:
-                print("--- [DATABASE] 'foods_detected' list was empty. Nothing to save. ---")
+                logger.debug("No foods detected; nothing to save")
         else:
-            print("--- [DATABASE] 'parsed_info' or 'foods_detected' key not found in AI response. Nothing to save. ---")
+            logger.debug("'parsed_info' or 'foods_detected' key not found in AI response; nothing to save")
             
-    except Exception as e:
-        print(f"--- [DATABASE] CRITICAL ERROR during save process. The AI response was processed, but saving failed. ---")
-        print(f"--- [DATABASE] Error details: {e} ---")
-    
-    print("--- AI Core processed intent successfully. Returning response to frontend. ---")
-    print("="*50 + "\n")
+    except Exception:
+        logger.exception("Saving detected meals failed for user %s; returning the AI response anyway", user_id_int)
+
     return jsonify(ai_response)
 # ==================================================================
 # === NEW: AI CALIBRATION ENDPOINT =================================
@@ -202,9 +189,11 @@ def handle_chat_intent():
 @jwt_required()
 def calibrate_ai_for_user():
     """
-    Triggers the AI fine-tuning process for a specific user in the background.
+    Queues the AI fine-tuning job for a specific user (or returns the one
+    already queued/running). Poll GET /api/ai/calibrate/<job_id> for progress.
     """
-    user_id = request.json.get('user_id')
+    body = request.get_json(silent=True)
+    user_id = body.get('user_id') if isinstance(body, dict) else None
     if not user_id:
         return jsonify({"error": "A 'user_id' is required"}), 400
         
@@ -218,24 +207,53 @@ def calibrate_ai_for_user():
     if jwt_user_id != user_id_int:
         return jsonify({"error": "Unauthorized user context"}), 403
 
-    print(f"--- [API] Received calibration request for user_id: {user_id_int} ---")
-    
-    # Run the slow training process in a separate thread
-    # This allows us to send an immediate "started" response back to the frontend
-    # without making the user wait for the training to finish.
-    training_thread = threading.Thread(
-        target=model_trainer.fine_tune_model_for_user,
-    args=(user_id_int,) # Ensure user_id is an integer
-    )
-    training_thread.start() # Start the background task
+    mode = body.get('mode', 'incremental')
+    if mode not in training_jobs.TRAINING_MODES:
+        return jsonify({"error": f"'mode' must be one of {list(training_jobs.TRAINING_MODES)}"}), 400
+
+    logger.info("Received %s calibration request for user %s", mode, user_id_int)
     
-    # Immediately return a 202 Accepted response to the frontend
+    # Training runs in a separate process pool, so we can send an immediate
+    # 202 Accepted response back without making the user wait.
+    job, created = training_jobs.submit_calibration(user_id_int, mode)
+    if created:
+        message = (f"AI model personalization has started for user {user_id_int}. "
+                   "This process runs in the background and may take several minutes. "
+                   "Predictions will automatically use the new model once complete.")
+    else:
+        message = f"AI model personalization is already {job['status']} for user {user_id_int}."
     return jsonify({
-        "status": "Calibration Initiated",
-    "message": f"AI model personalization has started for user {user_id_int}. " \
-                   "This process runs in the background and may take several minutes. " \
-                   "Predictions will automatically use the new model once complete."
+        "status": "Calibration Initiated" if created else "Calibration Already In Progress",
+        "message": message,
+        "job": job,
+        "status_url": f"/api/ai/calibrate/{job['job_id']}",
     }), 202
+
+def _get_owned_training_job(job_id: str):
+    """(job, None) for the caller's own job, else (None, error response)."""
+    job = training_jobs.get_job(job_id)
+    # Jobs of other users are reported as missing rather than forbidden.
+    if job is None or job["user_id"] != int(get_jwt_identity()):
+        return None, (jsonify({"error": "Calibration job not found"}), 404)
+    return job, None
+
+@app.route('/api/ai/calibrate/<job_id>', methods=['GET'])
+@jwt_required()
+def get_calibration_job(job_id):
+    job, error = _get_owned_training_job(job_id)
+    if error:
+        return error
+    return jsonify(job)
+
+@app.route('/api/ai/calibrate/<job_id>', methods=['DELETE'])
+@jwt_required()
+def cancel_calibration_job(job_id):
+    job, error = _get_owned_training_job(job_id)
+    if error:
+        return error
+    if not training_jobs.cancel_job(job_id):
+        return jsonify({"error": f"Calibration job is already {job['status']}"}), 409
+    return jsonify(training_jobs.get_job(job_id))
 @app.route("/api/dashboard", methods=['GET'])
 @jwt_required()
 def get_dashboard():
@@ -253,8 +271,19 @@ def get_dashboard():
     if jwt_user_id != user_id_int:
         return jsonify({"error": "Unauthorized user context"}), 403
 
-    dashboard_data = db.get_dashboard_data_for_user(user_id_int)
-    return jsonify(dashboard_data)
+    # Served from the dashboard cache when possible; the ETag lets the
+    # frontend revalidate cheaply after every chat/calibration/simulation.
+    entry = dashboard_cache.get_or_build(
+        user_id_int,
+        lambda: app.json.dumps(db.get_dashboard_data_for_user(user_id_int)) + "\n"
+    )
+    if request.if_none_match.contains(entry["etag"]):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(entry["body"], mimetype=app.json.mimetype)
+    response.set_etag(entry["etag"])
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
 # ==================================================================
 # === NEW: PDF REPORT DOWNLOAD ENDPOINT ============================
 # ==================================================================
@@ -281,9 +310,10 @@ def download_user_report():
     if jwt_user_id != user_id_int:
         return jsonify({"error": "Unauthorized user context"}), 403
 
-    print(f"--- [API] Received report generation request for user_id: {user_id_int} ---")
+    logger.info("Received report generation request for user %s", user_id_int)
 
     try:
+        import report_generator
         # Call the report generator, which returns the path and a clean filename
         pdf_path, pdf_filename = report_generator.create_user_report(user_id_int)
 
@@ -295,8 +325,51 @@ def download_user_report():
         )
 
     except Exception as e:
-        print(f"--- [API] ERROR: Failed to generate report. Error: {e} ---")
+        logger.exception("Failed to generate report for user %s", user_id_int)
         return jsonify({"error": f"An error occurred while generating the report: {e}"}), 500
+def _parse_time_param(name: str):
+    """Optional ISO-8601 query parameter (naive times are UTC); raises ValueError."""
+    value = request.args.get(name)
+    if not value:
+        return None
+    moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+@app.route('/api/user/glucose-export', methods=['GET'])
+@limiter.limit("10 per minute")
+@jwt_required()
+def export_glucose_history():
+    """
+    Streams the user's glucose readings in [start, end) as CSV, chunk by
+    chunk from a server-side cursor, so multi-year histories never sit in memory.
+    """
+    try:
+        user_id_int = int(request.args.get('user_id', ''))
+    except ValueError:
+        return jsonify({"error": "A 'user_id' integer query parameter is required"}), 400
+
+    # Enforce token identity
+    jwt_user_id = int(get_jwt_identity())
+    if jwt_user_id != user_id_int:
+        return jsonify({"error": "Unauthorized user context"}), 403
+
+    try:
+        start, end = _parse_time_param('start'), _parse_time_param('end')
+    except ValueError:
+        return jsonify({"error": "'start' and 'end' must be ISO-8601 timestamps"}), 400
+
+    def rows():
+        yield "timestamp,glucose_value\n"
+        for timestamps, values in db.iter_glucose_history(user_id_int, start, end):
+            stamps = np.datetime_as_string(timestamps, unit="s")
+            yield "".join(f"{ts}Z,{value:g}\n" for ts, value in zip(stamps, values.tolist()))
+
+    return app.response_class(
+        stream_with_context(rows()),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename=aura_glucose_user_{user_id_int}.csv"},
+    )
+
 @app.route('/api/dev/simulate-data', methods=['POST'])
 @limiter.limit("2 per minute")
 @jwt_required()
@@ -317,6 +390,119 @@ def simulate_data_endpoint():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# ==================================================================
+# === BULK FORECAST ENDPOINT (service-to-service) ==================
+# ==================================================================
+def _has_valid_service_key() -> bool:
+    provided = request.headers.get("X-API-Key", "")
+    return bool(BULK_API_KEY) and hmac.compare_digest(provided.encode(), BULK_API_KEY.encode())
+
+@app.route('/api/predict/batch', methods=['POST'])
+@limiter.limit("30 per minute")
+def bulk_predict_endpoint():
+    """
+    12-step forecasts for many patients in one call (e.g. overnight monitoring).
+    Authenticated with the X-API-Key header; disabled unless BULK_API_KEY is set.
+    Body: {"user_ids": [...], "histories": [[...], ...]}
+    """
+    if not BULK_API_KEY:
+        return jsonify({"error": "Bulk prediction is not enabled"}), 404
+    if not _has_valid_service_key():
+        return jsonify({"error": "Invalid or missing API key"}), 401
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "Invalid JSON body"}), 400
+    user_ids, histories = body.get('user_ids'), body.get('histories')
+    if not isinstance(user_ids, list) or not isinstance(histories, list) or len(user_ids) != len(histories):
+        return jsonify({"error": "'user_ids' and 'histories' must be lists of equal length"}), 400
+    if len(user_ids) > BULK_PREDICTION_MAX_ITEMS:
+        return jsonify({"error": f"At most {BULK_PREDICTION_MAX_ITEMS} forecasts per request"}), 413
+    try:
+        user_ids = [int(u) for u in user_ids]
+    except (TypeError, ValueError, OverflowError):
+        return jsonify({"error": "'user_ids' must be integers"}), 400
+
+    return jsonify({"results": predict_batch(user_ids, histories)})
+
+# ==================================================================
+# === DOSE SWEEP ENDPOINT (what-if grids) ==========================
+# ==================================================================
+class _SweepTooLarge(ValueError):
+    pass
+
+def _sweep_axis(spec, name: str, max_points: int) -> list:
+    """
+    A list of values, or {"start", "stop", "step"} with an inclusive stop.
+    The size of a range is checked before anything is allocated.
+    """
+    if isinstance(spec, (int, float)) and not isinstance(spec, bool):
+        values = [float(spec)]
+    elif isinstance(spec, list) and spec:
+        if len(spec) > max_points:
+            raise _SweepTooLarge(name)
+        values = [float(v) for v in spec]
+    elif isinstance(spec, dict):
+        start, stop, step = float(spec["start"]), float(spec["stop"]), float(spec.get("step", 1))
+        if not (np.isfinite(start) and np.isfinite(stop) and np.isfinite(step)) or step <= 0 or stop < start:
+            raise ValueError(f"'{name}' needs finite start <= stop and a positive step")
+        count = (stop - start) / step
+        if not count < max_points:
+            raise _SweepTooLarge(name)
+        # Floor (with slack for float error) so the last value never passes stop
+        values = (start + np.arange(int(np.floor(count + 1e-9)) + 1) * step).round(6).tolist()
+    else:
+        raise ValueError(f"'{name}' must be a number, a non-empty list, or {{start, stop, step}}")
+    if not np.all(np.isfinite(values)):
+        raise ValueError(f"'{name}' values must be finite numbers")
+    return values
+
+def _sweep_flag(value, name: str) -> bool:
+    # bool("false") is True, so only real JSON booleans are accepted
+    if not isinstance(value, bool):
+        raise ValueError(f"'{name}' must be true or false")
+    return value
+
+@app.route('/api/insulin/sweep', methods=['POST'])
+@limiter.limit("30 per minute")
+@jwt_required()
+def insulin_sweep_endpoint():
+    """
+    Recommended doses over a glucose x carbs grid for dose what-if sliders.
+    Body: {"glucose": {"start": 60, "stop": 400, "step": 10}, "carbs": [0, 15, 30, ...],
+           "time_hour": 12, "last_insulin_hours": 4, "exercise_recent": false, "stress_level": 0}
+    Returns "recommended_dose" as rows per glucose value, columns per carbs value.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "Invalid JSON body"}), 400
+    too_large = {"error": f"At most {DOSE_SWEEP_MAX_POINTS} grid points per request"}
+    try:
+        glucose = _sweep_axis(body.get('glucose', 120), 'glucose', DOSE_SWEEP_MAX_POINTS)
+        carbs = _sweep_axis(body.get('carbs', 0), 'carbs', DOSE_SWEEP_MAX_POINTS)
+        if len(glucose) * len(carbs) > DOSE_SWEEP_MAX_POINTS:
+            return jsonify(too_large), 413
+        context = {
+            "time_hour": float(body.get('time_hour', 12)),
+            "last_insulin_hours": float(body.get('last_insulin_hours', 4)),
+            "exercise_recent": _sweep_flag(body.get('exercise_recent', False), 'exercise_recent'),
+            "stress_level": float(body.get('stress_level', 0)),
+        }
+    except _SweepTooLarge:
+        return jsonify(too_large), 413
+    except (KeyError, TypeError, ValueError, OverflowError) as e:
+        return jsonify({"error": f"Invalid sweep parameters: {e}"}), 400
+
+    result = recommend_batch(np.array(glucose)[:, None], np.array(carbs)[None, :], **context)
+    if "error" in result:
+        return jsonify(result), 503
+    return jsonify({
+        "glucose": glucose,
+        "carbs": carbs,
+        "recommended_dose": result["recommended_dose"].tolist(),
+        "correction_dose": result["correction_dose"].round(2).tolist(),
+    })
+
 # ==================================================================
 # === HEALTH CHECK ENDPOINT ========================================
 # ==================================================================
@@ -325,12 +511,9 @@ def health_check():
     """Basic health check for DB connectivity and CORS origins."""
     status = {"db": "ok", "cors_allowed_origins": allowed_origins}
     try:
-        conn = db.get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT 1;")
-        cur.fetchone()
-        cur.close()
-        conn.close()
+        with db.db_cursor() as cur:
+            cur.execute("SELECT 1;")
+            cur.fetchone()
     except Exception as e:
         status["db"] = f"error: {e.__class__.__name__}: {e}"
         return jsonify(status), 500
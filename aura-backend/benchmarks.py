@@ -0,0 +1,726 @@
+# file: benchmarks.py
+#
+# Micro-benchmarks for the serving hot paths. Run from aura-backend/:
+#
+#   python benchmarks.py forecast [--runs N]
+#   python benchmarks.py lstm-parity [--runs N]   (exits 1 on mismatch)
+#   python benchmarks.py hybrid-equivalence [--runs N]   (exits 1 on mismatch)
+#   python benchmarks.py dqn-parity [--runs N]    (needs stable_baselines3; exits 1 on mismatch)
+#   python benchmarks.py nlp-equivalence [--runs N]   (exits 1 on mismatch)
+#   python benchmarks.py nlp-throughput [--runs N]
+#   python benchmarks.py logging [--runs N]
+#   python benchmarks.py startup [--runs N]   (exits 1 if booting wsgi:app imports heavy ML libraries)
+#   python benchmarks.py windows [--runs N]   (exits 1 on mismatch)
+#   python benchmarks.py registry [--runs N]  (exits 1 if a reader sees a mixed or missing bundle)
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import numpy as np
+
+SAMPLE_HISTORY = [120, 122, 125, 126, 128, 129, 130, 131, 130, 128, 126, 124]
+
+
+def _time_per_call(fn, runs: int) -> float:
+    """Mean milliseconds per call, after one warm-up call."""
+    fn()
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start) * 1000 / runs
+
+
+def _legacy_forecast(model, scaler, history):
+    """The original loop: one Keras model.predict() per step plus np.append churn."""
+    from prediction_service import LOOK_BACK
+    scaled_input = scaler.transform(np.array(history[-LOOK_BACK:]).reshape(-1, 1))
+    current_sequence = scaled_input.reshape((1, LOOK_BACK, 1))
+    predictions = []
+    for _ in range(12):
+        pred_scaled = model.predict(current_sequence, verbose=0)
+        predictions.append(scaler.inverse_transform(pred_scaled)[0][0])
+        current_sequence = np.append(current_sequence[0][1:], pred_scaled).reshape((1, LOOK_BACK, 1))
+    return np.array(predictions, dtype=np.float32)
+
+
+def bench_forecast(runs: int):
+    """Original per-step Keras loop vs the current forecast path (PREDICTION_BACKEND)."""
+    from keras.models import load_model
+    import prediction_service as ps
+    entry = ps.get_model_entry_for_user(0)
+    keras_model = load_model(ps.DEFAULT_MODEL_PATH)
+
+    legacy = _legacy_forecast(keras_model, entry.scaler, SAMPLE_HISTORY)
+    fast = ps.forecast_glucose_values(entry, SAMPLE_HISTORY)
+    print(f"max |legacy - current| = {np.max(np.abs(legacy - fast)):.6f} mg/dL")
+
+    legacy_ms = _time_per_call(lambda: _legacy_forecast(keras_model, entry.scaler, SAMPLE_HISTORY), runs)
+    fast_ms = _time_per_call(lambda: ps.forecast_glucose_values(entry, SAMPLE_HISTORY), runs)
+    print(f"legacy per-step predict(): {legacy_ms:8.2f} ms/forecast")
+    print(f"current ({ps.PREDICTION_BACKEND:>5}):           {fast_ms:8.2f} ms/forecast  ({legacy_ms / fast_ms:.1f}x)")
+
+
+LSTM_PARITY_TOLERANCE = 0.01  # mg/dL
+
+
+def lstm_parity(windows: int = 256, seed: int = 0) -> tuple:
+    """(max |keras - numpy| in mg/dL, keras entry, numpy entry, scaled windows) for the default model."""
+    from keras.models import load_model
+    import joblib
+    import prediction_service as ps
+    from model_cache import ModelEntry
+    from numpy_lstm import NumpyLSTMForecaster
+
+    scaler = joblib.load(ps.DEFAULT_SCALER_PATH)
+    keras_entry = ModelEntry(ps.DEFAULT_MODEL_PATH, ps.DEFAULT_SCALER_PATH, load_model(ps.DEFAULT_MODEL_PATH), scaler, None, 0)
+    numpy_entry = ModelEntry(ps.DEFAULT_MODEL_PATH, ps.DEFAULT_SCALER_PATH, NumpyLSTMForecaster.from_file(ps.DEFAULT_MODEL_PATH), scaler, None, 0)
+
+    rng = np.random.default_rng(seed)
+    scaled = rng.uniform(0.0, 1.0, size=(windows, ps.LOOK_BACK)).astype(np.float32)
+    keras_out = scaler.inverse_transform(ps.rollout_scaled(keras_entry, scaled).reshape(-1, 1))
+    numpy_out = scaler.inverse_transform(ps.rollout_scaled(numpy_entry, scaled).reshape(-1, 1))
+    return float(np.max(np.abs(keras_out - numpy_out))), keras_entry, numpy_entry, scaled
+
+
+def bench_lstm_parity(runs: int, tolerance: float = LSTM_PARITY_TOLERANCE):
+    """NumPy engine vs Keras on random windows: max difference (mg/dL) and speed."""
+    import prediction_service as ps
+
+    max_diff, keras_entry, numpy_entry, windows = lstm_parity()
+    print(f"max |keras - numpy| over {len(windows)} random windows = {max_diff:.6f} mg/dL")
+
+    single = windows[:1]
+    keras_ms = _time_per_call(lambda: ps.rollout_scaled(keras_entry, single), runs)
+    numpy_ms = _time_per_call(lambda: ps.rollout_scaled(numpy_entry, single), runs)
+    print(f"keras compiled rollout: {keras_ms:8.3f} ms/forecast")
+    print(f"numpy rollout:          {numpy_ms:8.3f} ms/forecast")
+    if max_diff > tolerance:
+        print(f"FAIL: difference exceeds {tolerance} mg/dL")
+        sys.exit(1)
+
+
+def _reference_hybrid_adjustments(predictions, last_known, future_events, variability):
+    """The original per-step loops from generate_hybrid_prediction, kept as the oracle."""
+    from prediction_service import apply_physiological_constraints
+    adjusted_predictions = list(predictions)
+    if future_events and future_events.get("carbs", 0) > 0:
+        carb_impact_per_step = (future_events["carbs"] / 10) * 3.5 / 12
+        for i in range(len(adjusted_predictions)):
+            if i >= 3:
+                adjusted_predictions[i] += carb_impact_per_step * (i - 2)
+    if future_events and future_events.get("activity_type"):
+        activity_impact_per_step = 25 / 12
+        for i in range(len(adjusted_predictions)):
+            if i >= 2:
+                adjusted_predictions[i] -= activity_impact_per_step
+    final_predictions = apply_physiological_constraints(adjusted_predictions, last_known)
+    upper = [int(round(p + variability * (1 + i * 0.1))) for i, p in enumerate(final_predictions)]
+    lower = [int(round(p - variability * (1 + i * 0.1))) for i, p in enumerate(final_predictions)]
+    return [int(round(p)) for p in final_predictions], upper, lower
+
+
+def random_hybrid_cases(cases: int, seed: int = 0) -> tuple:
+    """(predictions, last_known, carbs, has_activity, variability) mixing smooth, jumpy and out-of-range forecasts."""
+    from prediction_service import FORECAST_HORIZON
+
+    rng = np.random.default_rng(seed)
+    last_known = rng.integers(20, 450, size=cases).astype(np.float64)
+    steps = rng.normal(0, rng.choice([1.0, 5.0, 40.0], size=(cases, 1)), size=(cases, FORECAST_HORIZON))
+    predictions = last_known[:, None] + np.cumsum(steps, axis=1)
+    carbs = np.where(rng.random(cases) < 0.3, 0, rng.integers(-20, 150, size=cases)).astype(np.float64)
+    has_activity = rng.random(cases) < 0.5
+    variability = rng.uniform(0, 40, size=cases)
+    return predictions, last_known, carbs, has_activity, variability
+
+
+def hybrid_mismatches(predictions, last_known, carbs, has_activity, variability) -> list:
+    """Row indices where the vectorized adjustments/constraints/bounds differ from the scalar loops."""
+    import prediction_service as ps
+
+    adjusted = ps.apply_future_event_adjustments_batch(predictions, carbs, has_activity)
+    final = ps.apply_physiological_constraints_batch(adjusted, last_known)
+    upper, lower = ps.prediction_bounds_batch(final, variability)
+    vector_ints = np.rint(final).astype(int)
+
+    mismatches = []
+    for n in range(len(predictions)):
+        events = {"carbs": carbs[n], "activity_type": "walk" if has_activity[n] else None}
+        ref = _reference_hybrid_adjustments(predictions[n].tolist(), last_known[n], events, variability[n])
+        if ref != (vector_ints[n].tolist(), upper[n].tolist(), lower[n].tolist()):
+            mismatches.append(n)
+    return mismatches
+
+
+def bench_hybrid_equivalence(runs: int, cases: int = 5000):
+    """Randomized check: vectorized adjustments/constraints/bounds vs the scalar loops."""
+    import prediction_service as ps
+
+    predictions, last_known, carbs, has_activity, variability = random_hybrid_cases(cases, seed=runs)
+    mismatches = len(hybrid_mismatches(predictions, last_known, carbs, has_activity, variability))
+    print(f"{cases} random cases, {mismatches} mismatches")
+
+    def scalar_all():
+        for n in range(256):
+            _reference_hybrid_adjustments(predictions[n].tolist(), last_known[n], {"carbs": carbs[n]}, variability[n])
+
+    def vector_all():
+        adj = ps.apply_future_event_adjustments_batch(predictions[:256], carbs[:256], has_activity[:256])
+        ps.prediction_bounds_batch(ps.apply_physiological_constraints_batch(adj, last_known[:256]), variability[:256])
+
+    scalar_ms = _time_per_call(scalar_all, runs)
+    vector_ms = _time_per_call(vector_all, runs)
+    print(f"scalar loops, 256 users: {scalar_ms:8.3f} ms")
+    print(f"vectorized,  256 users: {vector_ms:8.3f} ms  ({scalar_ms / vector_ms:.1f}x)")
+    if mismatches:
+        print("FAIL: vectorized adjustments differ from the scalar reference")
+        sys.exit(1)
+
+
+def _observation_grid() -> np.ndarray:
+    """Observations spanning the ranges get_insulin_recommendation produces."""
+    glucose = np.arange(40, 401, 10)
+    trend = np.array([0.0])
+    hours = np.arange(0, 24, 2)
+    active_insulin = np.array([0.0, 1.0, 2.0, 4.0])
+    since_meal = np.array([0.0, 1.0, 2.0, 4.0, 8.0])
+    grid = np.meshgrid(glucose, trend, hours, active_insulin, since_meal, indexing="ij")
+    return np.stack(grid, axis=-1).reshape(-1, 5).astype(np.float32)
+
+
+DQN_PARITY_TOLERANCE = 1e-3  # max |dQ|
+
+
+def dqn_parity() -> tuple:
+    """(action mismatches, max |dQ|, sb3 model, numpy policy, observations) for the shipped agent."""
+    import torch
+    from stable_baselines3 import DQN
+    from numpy_dqn import NumpyDQNPolicy
+    from recommendation_service import MODEL_PATH
+
+    sb3_model = DQN.load(f"{MODEL_PATH}.zip", device="cpu")
+    numpy_policy = NumpyDQNPolicy.from_file(f"{MODEL_PATH}.zip")
+    obs = _observation_grid()
+
+    sb3_actions, _ = sb3_model.predict(obs, deterministic=True)
+    numpy_actions = numpy_policy.predict_many(obs)
+    with torch.no_grad():
+        sb3_q = sb3_model.q_net(torch.as_tensor(obs)).numpy()
+    max_diff = float(np.max(np.abs(sb3_q - numpy_policy.q_values(obs))))
+    mismatches = int(np.sum(sb3_actions != numpy_actions))
+    return mismatches, max_diff, sb3_model, numpy_policy, obs
+
+
+def bench_dqn_parity(runs: int, tolerance: float = DQN_PARITY_TOLERANCE):
+    """NumPy Q-network vs stable_baselines3 DQN.predict over an observation grid."""
+    mismatches, max_diff, sb3_model, numpy_policy, obs = dqn_parity()
+    print(f"{len(obs)} observations: {mismatches} action mismatches, max |dQ| = {max_diff:.6f}")
+
+    single = obs[0]
+    sb3_ms = _time_per_call(lambda: sb3_model.predict(single, deterministic=True), runs)
+    numpy_ms = _time_per_call(lambda: numpy_policy.predict(single, deterministic=True), runs)
+    batch_ms = _time_per_call(lambda: numpy_policy.predict_many(obs), runs)
+    print(f"sb3 predict():          {sb3_ms:8.3f} ms/obs")
+    print(f"numpy predict():        {numpy_ms:8.3f} ms/obs  ({sb3_ms / numpy_ms:.1f}x)")
+    print(f"numpy predict_many():   {batch_ms:8.3f} ms for {len(obs)} obs")
+    if mismatches or max_diff > tolerance:
+        print("FAIL: NumPy policy differs from stable_baselines3")
+        sys.exit(1)
+
+
+# Sentences from the NLP processor's own test list
+NLP_TEST_SENTENCES = [
+    "I had two slices of pizza for lunch",
+    "Thinking about a sandwich and an apple",
+    "Just drank a coke and ate 3 cookies",
+    "I ate 65g of carbs for dinner",
+    "Had about 45 grams carbs with breakfast",
+    "Large coffee with milk, whole grain toast with jam, and orange juice",
+    "Grilled chicken salad with no dressing",
+    "Had pasta with meat sauce and a glass of wine",
+    "Going for a 45 minute walk after dinner",
+    "Just finished a 2 hour gym session",
+    "Quick 15 minute jog this morning",
+    "Had breakfast (oatmeal and banana) then went for a 30 min bike ride",
+    "Planning pizza for lunch then basketball practice for 1 hour",
+    "Nothing but water today",
+    "Steak and vegetables, no carbs",
+    "Diet coke and sugar-free gum",
+]
+
+
+def _legacy_nlp_processor():
+    """The processor with the original per-call regexes and per-key scans, kept as the oracle."""
+    import re
+    from natural_language_processor import EnhancedNLPProcessor
+
+    class LegacyNLPProcessor(EnhancedNLPProcessor):
+        def _extract_foods_with_quantities(self, text):
+            foods_found = []
+            total_carbs = 0
+            text_copy = " " + text + " "
+            for pattern in self._sorted_food_keys:
+                pattern_regex = r'\b' + re.escape(pattern) + r'\b'
+                for match in re.finditer(pattern_regex, text_copy):
+                    start_pos = match.start()
+                    if text_copy[start_pos] == '#':
+                        continue
+                    main_food_key = self.food_variations[pattern]
+                    food_data = self.food_db[main_food_key]
+                    quantity = self._find_quantity_near_food(text_copy, start_pos)
+                    carbs = food_data["carbs_per_serving"] * quantity
+                    foods_found.append({
+                        "food": main_food_key, "quantity": quantity, "carbs": carbs,
+                        "serving_size": food_data["serving_size"], "matched_pattern": pattern
+                    })
+                    total_carbs += carbs
+                    text_copy = text_copy[:start_pos] + "#" * len(pattern) + text_copy[match.end():]
+            return {"foods": foods_found, "total_carbs": total_carbs}, text_copy
+
+        def _extract_activities(self, text):
+            activities = []
+            for activity_key, activity_data in self.activity_db.items():
+                for pattern in [activity_key] + activity_data.get("variations", []):
+                    if pattern in text:
+                        duration = self._extract_duration_near_activity(text, pattern)
+                        activities.append({
+                            "activity": activity_key,
+                            "intensity": activity_data["intensity"],
+                            "duration_minutes": duration,
+                            "calories_estimate": duration * activity_data["calories_per_min"],
+                            "matched_pattern": pattern
+                        })
+                        break
+            return activities
+
+        def _find_quantity_near_food(self, text, food_pos):
+            window_text = text[max(0, food_pos - 20):food_pos]
+            number_match = re.search(r'(\d+(?:\.\d+)?)\s*$', window_text)
+            if number_match:
+                return float(number_match.group(1))
+            for word, value in self.quantity_words.items():
+                if re.search(r'\b' + word + r'\b\s*$', window_text):
+                    return value
+            return 1.0
+
+        def _extract_explicit_carbs(self, text):
+            for pattern in [r'(\d+)\s*(?:g|grams?)\s*(?:of\s*)?carbs?', r'(\d+)\s*carbs?\s*(?:g|grams?)',
+                            r'(\d+)\s*(?:g|grams?)\s*carbohydrates?']:
+                match = re.search(pattern, text)
+                if match:
+                    return int(match.group(1))
+            return 0
+
+        def _extract_duration_near_activity(self, text, activity_pattern, activity_pos=None):
+            activity_pos = text.find(activity_pattern)
+            if activity_pos == -1:
+                return 30
+            window_text = text[max(0, activity_pos - 20):min(len(text), activity_pos + len(activity_pattern) + 20)]
+            for pattern in [r'(\d+)\s*(?:minutes?|mins?)', r'(\d+)\s*(?:hours?|hrs?)', r'(\d+)\s*h', r'(\d+)\s*m']:
+                match = re.search(pattern, window_text)
+                if match:
+                    value = int(match.group(1))
+                    return value * 60 if ('hour' in pattern or 'hr' in pattern or 'h' in pattern) else value
+            intensity = self.activity_db.get(self.activity_variations.get(activity_pattern, ""), {}).get("intensity", "moderate")
+            return 45 if intensity == "light" else 30 if intensity == "moderate" else 25
+
+        def _extract_timing(self, text):
+            for keyword, data in self.time_keywords.items():
+                if keyword in text:
+                    return {"timing": data["time"], "meal_type": data["meal_type"]}
+            return {"timing": None, "meal_type": None}
+
+    return LegacyNLPProcessor(cache_size=0)
+
+
+def _random_sentences(processor, count: int, seed: int = 0) -> list:
+    """Sentences mixing quantities, foods, activities and filler, to stress overlaps."""
+    rng = np.random.default_rng(seed)
+    vocabulary = (
+        list(processor.food_variations) + list(processor.activity_variations)
+        + list(processor.quantity_words) + [str(n) for n in range(1, 5)]
+        + list(processor.time_keywords) + ["know", "snowed", "breakfastonight", "lunches"]
+        + ["and", "of", "with", "then", "for", "minute", "hour", "30 min", "2 hours", "1 hr", "45m", "3h",
+           "g carbs", "40 g of carbs", "20 carbs g", "15 grams carbohydrates", "slice", "pizzas", "ran", "2.5"]
+    )
+    return [
+        " ".join(rng.choice(vocabulary, size=rng.integers(1, 14)))
+        for _ in range(count)
+    ]
+
+
+def nlp_mismatches(cases: int = 0, seed: int = 0) -> tuple:
+    """(sentences, those parsed differently than by the original implementation, current processor, legacy processor)."""
+    from natural_language_processor import EnhancedNLPProcessor
+
+    processor = EnhancedNLPProcessor(cache_size=0)
+    legacy = _legacy_nlp_processor()
+    sentences = NLP_TEST_SENTENCES + _random_sentences(processor, cases, seed=seed)
+    mismatches = [text for text in sentences if processor.parse_user_text(text) != legacy.parse_user_text(text)]
+    return sentences, mismatches, processor, legacy
+
+
+def bench_nlp_equivalence(runs: int, cases: int = 3000):
+    """Current extraction vs the original scans and per-call regexes: identical parses, and speed."""
+    sentences, mismatches, processor, legacy = nlp_mismatches(cases, seed=runs)
+    print(f"{len(sentences)} sentences ({len(NLP_TEST_SENTENCES)} from the test list), {len(mismatches)} mismatches")
+    for text in mismatches[:5]:
+        print(f"  differs: {text!r}")
+
+    def parse_all(p):
+        return lambda: [p.parse_user_text(text) for text in NLP_TEST_SENTENCES]
+
+    legacy_ms = _time_per_call(parse_all(legacy), runs)
+    current_ms = _time_per_call(parse_all(processor), runs)
+    per = len(NLP_TEST_SENTENCES)
+    print(f"original (before): {legacy_ms / per:8.3f} ms/sentence")
+    print(f"current (after):   {current_ms / per:8.3f} ms/sentence  ({legacy_ms / current_ms:.1f}x)")
+    if mismatches:
+        print("FAIL: current extraction differs from the original implementation")
+        sys.exit(1)
+
+
+def bench_nlp_throughput(runs: int, messages: int = 20000, phrases: int = 800):
+    """Parses/s over a synthetic chat corpus with repeated phrases: no cache, LRU, parse_many."""
+    from natural_language_processor import EnhancedNLPProcessor
+
+    uncached = EnhancedNLPProcessor(cache_size=0)
+    rng = np.random.default_rng(runs)
+    # Zipf-like reuse: a few phrases ("had lunch", "2 slices of pizza") dominate
+    pool = NLP_TEST_SENTENCES + _random_sentences(uncached, phrases - len(NLP_TEST_SENTENCES), seed=runs)
+    weights = 1.0 / np.arange(1, len(pool) + 1)
+    corpus = [pool[i] for i in rng.choice(len(pool), size=messages, p=weights / weights.sum())]
+
+    def throughput(fn):
+        start = time.perf_counter()
+        fn()
+        return messages / (time.perf_counter() - start)
+
+    cached = EnhancedNLPProcessor(cache_size=4096)
+    base = throughput(lambda: [uncached.parse_user_text(text) for text in corpus])
+    lru = throughput(lambda: [cached.parse_user_text(text) for text in corpus])
+    batch = throughput(lambda: EnhancedNLPProcessor(cache_size=0).parse_many(corpus))
+    stats = cached.cache_stats()
+    print(f"{messages} messages, {len(set(corpus))} distinct phrases")
+    print(f"no cache:       {base:10.0f} parses/s")
+    print(f"LRU (cold):     {lru:10.0f} parses/s  ({lru / base:.1f}x, hit rate {stats['hit_rate']:.1%})")
+    print(f"parse_many:     {batch:10.0f} parses/s  ({batch / base:.1f}x)")
+
+
+def _sample_ai_response() -> dict:
+    from prediction_service import generate_hybrid_prediction
+    prediction = generate_hybrid_prediction(1, SAMPLE_HISTORY, {"carbs": 45, "activity_type": "walk"})
+    return {
+        "parsed_info": {"carbs": 45, "foods_detected": [{"food": "pizza", "quantity": 2, "carbs": 60}], "activities_detected": [], "warnings": []},
+        "dose_recommendation": {"recommended_dose": 4.5, "meal_bolus": 4.0, "correction_dose": 0.5},
+        "glucose_prediction": prediction,
+        "contextual_advice": {"suggestions": ["Consider pre-bolusing 15 minutes before eating."]},
+        "metadata": {"pipeline": "concurrent", "timings_ms": {"nlp": 0.1, "dose": 1.0, "prediction": 2.0, "total": 3.5}, "degraded_stages": []},
+    }
+
+
+def _legacy_chat_logging(user_id, message, history, ai_response):
+    """The print() calls the /api/chat path made before structured logging."""
+    print("\n" + "=" * 50)
+    print("--- Received request at /api/chat ---")
+    print(f"--- [INPUT] User ID: {user_id}, Message: '{message}'")
+    print(f"--- [DATA] Found {len(history)} recent glucose readings. ---")
+    print("--- [AI] Calling 'process_user_intent'... ---")
+    print(f"--- [AI Core] Processing intent for user {user_id}: '{message}' ---")
+    print("--- [AI Core] Intent processed successfully. ---")
+    print("--- [AI] Raw response from AI Core:")
+    print(json.dumps(ai_response, indent=2))
+    print("--- [DATABASE] Checking AI response for meals to save... ---")
+    print("--- [DATABASE] Found 1 food item(s). Proceeding to save. ---")
+    print(f"--- [DATABASE] Saving: User='{user_id}', Desc='2x pizza', Carbs='60'")
+    print(f"--- [Database] Saved 'meal' log for user {user_id}. ---")
+    print("--- [DATABASE] All detected meals have been saved. ---")
+    print("--- AI Core processed intent successfully. Returning response to frontend. ---")
+    print("=" * 50 + "\n")
+
+
+def _structured_chat_logging(logger, user_id, message, history, ai_response):
+    """The logging calls the /api/chat path makes now (default INFO level, payloads off)."""
+    logger.info("Chat request for user %s (%d chars)", user_id, len(message))
+    logger.debug("Processing intent for user %s", user_id)
+    logger.info("Intent for user %s processed in %.1f ms", user_id, 3.5, extra={"timings_ms": ai_response["metadata"]["timings_ms"]})
+    logger.debug("Saved '%s' log for user %s", "meal", user_id)
+    logger.info("Saved %d detected meal(s) for user %s", 1, user_id)
+
+
+def bench_logging(runs: int, threads: int = 8):
+    """Per-request logging latency with concurrent request threads: print() vs the queued logger."""
+    import logging_config
+
+    ai_response = _sample_ai_response()
+    message = "I had two slices of pizza for lunch"
+    requests_per_thread = max(1, runs) * 10
+
+    def run(fn) -> np.ndarray:
+        latencies = [[] for _ in range(threads)]
+
+        def worker(n):
+            for i in range(requests_per_thread):
+                started = time.perf_counter()
+                fn(n * requests_per_thread + i)
+                latencies[n].append((time.perf_counter() - started) * 1000)
+
+        pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        return np.concatenate([np.array(l) for l in latencies])
+
+    # Send both variants to /dev/null so the terminal is not what gets measured.
+    real_stdout = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    sys.stdout.flush()
+    os.dup2(devnull, 1)
+    try:
+        logging_config.configure_logging()
+        logger = logging_config.get_logger("benchmark")
+        legacy = run(lambda i: _legacy_chat_logging(i, message, SAMPLE_HISTORY, ai_response))
+        sys.stdout.flush()
+        structured = run(lambda i: _structured_chat_logging(logger, i, message, SAMPLE_HISTORY, ai_response))
+        drain_started = time.perf_counter()
+        while logging_config.get_logging_stats()["queue_depth"] and time.perf_counter() - drain_started < 30:
+            time.sleep(0.01)
+        sys.stdout.flush()
+    finally:
+        os.dup2(real_stdout, 1)
+        os.close(real_stdout)
+        os.close(devnull)
+
+    print(f"{threads} threads x {requests_per_thread} simulated /api/chat requests (logging cost only)")
+    for label, values in (("print() + raw dump", legacy), ("queued logger", structured)):
+        p50, p99 = np.percentile(values, [50, 99])
+        print(f"{label:20s} p50 {p50:7.3f} ms   p99 {p99:7.3f} ms   mean {values.mean():7.3f} ms")
+    print(f"p99 speedup: {np.percentile(legacy, 99) / np.percentile(structured, 99):.1f}x, "
+          f"dropped records: {logging_config.get_logging_stats()['dropped']}")
+
+
+# Packages that must only load on first use (or in training/report workers),
+# never while a gunicorn worker boots wsgi:app.
+STARTUP_FORBIDDEN_IMPORTS = ("tensorflow", "keras", "torch", "stable_baselines3", "matplotlib", "fpdf", "pandas", "sklearn", "scipy")
+STARTUP_IMPORT_BUDGET_MS = 1500
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def _import_wsgi_profile() -> list:
+    """[(cumulative_us, depth, module)] from `python -X importtime -c "import wsgi"` in a fresh interpreter."""
+    env = dict(os.environ)
+    # config.py only checks that these are set; importing the app opens no connections.
+    env.setdefault("DATABASE_URL", "postgresql://startup-check/none")
+    env.setdefault("JWT_SECRET_KEY", "startup-check")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import wsgi"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing wsgi raised:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            rows.append((int(match.group(2)), len(match.group(3)), match.group(4)))
+    return rows
+
+
+def startup_imports(runs: int = 1) -> tuple:
+    """(forbidden packages loaded, best total ms, importtime rows of the best run) for booting wsgi:app."""
+    profiles = [_import_wsgi_profile() for _ in range(max(1, min(runs, 5)))]
+    totals = [sum(us for us, depth, _ in rows if depth == 1) / 1000 for rows in profiles]
+    rows = profiles[int(np.argmin(totals))]
+    loaded = sorted({name.split(".")[0] for _, _, name in rows} & set(STARTUP_FORBIDDEN_IMPORTS))
+    return loaded, min(totals), rows
+
+
+def bench_startup(runs: int):
+    """Import-time budget for wsgi:app: no heavy ML/plotting packages, total under STARTUP_IMPORT_BUDGET_MS."""
+    try:
+        loaded, best_ms, rows = startup_imports(runs)
+    except RuntimeError as e:
+        print(e)
+        print("FAIL: importing wsgi raised")
+        sys.exit(1)
+
+    print(f"import wsgi: best {best_ms:.0f} ms over {max(1, min(runs, 5))} cold interpreter(s)")
+    for us, _, name in sorted((r for r in rows if r[2] in ("app", "flask", "intelligent_core", "prediction_service",
+                                                          "recommendation_service", "database", "flask_limiter")),
+                              reverse=True):
+        print(f"  {name:24s} {us / 1000:8.1f} ms (cumulative)")
+
+    failed = False
+    if loaded:
+        print(f"FAIL: booting wsgi:app imports {', '.join(loaded)}")
+        failed = True
+    if best_ms > STARTUP_IMPORT_BUDGET_MS:
+        print(f"FAIL: import time exceeds the {STARTUP_IMPORT_BUDGET_MS} ms budget")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("OK: no heavy imports at boot")
+
+
+def _legacy_create_sequences(dataset, look_back=12):
+    """The original model_trainer loop (one slice per sample, then copied), kept as the oracle."""
+    dataX, dataY = [], []
+    for i in range(len(dataset) - look_back - 1):
+        dataX.append(dataset[i:(i + look_back), 0])
+        dataY.append(dataset[i + look_back, 0])
+    return np.array(dataX), np.array(dataY)
+
+
+def _peak_mib(fn) -> tuple:
+    import tracemalloc
+    tracemalloc.start()
+    started = time.perf_counter()
+    fn()
+    elapsed = (time.perf_counter() - started) * 1000
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def bench_windows(runs: int, points: int = 105_120):
+    """A year of 5-minute readings: legacy loop vs strided window views (+ streamed batches)."""
+    from sequence_windows import sliding_windows, WindowBatches, events_per_step, stack_channels
+
+    rng = np.random.default_rng(0)
+    dataset = (rng.random(points, dtype=np.float32)).reshape(-1, 1)
+    legacy_x, legacy_y = _legacy_create_sequences(dataset)
+    inputs, targets = sliding_windows(dataset, 12)
+    # The old loop also dropped the last usable window.
+    mismatch = not (np.array_equal(legacy_x, inputs[:-1, :, 0]) and np.array_equal(legacy_y, targets[:-1, 0]))
+
+    legacy_ms, legacy_mib = _peak_mib(lambda: _legacy_create_sequences(dataset))
+    views_ms, views_mib = _peak_mib(lambda: sliding_windows(dataset, 12))
+    stream_ms, stream_mib = _peak_mib(lambda: sum(len(y) for _, y in WindowBatches(inputs, targets, 32, shuffle=True)))
+
+    # Multi-channel, multi-step: glucose + carbs + insulin predicting 12 steps
+    times = np.arange(points) * 300.0
+    carbs = events_per_step(times, rng.uniform(0, times[-1], 1000), rng.uniform(10, 80, 1000))
+    insulin = events_per_step(times, rng.uniform(0, times[-1], 1000), rng.uniform(1, 8, 1000))
+    multi_inputs, multi_targets = sliding_windows(stack_channels(dataset[:, 0], carbs, insulin), 12, horizon=12)
+    mismatch |= not np.array_equal(multi_targets[5], dataset[17:29, 0]) or not np.array_equal(multi_inputs[5, :, 1], carbs[5:17])
+
+    print(f"{points} readings -> {len(inputs)} windows of 12")
+    print(f"legacy loop:        {legacy_ms:8.1f} ms, peak {legacy_mib:7.1f} MiB")
+    print(f"window views:       {views_ms:8.3f} ms, peak {views_mib:7.3f} MiB  (shares memory: {np.shares_memory(inputs, dataset)})")
+    print(f"all shuffled batches of 32: {stream_ms:8.1f} ms, peak {stream_mib:7.3f} MiB")
+    print(f"multi-channel views: inputs {multi_inputs.shape}, targets {multi_targets.shape}")
+    if mismatch:
+        print("FAIL: windows differ from the legacy builder")
+        sys.exit(1)
+
+
+def bench_registry(runs: int, readers: int = 4):
+    """Model resolution per request (legacy stats vs registry pointers) and publish/rollback under concurrent readers."""
+    import shutil
+    import tempfile
+    from model_cache import ModelCache, file_version
+    from model_registry import ModelRegistry, _bundle_hash
+    from prediction_service import _load_model_and_scaler, DEFAULT_MODEL_PATH, DEFAULT_SCALER_PATH
+
+    root = tempfile.mkdtemp(prefix="aura-registry-")
+    try:
+        registry = ModelRegistry(root, refresh_seconds=0.05, keep_versions=3, retire_seconds=0.5)
+        other_worker = ModelRegistry(root, refresh_seconds=0.05)
+        copy = lambda src: (lambda dst: shutil.copyfile(src, dst))
+        first = registry.publish(1, copy(DEFAULT_MODEL_PATH), copy(DEFAULT_SCALER_PATH), {"watermark": "a"})
+
+        def legacy_resolve():
+            model_path, scaler_path = "glucose_predictor_user_1.h5", "scaler_user_1.gz"
+            if os.path.exists(model_path) and os.path.exists(scaler_path):
+                return file_version(model_path, scaler_path)
+            return file_version(DEFAULT_MODEL_PATH, DEFAULT_SCALER_PATH)
+
+        calls = runs * 1000
+        legacy_us = _time_per_call(legacy_resolve, calls) * 1000
+        registry_us = _time_per_call(lambda: registry.current(1), calls) * 1000
+
+        cache = ModelCache(_load_model_and_scaler, 8, 256 * 2**20)
+        errors, stop = [], threading.Event()
+
+        def reader():
+            while not stop.is_set():
+                bundle = other_worker.current(1)
+                if bundle is None:
+                    continue
+                model_path, scaler_path, version = bundle
+                try:
+                    cache.get(model_path, scaler_path, version=version)
+                    if _bundle_hash(os.path.dirname(model_path)) != version:
+                        errors.append(f"{version}: bundle content does not match its version")
+                except Exception as e:
+                    errors.append(repr(e))
+
+        threads = [threading.Thread(target=reader) for _ in range(readers)]
+        for t in threads:
+            t.start()
+        rng = np.random.default_rng(0)
+        scaler = __import__("joblib").load(DEFAULT_SCALER_PATH)
+        publish_ms = []
+        for i in range(max(3, runs // 5)):
+            scaler.data_max_ = scaler.data_max_ + rng.random()  # A different bundle each time
+            started = time.perf_counter()
+            registry.publish(1, copy(DEFAULT_MODEL_PATH), lambda p: __import__("joblib").dump(scaler, p), {"watermark": str(i)})
+            publish_ms.append((time.perf_counter() - started) * 1000)
+        latest = registry.current(1)[2]
+        started = time.perf_counter()
+        rolled_back = registry.rollback(1)
+        rollback_ms = (time.perf_counter() - started) * 1000
+        time.sleep(0.2)
+        stop.set()
+        for t in threads:
+            t.join()
+
+        versions = [v["version"] for v in registry.manifest(1)["versions"]]
+        if registry.current(1)[2] != rolled_back or rolled_back == latest or rolled_back != versions[-1]:
+            errors.append("rollback did not move the pointer to the previous version")
+        if other_worker.current(1)[2] != rolled_back:
+            errors.append("another worker did not pick up the rollback")
+        if first not in os.listdir(os.path.join(root, "users", "1")):
+            errors.append("retired bundle was pruned while workers may still load it")
+        time.sleep(registry.retire_seconds)
+        scaler.data_max_ = scaler.data_max_ + 1.0
+        registry.publish(1, copy(DEFAULT_MODEL_PATH), lambda p: __import__("joblib").dump(scaler, p), {"watermark": "b"})
+        if first in os.listdir(os.path.join(root, "users", "1")):
+            errors.append("old bundle beyond keep_versions was not pruned")
+        if cache.snapshot()["load_errors"]:
+            errors.append(f"{cache.snapshot()['load_errors']} model load errors")
+
+        print(f"resolve per request: legacy stats {legacy_us:6.2f} us, registry pointer {registry_us:6.2f} us")
+        print(f"publish: median {np.median(publish_ms):6.1f} ms; rollback {rollback_ms:6.2f} ms; {readers} readers, cache {cache.snapshot()}")
+        if errors:
+            print(f"FAIL: {errors[:5]}")
+            sys.exit(1)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+BENCHMARKS = {
+    "forecast": bench_forecast,
+    "lstm-parity": bench_lstm_parity,
+    "hybrid-equivalence": bench_hybrid_equivalence,
+    "dqn-parity": bench_dqn_parity,
+    "nlp-equivalence": bench_nlp_equivalence,
+    "nlp-throughput": bench_nlp_throughput,
+    "logging": bench_logging,
+    "startup": bench_startup,
+    "windows": bench_windows,
+    "registry": bench_registry,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Aura backend micro-benchmarks")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args.runs)
@@ -14,4 +14,40 @@ DATABASE_URL = _require_env("DATABASE_URL")
 JWT_SECRET_KEY = _require_env("JWT_SECRET_KEY")
 
 # Optional: CORS origins (comma-separated)
-CORS_ORIGINS = os.getenv("CORS_ORIGINS", "")
\ No newline at end of file
+CORS_ORIGINS = os.getenv("CORS_ORIGINS", "")
+
+# PostgreSQL connection pool (one pool per worker process)
+DB_POOL_MIN_CONN = int(os.getenv("DB_POOL_MIN_CONN", "1"))
+DB_POOL_MAX_CONN = int(os.getenv("DB_POOL_MAX_CONN", "10"))
+# Seconds to wait for a free pooled connection before giving up
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Connections idle for longer than this (seconds) are pinged before reuse
+DB_POOL_HEALTHCHECK_AFTER = float(os.getenv("DB_POOL_HEALTHCHECK_AFTER", "30"))
+
+# Optional: monthly range partitioning of glucose_readings (applied by migrations.py)
+GLUCOSE_PARTITIONING = str(os.getenv("GLUCOSE_PARTITIONING", "false")).lower() in ("1", "true", "yes", "on")
+# How many future monthly partitions to keep created ahead of time
+GLUCOSE_PARTITION_MONTHS_AHEAD = int(os.getenv("GLUCOSE_PARTITION_MONTHS_AHEAD", "3"))
+
+# Dashboard cache: TTL in seconds (0 disables), per-worker LRU size, and an
+# optional shared backend (e.g. redis://host:6379/1) for multi-worker setups
+DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", "60"))
+DASHBOARD_CACHE_MAX_ENTRIES = int(os.getenv("DASHBOARD_CACHE_MAX_ENTRIES", "1024"))
+DASHBOARD_CACHE_URL = os.getenv("DASHBOARD_CACHE_URL", "")
+
+# Optional: service key for machine-to-machine bulk endpoints (disabled if unset)
+BULK_API_KEY = os.getenv("BULK_API_KEY", "")
+BULK_PREDICTION_MAX_ITEMS = int(os.getenv("BULK_PREDICTION_MAX_ITEMS", "10000"))
+
+# Max (glucose x carbs) grid points per /api/insulin/sweep request
+DOSE_SWEEP_MAX_POINTS = int(os.getenv("DOSE_SWEEP_MAX_POINTS", "20000"))
+
+# Calibration (fine-tuning) jobs: training processes per web worker, jobs a
+# process runs before it is replaced (each new one re-imports TensorFlow), and
+# how long an active job may go without reporting progress before it is failed
+TRAINING_WORKERS = int(os.getenv("TRAINING_WORKERS", "1"))
+TRAINING_JOBS_PER_PROCESS = max(1, int(os.getenv("TRAINING_JOBS_PER_PROCESS", "50")))
+TRAINING_JOB_STALE_AFTER = float(os.getenv("TRAINING_JOB_STALE_AFTER", "3600"))
+
+# Rows per round trip when streaming a user's full glucose history (training, export)
+GLUCOSE_STREAM_CHUNK_SIZE = int(os.getenv("GLUCOSE_STREAM_CHUNK_SIZE", "10000"))
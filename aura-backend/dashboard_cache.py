@@ -0,0 +1,184 @@
+# file: dashboard_cache.py
+#
+# Read-through cache for the serialized /api/dashboard payload.
+# Entries are keyed per user and tagged with that user's "generation";
+# every write for the user bumps the generation, so an entry built from
+# data read before the write can never be served afterwards.
+#
+# That guarantee spans every worker only with the Redis backend
+# (DASHBOARD_CACHE_URL). The default in-process cache is per worker: a write
+# invalidates the worker that handled it, and the others may keep serving
+# their copy for up to DASHBOARD_CACHE_TTL seconds. If the cache backend
+# fails, dashboards are built uncached instead of failing the request.
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from config import DASHBOARD_CACHE_URL, DASHBOARD_CACHE_TTL, DASHBOARD_CACHE_MAX_ENTRIES
+from logging_config import get_logger
+
+logger = get_logger("dashboard_cache")
+
+
+class InProcessDashboardCache:
+    """Per-worker LRU with TTL. Invalidations only reach this worker."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # user_id -> (expires_at, generation, entry)
+        # Generations come from one increasing counter and are bounded LRU;
+        # users whose generation was dropped get `_floor`, which is at least
+        # as new as anything dropped, so a stale entry can never match again.
+        self._generations = OrderedDict()
+        self._max_generations = max(4 * max_entries, 1024)
+        self._counter = 0
+        self._floor = 0
+        self._lock = threading.Lock()
+
+    def _generation_locked(self, user_id: int) -> int:
+        return self._generations.get(user_id, self._floor)
+
+    def generation(self, user_id: int) -> int:
+        with self._lock:
+            return self._generation_locked(user_id)
+
+    def get(self, user_id: int):
+        with self._lock:
+            item = self._entries.get(user_id)
+            if item is None:
+                return None
+            expires_at, generation, entry = item
+            if expires_at < time.monotonic() or generation != self._generation_locked(user_id):
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry
+
+    def set(self, user_id: int, generation: int, entry: dict):
+        with self._lock:
+            if generation != self._generation_locked(user_id):
+                return  # A write landed while this entry was being built.
+            self._entries[user_id] = (time.monotonic() + self.ttl, generation, entry)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._counter += 1
+            self._generations[user_id] = self._counter
+            self._generations.move_to_end(user_id)
+            while len(self._generations) > self._max_generations:
+                _, dropped = self._generations.popitem(last=False)
+                self._floor = max(self._floor, dropped)
+            self._entries.pop(user_id, None)
+
+
+class RedisDashboardCache:
+    """Shared cache for multi-worker deployments; Redis handles TTL and eviction."""
+
+    # Stores the entry only if the generation is still the one it was built
+    # for, in one atomic step, so a concurrent invalidate() always wins.
+    _SET_IF_CURRENT = """
+        if tonumber(redis.call('GET', KEYS[2]) or '0') ~= tonumber(ARGV[1]) then
+            return 0
+        end
+        redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+        return 1
+    """
+
+    def __init__(self, url: str, ttl: float):
+        import redis  # Optional dependency, only needed for the shared backend
+        self._redis = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+        self._redis.ping()  # from_url() is lazy; fail here so the caller can fall back
+        self._set_if_current = self._redis.register_script(self._SET_IF_CURRENT)
+        self.ttl = max(1, int(ttl))
+
+    @staticmethod
+    def _keys(user_id: int):
+        return f"aura:dashboard:{user_id}", f"aura:dashboard:{user_id}:gen"
+
+    def generation(self, user_id: int) -> int:
+        return int(self._redis.get(self._keys(user_id)[1]) or 0)
+
+    def get(self, user_id: int):
+        raw_entry, raw_generation = self._redis.mget(*self._keys(user_id))
+        if raw_entry is None:
+            return None
+        stored = json.loads(raw_entry)
+        if stored["generation"] != int(raw_generation or 0):
+            return None
+        return {"etag": stored["etag"], "body": stored["body"]}
+
+    def set(self, user_id: int, generation: int, entry: dict):
+        payload = json.dumps({"generation": generation, **entry})
+        self._set_if_current(keys=self._keys(user_id), args=[generation, payload, self.ttl])
+
+    def invalidate(self, user_id: int):
+        entry_key, generation_key = self._keys(user_id)
+        pipe = self._redis.pipeline()
+        pipe.incr(generation_key)
+        pipe.delete(entry_key)
+        pipe.execute()
+
+
+# --- Lazy Loading Configuration ---
+_cache = None
+_cache_lock = threading.Lock()
+
+def _get_cache():
+    global _cache
+    if _cache is not None:
+        return _cache
+    with _cache_lock:
+        if _cache is None:
+            if DASHBOARD_CACHE_URL:
+                try:
+                    _cache = RedisDashboardCache(DASHBOARD_CACHE_URL, DASHBOARD_CACHE_TTL)
+                    logger.info("Using shared Redis backend.")
+                except Exception as e:
+                    logger.warning("Redis backend unavailable (%s). Falling back to in-process cache.", e)
+            if _cache is None:
+                _cache = InProcessDashboardCache(DASHBOARD_CACHE_TTL, DASHBOARD_CACHE_MAX_ENTRIES)
+    return _cache
+
+
+def get_or_build(user_id: int, build_body) -> dict:
+    """
+    Returns {"etag", "body"} for the user's dashboard, calling `build_body()`
+    (which must return the serialized JSON string) only on a miss.
+    """
+    if DASHBOARD_CACHE_TTL <= 0:
+        return _make_entry(build_body())
+    try:
+        cache = _get_cache()
+        entry = cache.get(user_id)
+        if entry is not None:
+            return entry
+        generation = cache.generation(user_id)
+    except Exception as e:
+        logger.warning("Dashboard cache unavailable (%s); building uncached.", e)
+        return _make_entry(build_body())
+    entry = _make_entry(build_body())
+    try:
+        cache.set(user_id, generation, entry)
+    except Exception as e:
+        logger.warning("Could not cache dashboard for user %s: %s", user_id, e)
+    return entry
+
+
+def _make_entry(body: str) -> dict:
+    return {"etag": hashlib.sha1(body.encode("utf-8")).hexdigest(), "body": body}
+
+
+def invalidate(user_id: int):
+    """Drops the user's cached dashboard; call after any write affecting it."""
+    if DASHBOARD_CACHE_TTL <= 0:
+        return
+    try:
+        _get_cache().invalidate(user_id)
+    except Exception as e:
+        logger.warning("Could not invalidate user %s: %s", user_id, e)
@@ -1,119 +1,239 @@
 import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 import psycopg2
-from config import DATABASE_URL
-from psycopg2.extras import RealDictCursor
+from psycopg2 import extensions
+from psycopg2.pool import ThreadedConnectionPool
+from config import (
+    DATABASE_URL,
+    DB_POOL_MIN_CONN,
+    DB_POOL_MAX_CONN,
+    DB_POOL_TIMEOUT,
+    DB_POOL_HEALTHCHECK_AFTER,
+    GLUCOSE_STREAM_CHUNK_SIZE,
+)
+from psycopg2.extras import RealDictCursor, Json
+import numpy as np
+import dashboard_cache
+from logging_config import get_logger
 
-def get_db_connection():
-    """Establishes a connection to the database."""
-    conn = psycopg2.connect(DATABASE_URL)
-    return conn
+logger = get_logger("database")
 
-def init_db():
-    """Initializes the database by creating all necessary tables."""
-    conn = None
+# --- Process-wide Connection Pool ---
+# The pool is created lazily on first use and re-created after a fork, so
+# gunicorn workers never share sockets inherited from the master process.
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+class PoolTimeoutError(psycopg2.OperationalError):
+    """Raised when no pooled connection becomes free within DB_POOL_TIMEOUT."""
+    pass
+
+class _PooledConnection(extensions.connection):
+    """
+    psycopg2 connection that remembers when it was last handed back, and the
+    pool and slot semaphore it was checked out from (close_db_pool may swap
+    those before it is returned).
+    """
+    last_used = 0.0
+    pool = None
+    slots = None
+
+def _get_pool():
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            pool = ThreadedConnectionPool(
+                DB_POOL_MIN_CONN,
+                DB_POOL_MAX_CONN,
+                DATABASE_URL,
+                connection_factory=_PooledConnection,
+            )
+            # ThreadedConnectionPool raises instead of waiting when it is
+            # exhausted; the semaphore makes gthread workers queue up instead.
+            pool.slots = threading.BoundedSemaphore(DB_POOL_MAX_CONN)
+            _pool, _pool_pid = pool, pid
+        return _pool
+
+def _is_healthy(conn) -> bool:
+    """Cheap liveness check, only pinging connections that sat idle for a while."""
+    if conn.closed:
+        return False
+    if time.monotonic() - conn.last_used < DB_POOL_HEALTHCHECK_AFTER:
+        return True
     try:
-        conn = get_db_connection()
         cur = conn.cursor()
+        cur.execute("SELECT 1;")
+        cur.close()
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def _checkout():
+    pool = _get_pool()
+    slots = pool.slots
+    if not slots.acquire(timeout=DB_POOL_TIMEOUT):
+        raise PoolTimeoutError(f"No database connection available after {DB_POOL_TIMEOUT}s")
+    try:
+        # After a database restart every idle connection may be dead, so keep
+        # replacing them (a new connection is checked too) up to the pool size.
+        for _ in range(DB_POOL_MAX_CONN + 1):
+            conn = pool.getconn()
+            if _is_healthy(conn):
+                conn.pool, conn.slots = pool, slots
+                return conn
+            pool.putconn(conn, close=True)
+        raise psycopg2.OperationalError("No healthy database connection after replacing every pooled one")
+    except Exception:
+        slots.release()
+        raise
 
-        cur.execute("DROP TABLE IF EXISTS meal_logs CASCADE;")
-        cur.execute("DROP TABLE IF EXISTS insulin_doses CASCADE;")
-        cur.execute("DROP TABLE IF EXISTS glucose_readings CASCADE;")
-        cur.execute("DROP TABLE IF EXISTS users CASCADE;")
-        print("Dropped existing tables.")
-
-        cur.execute("""
-            CREATE TABLE users (
-                id SERIAL PRIMARY KEY,
-                username VARCHAR(80) UNIQUE NOT NULL, 
-                password_hash VARCHAR(256) NOT NULL,
-                name VARCHAR(100) NOT NULL,
-                age INTEGER,
-                gender VARCHAR(50),
-                phone_number VARCHAR(20),
-                weight_kg REAL,
-                height_cm REAL,
-                created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        print("Created UPGRADED 'users' table.")
-
-        cur.execute("""
-            CREATE TABLE glucose_readings (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
-                glucose_value REAL NOT NULL
-            );
-        """)
-        print("Created 'glucose_readings' table.")
-
-        cur.execute("""
-            CREATE TABLE insulin_doses (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
-                dose_amount REAL NOT NULL,
-                dose_type VARCHAR(50)
-            );
-        """)
-        print("Created 'insulin_doses' table.")
-
-        cur.execute("""
-            CREATE TABLE meal_logs (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
-                meal_description TEXT,
-                carb_count REAL
-            );
-        """)
-        print("Created 'meal_logs' table.")
+def _release(conn, discard: bool = False):
+    conn.last_used = time.monotonic()
+    try:
+        if conn.pool.closed:
+            conn.close()  # close_db_pool ran while this connection was checked out
+        else:
+            conn.pool.putconn(conn, close=discard or bool(conn.closed))
+    finally:
+        conn.slots.release()
 
+@contextmanager
+def db_connection():
+    """
+    Borrows a connection from the pool for the duration of the block.
+    Commits on success, rolls back on error and always returns it to the pool.
+    """
+    conn = _checkout()
+    discard = False
+    try:
+        yield conn
         conn.commit()
-        print("Database initialized successfully!")
-
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        if conn: conn.rollback()
+    except Exception:
+        try:
+            if not conn.closed:
+                conn.rollback()
+        except psycopg2.Error:
+            discard = True
+        raise
     finally:
-        if conn:
+        _release(conn, discard)
+
+@contextmanager
+def db_cursor(dict_rows: bool = False):
+    """Shortcut for a pooled connection plus a cursor (RealDictCursor if dict_rows)."""
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=RealDictCursor) if dict_rows else conn.cursor()
+        try:
+            yield cur
+        finally:
             cur.close()
-            conn.close()
-def calculate_health_score(user_id: int) -> dict:
+
+def close_db_pool():
     """
-    Calculates a daily 'Health Score' based on the last 24 hours of glucose data.
+    Closes every pooled connection (e.g. on worker shutdown). Connections still
+    checked out are returned to the pool and semaphore they came from.
     """
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    
-    cur.execute(
-        """
-        SELECT glucose_value FROM glucose_readings
-        WHERE user_id = %s AND timestamp >= NOW() - INTERVAL '24 hours';
-        """,
-        (user_id,)
-    )
-    readings = cur.fetchall()
-    cur.close()
-    conn.close()
-    
-    if not readings or len(readings) < 10: # Require at least 10 readings
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.closeall()
+        _pool, _pool_pid = None, None
+
+def init_db():
+    """Initializes the database by creating all necessary tables."""
+    try:
+        with db_cursor() as cur:
+            cur.execute("DROP TABLE IF EXISTS training_jobs CASCADE;")
+            cur.execute("DROP TABLE IF EXISTS meal_logs CASCADE;")
+            cur.execute("DROP TABLE IF EXISTS insulin_doses CASCADE;")
+            cur.execute("DROP TABLE IF EXISTS glucose_readings CASCADE;")
+            cur.execute("DROP TABLE IF EXISTS users CASCADE;")
+            cur.execute("DROP TABLE IF EXISTS schema_migrations;")
+            logger.info("Dropped existing tables.")
+
+            cur.execute("""
+                CREATE TABLE users (
+                    id SERIAL PRIMARY KEY,
+                    username VARCHAR(80) UNIQUE NOT NULL, 
+                    password_hash VARCHAR(256) NOT NULL,
+                    name VARCHAR(100) NOT NULL,
+                    age INTEGER,
+                    gender VARCHAR(50),
+                    phone_number VARCHAR(20),
+                    weight_kg REAL,
+                    height_cm REAL,
+                    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+            logger.info("Created UPGRADED 'users' table.")
+
+            cur.execute("""
+                CREATE TABLE glucose_readings (
+                    id SERIAL PRIMARY KEY,
+                    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                    timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+                    glucose_value REAL NOT NULL
+                );
+            """)
+            logger.info("Created 'glucose_readings' table.")
+
+            cur.execute("""
+                CREATE TABLE insulin_doses (
+                    id SERIAL PRIMARY KEY,
+                    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                    timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+                    dose_amount REAL NOT NULL,
+                    dose_type VARCHAR(50)
+                );
+            """)
+            logger.info("Created 'insulin_doses' table.")
+
+            cur.execute("""
+                CREATE TABLE meal_logs (
+                    id SERIAL PRIMARY KEY,
+                    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                    timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+                    meal_description TEXT,
+                    carb_count REAL
+                );
+            """)
+            logger.info("Created 'meal_logs' table.")
+
+        # Indexes (and optional partitioning) live in versioned migrations.
+        from migrations import run_migrations
+        run_migrations()
+        logger.info("Database initialized successfully!")
+
+    except Exception:
+        logger.exception("Database initialization failed")
+
+# Shared by calculate_health_score and the dashboard query: one pass over the
+# last 24 hours of readings, counting everything the score needs on the server.
+_HEALTH_COUNTS_SQL = """
+    COUNT(*) AS total_readings,
+    COUNT(*) FILTER (WHERE glucose_value BETWEEN 70 AND 180) AS in_range_count,
+    COUNT(*) FILTER (WHERE glucose_value < 70) AS hypo_events,
+    COUNT(*) FILTER (WHERE glucose_value > 250) AS very_high_events
+"""
+
+def _score_from_counts(total_readings: int, in_range_count: int, hypo_events: int, very_high_events: int) -> dict:
+    if not total_readings or total_readings < 10: # Require at least 10 readings
         return { "score": None, "time_in_range_percent": None, "message": "Not enough data from the last 24 hours to calculate a score." }
-        
-    values = [r['glucose_value'] for r in readings]
-    total_readings = len(values)
     
     # Scoring Logic
     score = 100.0
-    in_range_count = sum(1 for v in values if 70 <= v <= 180)
     time_in_range_percent = (in_range_count / total_readings) * 100
     
     score -= (100 - time_in_range_percent) * 0.5 # Penalty for being out of range
-    
-    hypo_events = sum(1 for v in values if v < 70)
     score -= hypo_events * 5 # Heavy penalty for lows
-    
-    very_high_events = sum(1 for v in values if v > 250)
     score -= very_high_events * 2 # Smaller penalty for very highs
     
     final_score = max(0, int(round(score)))
@@ -123,97 +243,261 @@ def calculate_health_score(user_id: int) -> dict:
         "time_in_range_percent": round(time_in_range_percent, 1),
         "hypo_events_count": hypo_events,
     }
+
+def calculate_health_score(user_id: int) -> dict:
+    """
+    Calculates a daily 'Health Score' based on the last 24 hours of glucose data.
+    """
+    with db_cursor(dict_rows=True) as cur:
+        cur.execute(
+            f"""
+            SELECT {_HEALTH_COUNTS_SQL} FROM glucose_readings
+            WHERE user_id = %s AND timestamp >= NOW() - INTERVAL '24 hours';
+            """,
+            (user_id,)
+        )
+        counts = cur.fetchone()
+    
+    return _score_from_counts(**counts)
+
 def find_user_by_username(username: str):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute("SELECT * FROM users WHERE username = %s;", (username,))
-    user = cur.fetchone()
-    cur.close()
-    conn.close()
+    with db_cursor(dict_rows=True) as cur:
+        cur.execute("SELECT * FROM users WHERE username = %s;", (username,))
+        user = cur.fetchone()
     return user
 
 def get_recent_glucose_readings(user_id: int, limit: int = 100):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute("SELECT glucose_value FROM glucose_readings WHERE user_id = %s ORDER BY timestamp DESC LIMIT %s;", (user_id, limit))
-    readings = cur.fetchall()
-    cur.close()
-    conn.close()
+    with db_cursor(dict_rows=True) as cur:
+        cur.execute("SELECT glucose_value FROM glucose_readings WHERE user_id = %s ORDER BY timestamp DESC LIMIT %s;", (user_id, limit))
+        readings = cur.fetchall()
     if not readings: return []
     return [r['glucose_value'] for r in reversed(readings)]
 
+def iter_glucose_history(user_id: int, start=None, end=None, chunk_size: int = GLUCOSE_STREAM_CHUNK_SIZE):
+    """
+    Streams the user's readings with timestamp in [start, end), oldest first,
+    as (timestamps datetime64[us] UTC, values float32) chunks of up to
+    `chunk_size` rows. A named (server-side) cursor keeps only one chunk in
+    flight, and rows arrive as plain tuples of numbers, so any history length
+    costs the same per row. The pooled connection is held until the
+    generator is exhausted or closed.
+    """
+    conditions, params = ["user_id = %s"], [user_id]
+    if start is not None:
+        conditions.append("timestamp >= %s")
+        params.append(start)
+    if end is not None:
+        conditions.append("timestamp < %s")
+        params.append(end)
+    with db_connection() as conn:
+        cur = conn.cursor(name=f"glucose_history_{uuid.uuid4().hex}")
+        cur.itersize = chunk_size
+        try:
+            cur.execute(
+                f"""
+                SELECT (EXTRACT(EPOCH FROM timestamp) * 1000000)::bigint, glucose_value
+                FROM glucose_readings WHERE {' AND '.join(conditions)} ORDER BY timestamp;
+                """,
+                params
+            )
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                micros = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+                values = np.fromiter((r[1] for r in rows), dtype=np.float32, count=len(rows))
+                yield micros.astype("datetime64[us]"), values
+        finally:
+            cur.close()
+
+def load_glucose_history(user_id: int, start=None, end=None, context: int = 0) -> tuple:
+    """
+    The user's readings in [start, end) as two contiguous arrays (see
+    iter_glucose_history), plus the `context` readings just before `start`
+    (so the first reading in range still has a full look-back window).
+    """
+    chunks = []
+    if start is not None and context > 0:
+        with db_cursor() as cur:
+            cur.execute(
+                """
+                SELECT (EXTRACT(EPOCH FROM timestamp) * 1000000)::bigint, glucose_value FROM glucose_readings
+                WHERE user_id = %s AND timestamp < %s ORDER BY timestamp DESC LIMIT %s;
+                """,
+                (user_id, start, context)
+            )
+            rows = cur.fetchall()[::-1]
+        if rows:
+            chunks.append((np.array([r[0] for r in rows], dtype=np.int64).astype("datetime64[us]"),
+                           np.array([r[1] for r in rows], dtype=np.float32)))
+    chunks.extend(iter_glucose_history(user_id, start, end))
+    if not chunks:
+        return np.empty(0, dtype="datetime64[us]"), np.empty(0, dtype=np.float32)
+    return np.concatenate([c[0] for c in chunks]), np.concatenate([c[1] for c in chunks])
+
+def get_all_user_ids() -> list:
+    with db_cursor() as cur:
+        cur.execute("SELECT id FROM users ORDER BY id;")
+        return [r[0] for r in cur.fetchall()]
+
 def get_dashboard_data_for_user(user_id: int):
     """
     Fetches all necessary data for the user's dashboard,
-    now INCLUDING the Health Score.
+    INCLUDING the Health Score, in a single round trip.
     """
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    
-    # --- Part 1: Fetch core data (your existing code is perfect) ---
-    
-    # Fetch user profile info
-    cur.execute("SELECT name, age, weight_kg, height_cm FROM users WHERE id = %s;", (user_id,))
-    user_profile = cur.fetchone()
-
-    # Fetch glucose readings for the chart
-    cur.execute(
-        """
-        SELECT timestamp, glucose_value FROM glucose_readings 
-        WHERE user_id = %s AND timestamp > NOW() - INTERVAL '24 hours' 
-        ORDER BY timestamp ASC;
-        """, 
-        (user_id,)
-    )
-    glucose_readings = cur.fetchall()
-    
-    # Fetch recent meals for the log
-    cur.execute(
-        """
-        SELECT timestamp, meal_description, carb_count FROM meal_logs 
-        WHERE user_id = %s AND timestamp > NOW() - INTERVAL '24 hours' 
-        ORDER BY timestamp DESC LIMIT 5;
-        """, 
-        (user_id,)
+    # Readings come back as parallel arrays and meals as the 5 most recent
+    # rows, so the whole payload is one row. NOW() is fixed for the statement,
+    # which keeps the chart window and the score window consistent.
+    with db_cursor(dict_rows=True) as cur:
+        cur.execute(
+            f"""
+            WITH day AS (
+                SELECT timestamp, glucose_value FROM glucose_readings
+                WHERE user_id = %(user_id)s AND timestamp >= NOW() - INTERVAL '24 hours'
+            ),
+            readings AS (
+                SELECT
+                    array_agg(timestamp ORDER BY timestamp) FILTER (WHERE timestamp > NOW() - INTERVAL '24 hours') AS reading_times,
+                    array_agg(glucose_value ORDER BY timestamp) FILTER (WHERE timestamp > NOW() - INTERVAL '24 hours') AS reading_values,
+                    {_HEALTH_COUNTS_SQL}
+                FROM day
+            ),
+            meals AS (
+                SELECT
+                    array_agg(timestamp ORDER BY timestamp DESC) AS meal_times,
+                    array_agg(meal_description ORDER BY timestamp DESC) AS meal_descriptions,
+                    array_agg(carb_count ORDER BY timestamp DESC) AS meal_carbs
+                FROM (
+                    SELECT timestamp, meal_description, carb_count FROM meal_logs
+                    WHERE user_id = %(user_id)s AND timestamp > NOW() - INTERVAL '24 hours'
+                    ORDER BY timestamp DESC LIMIT 5
+                ) recent
+            )
+            SELECT u.id IS NOT NULL AS user_found, u.name, u.age, u.weight_kg, u.height_cm,
+                   readings.*, meals.*
+            FROM readings CROSS JOIN meals
+            LEFT JOIN users u ON u.id = %(user_id)s;
+            """,
+            {"user_id": user_id}
+        )
+        row = cur.fetchone()
+
+    user_profile = None
+    if row["user_found"]:
+        user_profile = {key: row[key] for key in ("name", "age", "weight_kg", "height_cm")}
+
+    glucose_readings = [
+        {"timestamp": ts, "glucose_value": value}
+        for ts, value in zip(row["reading_times"] or [], row["reading_values"] or [])
+    ]
+    meal_logs = [
+        {"timestamp": ts, "meal_description": desc, "carb_count": carbs}
+        for ts, desc, carbs in zip(row["meal_times"] or [], row["meal_descriptions"] or [], row["meal_carbs"] or [])
+    ]
+    health_score_data = _score_from_counts(
+        row["total_readings"], row["in_range_count"], row["hypo_events"], row["very_high_events"]
     )
-    meal_logs = cur.fetchall()
-    
-    # --- Part 2: Clean up the database connection ---
-    cur.close()
-    conn.close()
-    
-    # --- Part 3: (THE NEW PART) Call the health score function ---
-    # We do this after closing the main connection to keep things clean.
-    # The calculate_health_score function opens and closes its own connection.
-    health_score_data = calculate_health_score(user_id)
-    
-    # --- Part 4: Assemble the complete response ---
-    # We now add the 'health_score' key to the dictionary we return.
+
     return {
         "user_profile": user_profile,
         "glucose_readings": glucose_readings,
         "recent_meals": meal_logs,
-        "health_score": health_score_data # <-- THIS IS THE NEWLY ADDED PIECE
+        "health_score": health_score_data
     }
 
 def add_log_entry(user_id: int, log_type: str, description: str, value: float):
     """Adds a new log entry to the appropriate table."""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    if log_type == 'meal':
-        sql = "INSERT INTO meal_logs (user_id, timestamp, meal_description, carb_count) VALUES (%s, NOW(), %s, %s)"
-        cur.execute(sql, (user_id, description, value))
-    elif log_type == 'insulin':
-        sql = "INSERT INTO insulin_doses (user_id, timestamp, dose_amount, dose_type) VALUES (%s, NOW(), %s, %s)"
-        # 'description' would be 'bolus' or 'basal' in this case
-        cur.execute(sql, (user_id, value, description))
-    # Add other log types here (e.g., 'activity')
+    with db_cursor() as cur:
+        if log_type == 'meal':
+            sql = "INSERT INTO meal_logs (user_id, timestamp, meal_description, carb_count) VALUES (%s, NOW(), %s, %s)"
+            cur.execute(sql, (user_id, description, value))
+        elif log_type == 'insulin':
+            sql = "INSERT INTO insulin_doses (user_id, timestamp, dose_amount, dose_type) VALUES (%s, NOW(), %s, %s)"
+            # 'description' would be 'bolus' or 'basal' in this case
+            cur.execute(sql, (user_id, value, description))
+        elif log_type == 'glucose':
+            # New CGM/fingerstick reading; 'description' is unused
+            sql = "INSERT INTO glucose_readings (user_id, timestamp, glucose_value) VALUES (%s, NOW(), %s)"
+            cur.execute(sql, (user_id, value))
+        # Add other log types here (e.g., 'activity')
     
-    conn.commit()
-    cur.close()
-    conn.close()
-    print(f"--- [Database] Saved '{log_type}' log for user {user_id}. ---")
+    dashboard_cache.invalidate(user_id)
+    logger.debug("Saved '%s' log for user %s", log_type, user_id)
+
+# --- Training jobs (see training_jobs.py) ---
+_TRAINING_JOB_COLUMNS = "id::text AS job_id, user_id, mode, status, progress, created_at, started_at, finished_at, val_loss, error, result"
+
+TRAINING_JOB_INSERT_ATTEMPTS = 3
+
+def create_training_job(user_id: int, job_id: str, stale_after_seconds: float, mode: str = "incremental") -> tuple:
+    """
+    Queues a training job unless the user already has an active one.
+    Returns (job row, created?). Active jobs whose process stopped reporting
+    for `stale_after_seconds` (e.g. the worker was killed) are failed first,
+    so they cannot block new requests forever.
+    """
+    with db_cursor(dict_rows=True) as cur:
+        cur.execute(
+            """
+            UPDATE training_jobs
+            SET status = 'failed', error = 'Abandoned (no progress reported)', finished_at = NOW(), updated_at = NOW()
+            WHERE user_id = %s AND status IN ('queued', 'running')
+              AND updated_at < NOW() - make_interval(secs => %s);
+            """,
+            (user_id, stale_after_seconds)
+        )
+        # The active job we conflicted with can finish before the SELECT sees
+        # it; then there is room again, so try the INSERT once more.
+        for _ in range(TRAINING_JOB_INSERT_ATTEMPTS):
+            cur.execute(
+                f"""
+                INSERT INTO training_jobs (id, user_id, mode, status) VALUES (%s, %s, %s, 'queued')
+                ON CONFLICT (user_id) WHERE status IN ('queued', 'running') DO NOTHING
+                RETURNING {_TRAINING_JOB_COLUMNS};
+                """,
+                (job_id, user_id, mode)
+            )
+            row = cur.fetchone()
+            if row is not None:
+                return row, True
+            cur.execute(
+                f"SELECT {_TRAINING_JOB_COLUMNS} FROM training_jobs WHERE user_id = %s AND status IN ('queued', 'running');",
+                (user_id,)
+            )
+            row = cur.fetchone()
+            if row is not None:
+                return row, False
+        raise psycopg2.OperationalError(f"Could not queue a training job for user {user_id}: active jobs kept changing")
+
+def get_training_job(job_id: str):
+    with db_cursor(dict_rows=True) as cur:
+        cur.execute(f"SELECT {_TRAINING_JOB_COLUMNS} FROM training_jobs WHERE id = %s;", (job_id,))
+        return cur.fetchone()
+
+def update_training_job(job_id: str, from_statuses: tuple, **fields) -> bool:
+    """
+    Sets `fields` (status, progress, val_loss, error, result, started/finished=True)
+    on the job if its status is one of `from_statuses`. Returns False when
+    the job has moved on meanwhile (e.g. it was cancelled).
+    """
+    assignments, values = ["updated_at = NOW()"], []
+    for column in ("status", "progress", "val_loss", "error"):
+        if column in fields:
+            assignments.append(f"{column} = %s")
+            values.append(fields[column])
+    if "result" in fields:
+        assignments.append("result = %s")
+        values.append(Json(fields["result"]))
+    if fields.get("started"):
+        assignments.append("started_at = NOW()")
+    if fields.get("finished"):
+        assignments.append("finished_at = NOW()")
+    with db_cursor() as cur:
+        cur.execute(
+            f"UPDATE training_jobs SET {', '.join(assignments)} WHERE id = %s AND status = ANY(%s);",
+            (*values, job_id, list(from_statuses))
+        )
+        return cur.rowcount == 1
 
 if __name__ == '__main__':
     print("Initializing database...")
@@ -0,0 +1,221 @@
+# file: food_index.py
+#
+# On-disk food/carb index for large nutrition tables. A CSV (100k+ rows with
+# synonyms) is compiled once at deploy time into a directory of .npy arrays:
+#
+#   python food_index.py foods.csv food_index
+#
+# Workers memory-map the arrays instead of parsing the CSV, so startup is
+# instant, lookups are a vectorized binary search over 64-bit key hashes, and
+# the pages are shared by every worker through the OS page cache.
+#
+# Each build goes into its own versioned directory (food_index.v<time>-<pid>)
+# and `food_index` is a symlink swapped to it with os.replace, so a reader
+# opening the index always finds one complete version.
+#
+# CSV columns (header required): food, carbs_per_serving, serving_size, synonyms
+# where synonyms are separated by "|". The built-in FOOD_CARB_DATABASE is
+# always included, and its entries win over CSV rows with the same name.
+
+import csv
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import time
+import numpy as np
+
+INDEX_FORMAT_VERSION = 1
+_WORD_EDGES = re.compile(r"^\w.*\w$|^\w$")
+_WORD = re.compile(r"\w+")
+
+
+def normalize_key(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def _key_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _read_rows(csv_path: str, synonym_separator: str = "|"):
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            name = (row.get("food") or "").strip()
+            if not name:
+                continue
+            synonyms = [s for s in (row.get("synonyms") or "").split(synonym_separator) if s.strip()]
+            yield name, float(row.get("carbs_per_serving") or 0), (row.get("serving_size") or "").strip(), synonyms
+
+
+def _builtin_rows():
+    from natural_language_processor import FOOD_CARB_DATABASE
+    for name, data in FOOD_CARB_DATABASE.items():
+        yield name, float(data["carbs_per_serving"]), data["serving_size"], data.get("variations", [])
+
+
+def _pack_strings(strings: list) -> tuple:
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    blob = np.frombuffer(b"".join(encoded), dtype=np.uint8) if encoded else np.zeros(0, dtype=np.uint8)
+    return blob, offsets
+
+
+def build_food_index(csv_path: str, out_dir: str, synonym_separator: str = "|") -> dict:
+    """Compiles the CSV (plus the built-in foods) and atomically points the `out_dir` symlink at it."""
+    food_names, food_carbs, food_servings = [], [], []
+    key_to_food = {}
+    skipped = 0
+    sources = [_builtin_rows()] + ([_read_rows(csv_path, synonym_separator)] if csv_path else [])
+    for rows in sources:
+        for name, carbs, serving_size, synonyms in rows:
+            food_id = len(food_names)
+            new_keys = []
+            for key in [name] + synonyms:
+                key = normalize_key(key)
+                if not _WORD_EDGES.match(key):
+                    skipped += 1  # Could never match as a whole word
+                elif key not in key_to_food and key not in new_keys:
+                    new_keys.append(key)
+            if not new_keys:
+                continue
+            food_names.append(normalize_key(name))
+            food_carbs.append(carbs)
+            food_servings.append(serving_size)
+            for key in new_keys:
+                key_to_food[key] = food_id
+
+    keys = list(key_to_food)
+    # Match priority: longer names first, then insertion order (built-ins first),
+    # which is the same order the built-in matcher uses.
+    rank_order = sorted(range(len(keys)), key=lambda i: (-len(keys[i]), i))
+    ranks = np.empty(len(keys), dtype=np.int32)
+    ranks[rank_order] = np.arange(len(keys), dtype=np.int32)
+    hashes = np.array([_key_hash(k) for k in keys], dtype=np.uint64)
+    order = np.argsort(hashes, kind="stable")
+    hashes = hashes[order]
+    if len(hashes) > 1 and np.any(hashes[1:] == hashes[:-1]):
+        raise ValueError("64-bit key hash collision; rename one of the colliding foods")
+    keys = [keys[i] for i in order]
+    ranks = ranks[order]
+
+    key_blob, key_offsets = _pack_strings(keys)
+    text_blob, text_offsets = _pack_strings([s for pair in zip(food_names, food_servings) for s in pair])
+    arrays = {
+        "key_hashes": hashes,
+        "key_food": np.array([key_to_food[k] for k in keys], dtype=np.int32),
+        "key_rank": ranks,
+        "key_blob": key_blob,
+        "key_offsets": key_offsets,
+        "food_carbs": np.array(food_carbs, dtype=np.float32),
+        "food_text_blob": text_blob,
+        "food_text_offsets": text_offsets,
+    }
+    meta = {
+        "format_version": INDEX_FORMAT_VERSION,
+        "source": os.path.basename(csv_path) if csv_path else None,
+        "foods": len(food_names),
+        "keys": len(keys),
+        "skipped_keys": skipped,
+        "max_key_words": max((len(_WORD.findall(k)) for k in keys), default=0),
+        "max_key_chars": max((len(k) for k in keys), default=0),
+    }
+
+    out_dir = out_dir.rstrip(os.sep)
+    version_dir = f"{out_dir}.v{time.time_ns()}-{os.getpid()}"
+    os.makedirs(version_dir)
+    for name, array in arrays.items():
+        np.save(os.path.join(version_dir, f"{name}.npy"), array)
+    with open(os.path.join(version_dir, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    _publish(out_dir, version_dir)
+    return meta
+
+
+def _publish(out_dir: str, version_dir: str):
+    previous = os.path.realpath(out_dir) if os.path.islink(out_dir) else None
+    if os.path.isdir(out_dir) and previous is None:
+        # A plain directory from an older build: a one-time, non-atomic switch.
+        old_dir = f"{out_dir}.old-{os.getpid()}"
+        os.rename(out_dir, old_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+    tmp_link = f"{out_dir}.link-{os.getpid()}"
+    os.symlink(os.path.basename(version_dir), tmp_link)  # Relative: the version is a sibling
+    os.replace(tmp_link, out_dir)
+
+    # Keep the previous version for workers still opening it; drop older ones.
+    parent, base = os.path.split(os.path.abspath(out_dir))
+    keep = {os.path.realpath(version_dir), previous}
+    for name in os.listdir(parent):
+        path = os.path.join(parent, name)
+        if name.startswith(f"{base}.v") and os.path.realpath(path) not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+class FoodIndex:
+    """Read-only, memory-mapped view of an index built by build_food_index()."""
+
+    def __init__(self, index_dir: str):
+        index_dir = os.path.realpath(index_dir)  # Every file from the same published version
+        with open(os.path.join(index_dir, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta.get("format_version") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported food index format {self.meta.get('format_version')}; rebuild it")
+        load = lambda name: np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r")
+        self.key_hashes = load("key_hashes")
+        self.key_food = load("key_food")
+        self.key_rank = load("key_rank")
+        self.key_blob = load("key_blob")
+        self.key_offsets = load("key_offsets")
+        self.food_carbs = load("food_carbs")
+        self.food_text_blob = load("food_text_blob")
+        self.food_text_offsets = load("food_text_offsets")
+        self.max_key_words = int(self.meta["max_key_words"])
+        self.max_key_chars = int(self.meta["max_key_chars"])
+
+    def __len__(self) -> int:
+        return len(self.key_hashes)
+
+    def _key_at(self, position: int) -> str:
+        start, end = self.key_offsets[position], self.key_offsets[position + 1]
+        return self.key_blob[start:end].tobytes().decode("utf-8")
+
+    def lookup(self, keys: list) -> tuple:
+        """
+        (food ids, match priorities) for each key, normalized with
+        normalize_key like the indexed names; the food id is -1 where the key
+        is unknown.
+        """
+        keys = [normalize_key(k) for k in keys]
+        ids = np.full(len(keys), -1, dtype=np.int64)
+        ranks = np.full(len(keys), -1, dtype=np.int64)
+        if not keys or not len(self.key_hashes):
+            return ids, ranks
+        hashes = np.fromiter((_key_hash(k) for k in keys), dtype=np.uint64, count=len(keys))
+        positions = np.minimum(np.searchsorted(self.key_hashes, hashes), len(self.key_hashes) - 1)
+        for i in np.flatnonzero(self.key_hashes[positions] == hashes):
+            if self._key_at(positions[i]) == keys[i]:  # Rule out hash collisions with unknown text
+                ids[i] = self.key_food[positions[i]]
+                ranks[i] = self.key_rank[positions[i]]
+        return ids, ranks
+
+    def food(self, food_id: int) -> dict:
+        offsets = self.food_text_offsets
+        text = lambda i: self.food_text_blob[offsets[i]:offsets[i + 1]].tobytes().decode("utf-8")
+        carbs = float(self.food_carbs[food_id])
+        return {
+            "name": text(2 * food_id),
+            "carbs_per_serving": int(carbs) if carbs.is_integer() else carbs,
+            "serving_size": text(2 * food_id + 1),
+        }
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python food_index.py <foods.csv> [output_dir]")
+        sys.exit(2)
+    output = sys.argv[2] if len(sys.argv) == 3 else "food_index"
+    print(f"Built {output}: {json.dumps(build_food_index(sys.argv[1], output))}")
@@ -0,0 +1,69 @@
+# file: forecast_cache.py
+#
+# Memoizes baseline glucose forecasts. CGM readings arrive every 5 minutes
+# but chat messages come much faster, so most forecasts are requested again
+# for a window that has not changed. Keys combine the resolved model's
+# (path, file version) with a hash of the last LOOK_BACK readings: a retrained
+# model has a new file version, so it can never hit a forecast from the old one.
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+
+def window_key(model_path: str, model_version, glucose_window) -> tuple:
+    """Cache key for one model version and one window of readings."""
+    window = np.ascontiguousarray(glucose_window, dtype=np.float64)
+    digest = hashlib.blake2b(window.tobytes(), digest_size=16).hexdigest()
+    return (model_path, model_version, digest)
+
+
+class ForecastCache:
+    """Per-worker LRU with TTL. Values are treated as read-only by callers."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.stats["misses"] += 1
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+                "ttl": self.ttl,
+                "max_entries": self.max_entries,
+            }
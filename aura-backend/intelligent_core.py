@@ -1,9 +1,28 @@
 # file: intelligent_core.py
 
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
 # DO NOT import EnhancedNLPProcessor at the top level
 from prediction_service import generate_hybrid_prediction
 from recommendation_service import get_insulin_recommendation
-import database as db
+from logging_config import get_logger
+
+logger = get_logger("ai_core")
+
+# --- Pipeline Configuration ---
+# "concurrent" runs the dose (DQN) and forecast (LSTM) stages side by side once
+# the text is parsed; "sequential" runs them one after the other as before.
+AI_PIPELINE_MODE = os.getenv("AI_PIPELINE_MODE", "concurrent").lower()
+# Model stages run at once per worker: each request fans out to 2, so size
+# this as 2 x request threads per worker (gunicorn --threads).
+AI_PIPELINE_WORKERS = int(os.getenv("AI_PIPELINE_WORKERS", "4"))
+# Seconds each model stage may take before the response is sent without it
+AI_DOSE_TIMEOUT = float(os.getenv("AI_DOSE_TIMEOUT", "10"))
+AI_PREDICTION_TIMEOUT = float(os.getenv("AI_PREDICTION_TIMEOUT", "10"))
 
 # --- Lazy Loading Configuration ---
 _nlp_processor = None
@@ -16,50 +35,223 @@ def _get_nlp_processor():
     
     # Import here to prevent loading at startup
     from natural_language_processor import EnhancedNLPProcessor
-    print("--- [AI Core] Initializing Enhanced NLP Processor for the first time... ---")
+    logger.info("Initializing Enhanced NLP Processor for the first time...")
     _nlp_processor = EnhancedNLPProcessor()
-    print("--- [AI Core] NLP Processor ready. ---")
+    logger.info("NLP Processor ready.")
     return _nlp_processor
 
-def process_user_intent(user_id: int, user_text: str, glucose_history: list) -> dict:
-    print(f"--- [AI Core] Processing intent for user {user_id}: '{user_text}' ---")
-    
-    # Get the NLP processor, loading it if necessary
-    NLP_PROCESSOR = _get_nlp_processor()
-    
-    # ... (The rest of your function logic is the same)
-    parsed_entities = NLP_PROCESSOR.parse_user_text(user_text)
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+# Stages that timed out but still hold a pool thread until they finish.
+_abandoned_stages = 0
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Bounded pool for the model stages of all requests in this worker (recreated after fork)."""
+    global _executor, _executor_pid, _abandoned_stages
+    if _executor is not None and _executor_pid == os.getpid():
+        return _executor
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=AI_PIPELINE_WORKERS, thread_name_prefix="ai-stage")
+            _executor_pid = os.getpid()
+            _abandoned_stages = 0
+    return _executor
+
+def _release_abandoned(_future):
+    global _abandoned_stages
+    with _executor_lock:
+        _abandoned_stages -= 1
+
+def _abandon(future):
+    """Counts a timed-out stage against the pool until it actually finishes."""
+    global _abandoned_stages
+    with _executor_lock:
+        _abandoned_stages += 1
+    future.add_done_callback(_release_abandoned)
+
+def _pool_saturated(stage_count: int) -> bool:
+    # Timed-out stages still occupy threads; queueing behind them would only
+    # time out again, so the response degrades at once instead.
+    with _executor_lock:
+        return AI_PIPELINE_WORKERS - _abandoned_stages < stage_count
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 2)
+
+def _parse_intent(user_text: str, glucose_history: list) -> tuple:
+    """NLP stage: parsed entities plus the inputs for the two model stages."""
+    parsed_entities = _get_nlp_processor().parse_user_text(user_text)
     carbs = parsed_entities.get("carbs", 0)
     activity_info = parsed_entities.get("activities_detected", [])
-    activity_detected = len(activity_info) > 0
-    
-    current_glucose = glucose_history[-1] if glucose_history else 120
-    dose_recommendation = get_insulin_recommendation(
-        glucose=current_glucose,
-        carbs=carbs,
-        exercise_recent=activity_detected
-    )
     
+    dose_kwargs = {
+        "glucose": glucose_history[-1] if glucose_history else 120,
+        "carbs": carbs,
+        "exercise_recent": len(activity_info) > 0
+    }
     future_events = {
         "carbs": carbs,
         "activity_type": activity_info[0]['activity'] if activity_info else None,
         "activity_duration": activity_info[0]['duration_minutes'] if activity_info else 0
     }
+    return parsed_entities, dose_kwargs, future_events
+
+def _timed_stage(fn, **kwargs) -> tuple:
+    """Runs one stage and returns (result, milliseconds)."""
+    started = time.perf_counter()
+    return fn(**kwargs), _elapsed_ms(started)
+
+# Stand-ins returned when a stage times out or fails, shaped like the
+# stage's own error responses so callers need no special handling.
+def _degraded_dose(reason: str) -> dict:
+    return {"error": f"Dose recommendation unavailable: {reason}"}
+
+def _degraded_prediction(reason: str) -> dict:
+    return {"prediction": [], "status": "error", "error_message": f"Glucose prediction unavailable: {reason}"}
+
+_DEGRADED = {"dose": _degraded_dose, "prediction": _degraded_prediction}
+
+def _stage_calls(user_id: int, glucose_history: list, dose_kwargs: dict, future_events: dict) -> dict:
+    return {
+        "dose": (get_insulin_recommendation, dose_kwargs, AI_DOSE_TIMEOUT),
+        "prediction": (generate_hybrid_prediction, {
+            "user_id": user_id,
+            "recent_glucose_history": glucose_history,
+            "future_events": future_events
+        }, AI_PREDICTION_TIMEOUT),
+    }
+
+def _run_stages(stages: dict, timings: dict, degraded: list) -> dict:
+    """Runs the model stages (sequentially or on the executor) with per-stage timeouts."""
+    results = {}
+    if AI_PIPELINE_MODE != "concurrent":
+        for name, (fn, kwargs, _) in stages.items():
+            started = time.perf_counter()
+            try:
+                results[name], timings[name] = _timed_stage(fn, **kwargs)
+            except Exception as e:
+                logger.warning("Stage '%s' failed: %s", name, e)
+                results[name], timings[name] = _DEGRADED[name](str(e)), _elapsed_ms(started)
+                degraded.append(name)
+        return results
+
+    submitted_at = time.perf_counter()
+    executor = _get_executor()
+    if _pool_saturated(len(stages)):
+        return _degrade_all(stages, timings, degraded)
+    futures = {name: executor.submit(_timed_stage, fn, **kwargs) for name, (fn, kwargs, _) in stages.items()}
+    for name, future in futures.items():
+        remaining = stages[name][2] - (time.perf_counter() - submitted_at)
+        try:
+            results[name], timings[name] = future.result(timeout=max(0.0, remaining))
+        except FutureTimeoutError:
+            # A stage still queued is dropped; a running one keeps its thread
+            # in the background and this response goes without it.
+            future.cancel()
+            _abandon(future)
+            logger.warning("Stage '%s' exceeded %ss. Returning partial response.", name, stages[name][2])
+            results[name] = _DEGRADED[name](f"timed out after {stages[name][2]}s")
+            timings[name] = _elapsed_ms(submitted_at)
+            degraded.append(name)
+        except Exception as e:
+            logger.warning("Stage '%s' failed: %s", name, e)
+            results[name], timings[name] = _DEGRADED[name](str(e)), _elapsed_ms(submitted_at)
+            degraded.append(name)
+    return results
+
+def _degrade_all(stages: dict, timings: dict, degraded: list) -> dict:
+    logger.warning("Stage pool saturated by %d timed-out stages. Returning partial response.", _abandoned_stages)
+    results = {}
+    for name in stages:
+        results[name], timings[name] = _DEGRADED[name]("stage pool saturated"), 0.0
+        degraded.append(name)
+    return results
+
+def _assemble_response(parsed_entities: dict, results: dict, timings: dict, degraded: list, mode: str, started: float) -> dict:
+    advice_started = time.perf_counter()
+    contextual_advice = _get_nlp_processor().get_insulin_adjustment_suggestion(parsed_entities)
+    timings["advice"] = _elapsed_ms(advice_started)
+    timings["total"] = _elapsed_ms(started)
+    
+    return {
+        "parsed_info": parsed_entities,
+        "dose_recommendation": results["dose"],
+        "glucose_prediction": results["prediction"],
+        "contextual_advice": contextual_advice,
+        "metadata": {"pipeline": mode, "timings_ms": timings, "degraded_stages": degraded}
+    }
+
+def _log_processed(user_id: int, timings: dict, degraded: list):
+    if degraded:
+        logger.warning("Intent for user %s processed with degraded stages %s", user_id, degraded, extra={"timings_ms": timings})
+    else:
+        logger.info("Intent for user %s processed in %.1f ms", user_id, timings["total"], extra={"timings_ms": timings})
+
+def process_user_intent(user_id: int, user_text: str, glucose_history: list) -> dict:
+    logger.debug("Processing intent for user %s", user_id)
+    started = time.perf_counter()
+    timings, degraded = {}, []
     
-    hybrid_prediction = generate_hybrid_prediction(
-        user_id=user_id,
-        recent_glucose_history=glucose_history,
-        future_events=future_events
+    (parsed_entities, dose_kwargs, future_events), timings["nlp"] = _timed_stage(
+        _parse_intent, user_text=user_text, glucose_history=glucose_history
     )
     
-    contextual_advice = NLP_PROCESSOR.get_insulin_adjustment_suggestion(parsed_entities)
+    stages = _stage_calls(user_id, glucose_history, dose_kwargs, future_events)
+    results = _run_stages(stages, timings, degraded)
     
-    response = {
-        "parsed_info": parsed_entities,
-        "dose_recommendation": dose_recommendation,
-        "glucose_prediction": hybrid_prediction,
-        "contextual_advice": contextual_advice
-    }
+    response = _assemble_response(parsed_entities, results, timings, degraded, AI_PIPELINE_MODE, started)
+    _log_processed(user_id, timings, degraded)
+    return response
+
+async def process_user_intent_async(user_id: int, user_text: str, glucose_history: list) -> dict:
+    """
+    asyncio variant of process_user_intent for async servers. The model
+    stages run on the same bounded executor (parsing and advice on the
+    loop's default one); the event loop is never blocked.
+    """
+    logger.debug("Processing intent (async) for user %s", user_id)
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    started = time.perf_counter()
+    timings, degraded = {}, []
+    
+    (parsed_entities, dose_kwargs, future_events), timings["nlp"] = await loop.run_in_executor(
+        None, lambda: _timed_stage(_parse_intent, user_text=user_text, glucose_history=glucose_history)
+    )
+    
+    stages = _stage_calls(user_id, glucose_history, dose_kwargs, future_events)
+    if _pool_saturated(len(stages)):
+        results = _degrade_all(stages, timings, degraded)
+        response = await loop.run_in_executor(
+            None, lambda: _assemble_response(parsed_entities, results, timings, degraded, "async", started)
+        )
+        _log_processed(user_id, timings, degraded)
+        return response
+    
+    async def run_stage(name, fn, kwargs, timeout):
+        stage_started = time.perf_counter()
+        future = executor.submit(_timed_stage, fn, **kwargs)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            _abandon(future)
+            logger.warning("Stage '%s' exceeded %ss. Returning partial response.", name, timeout)
+            degraded.append(name)
+            return _DEGRADED[name](f"timed out after {timeout}s"), _elapsed_ms(stage_started)
+        except Exception as e:
+            logger.warning("Stage '%s' failed: %s", name, e)
+            degraded.append(name)
+            return _DEGRADED[name](str(e)), _elapsed_ms(stage_started)
     
-    print(f"--- [AI Core] Intent processed successfully. ---")
-    return response
\ No newline at end of file
+    names = list(stages)
+    outcomes = await asyncio.gather(*(run_stage(name, *stages[name]) for name in names))
+    results = {}
+    for name, (result, elapsed) in zip(names, outcomes):
+        results[name], timings[name] = result, elapsed
+    
+    response = await loop.run_in_executor(
+        None, lambda: _assemble_response(parsed_entities, results, timings, degraded, "async", started)
+    )
+    _log_processed(user_id, timings, degraded)
+    return response
@@ -0,0 +1,165 @@
+# file: logging_config.py
+#
+# Leveled, structured logging for the backend. Request threads format the
+# message and put the record on an in-memory queue; one background listener
+# thread renders it (JSON lines by default) and writes it to stdout. When
+# LOG_QUEUE_SIZE records are waiting, new ones are dropped and counted instead
+# of blocking requests.
+#
+# Settings (read directly from the environment so every module can use this,
+# including the ML modules that must not import config.py):
+#   LOG_LEVEL=INFO            DEBUG, INFO, WARNING, ERROR
+#   LOG_FORMAT=json           json or text
+#   LOG_QUEUE_SIZE=10000      max records waiting to be written
+#   LOG_DEBUG_PAYLOADS=false  log full request/AI payloads at DEBUG level
+
+import atexit
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_DEBUG_PAYLOADS = str(os.getenv("LOG_DEBUG_PAYLOADS", "false")).lower() in ("1", "true", "yes", "on")
+
+ROOT_LOGGER = "aura"
+
+# Attributes every LogRecord has; anything else came in through `extra=`.
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, any `extra` fields, exc."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+def _snapshot(value):
+    # `extra` values are rendered later on the listener thread; copy mutable
+    # ones now (as JSON-safe data) so later changes by the caller don't leak in.
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return json.loads(json.dumps(value, default=str))
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues without blocking; drops (and counts) records once `max_size` are waiting."""
+
+    def __init__(self, max_size, target_handler):
+        # The queue itself is unbounded so the listener's stop sentinel always
+        # fits; the limit is enforced in enqueue().
+        super().__init__(queue.Queue())
+        self.max_size = max_size
+        self.dropped = 0
+        self._target = target_handler
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        # Threads do not survive fork(), so each process starts its own listener.
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self.queue = queue.Queue()
+                self._listener = logging.handlers.QueueListener(self.queue, self._target, respect_handler_level=True)
+                self._listener.start()
+                self._pid = os.getpid()
+
+    def prepare(self, record):
+        # Like the stdlib QueueHandler: merge args into the message on the
+        # calling thread, while they still hold the values being logged, and
+        # work on a copy so other handlers see the original record.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                record.__dict__[key] = _snapshot(value)
+        return record
+
+    def emit(self, record):
+        # Check the limit before prepare() so dropped records cost nothing.
+        if self._pid == os.getpid() and self.queue.qsize() >= self.max_size:
+            self.dropped += 1
+            return
+        super().emit(record)
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        if self.queue.qsize() >= self.max_size:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
+
+    def stop(self):
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._pid = None
+
+
+class _TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s [%(name)s] %(message)s")
+
+
+_handler = None
+_configure_lock = threading.Lock()
+
+
+def configure_logging(level: str = None, fmt: str = None):
+    """Installs the queue handler on the "aura" logger once per process (idempotent)."""
+    global _handler
+    if _handler is not None:
+        return
+    with _configure_lock:
+        if _handler is not None:
+            return
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(_TextFormatter() if (fmt or LOG_FORMAT) == "text" else JsonFormatter())
+        handler = _NonBlockingQueueHandler(LOG_QUEUE_SIZE, stream_handler)
+
+        logger = logging.getLogger(ROOT_LOGGER)
+        logger.setLevel(getattr(logging, level or LOG_LEVEL, logging.INFO))
+        logger.addHandler(handler)
+        logger.propagate = False
+        atexit.register(handler.stop)  # Flush queued records on shutdown
+        _handler = handler
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger for one backend module, e.g. get_logger("predictor") -> "aura.predictor"."""
+    configure_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def get_logging_stats() -> dict:
+    """Queue depth and the number of records dropped because the queue was full."""
+    if _handler is None:
+        return {"configured": False}
+    return {"configured": True, "queue_depth": _handler.queue.qsize(), "dropped": _handler.dropped, "level": LOG_LEVEL}
@@ -0,0 +1,113 @@
+# file: micro_batcher.py
+#
+# Cross-request micro-batching. Callers submit one work item and block; a
+# single background thread collects whatever arrives within a short window
+# (or until max_batch items), groups the items by key, and runs each group
+# through `run_batch` once. Each caller then receives its own result.
+# Callers wait at most `timeout` seconds, so a stalled or dead batching
+# thread cannot hang request threads; a dead thread is restarted.
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from logging_config import get_logger
+
+logger = get_logger("micro_batcher")
+
+
+class MicroBatcher:
+
+    def __init__(self, run_batch, window_ms: float = 3.0, max_batch: int = 32):
+        # run_batch(key, [payload, ...]) -> [result, ...] in the same order
+        self._run_batch = run_batch
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = None
+        self._worker = None
+        self._worker_pid = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"batches": 0, "items": 0, "max_batch_size": 0, "max_queue_depth": 0, "timeouts": 0, "restarts": 0}
+
+    def _ensure_worker(self):
+        # Threads do not survive fork(), so each worker process starts its own.
+        if self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker_pid != os.getpid():
+                self._queue = queue.Queue()
+            elif self._worker.is_alive():
+                return
+            else:
+                logger.error("Micro-batcher thread died; restarting it.")
+                with self._stats_lock:
+                    self._stats["restarts"] += 1
+            self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+            self._worker.start()
+            self._worker_pid = os.getpid()
+
+    def submit(self, key, payload, timeout: float = None):
+        """
+        Queues one item and blocks until its batch has run. Raises
+        TimeoutError after `timeout` seconds; the item is then dropped if
+        its batch has not started, and the caller should compute it itself.
+        """
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((key, payload, future))
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            if depth > self._stats["max_queue_depth"]:
+                self._stats["max_queue_depth"] = depth
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            with self._stats_lock:
+                self._stats["timeouts"] += 1
+            raise TimeoutError(f"micro-batch result not ready after {timeout}s") from None
+
+    def _collect(self):
+        first = self._queue.get()
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            groups = {}
+            for key, payload, future in batch:
+                if future.set_running_or_notify_cancel():  # False: its caller timed out
+                    groups.setdefault(key, []).append((payload, future))
+            for key, items in groups.items():
+                try:
+                    results = self._run_batch(key, [payload for payload, _ in items])
+                    for (_, future), result in zip(items, results):
+                        future.set_result(result)
+                except Exception as e:
+                    for _, future in items:
+                        future.set_exception(e)
+            with self._stats_lock:
+                self._stats["batches"] += 1
+                self._stats["items"] += len(batch)
+                self._stats["max_batch_size"] = max(self._stats["max_batch_size"], len(batch))
+
+    def snapshot(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize() if self._queue is not None else 0
+        stats["mean_batch_size"] = round(stats["items"] / stats["batches"], 2) if stats["batches"] else 0.0
+        stats["window_ms"] = self.window * 1000.0
+        stats["max_batch"] = self.max_batch
+        return stats
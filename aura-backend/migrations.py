@@ -0,0 +1,250 @@
+# file: migrations.py
+#
+# Versioned schema migrations. Each migration runs in its own transaction
+# under an advisory lock and is recorded in `schema_migrations`, so running
+# this module repeatedly (or from several workers at once) is safe.
+#
+#   python migrations.py            -> apply pending migrations
+#   python migrations.py maintain   -> create upcoming glucose partitions (cron)
+
+import sys
+from datetime import datetime, timezone
+from database import db_connection
+from config import GLUCOSE_PARTITIONING, GLUCOSE_PARTITION_MONTHS_AHEAD
+from logging_config import get_logger
+
+logger = get_logger("migrations")
+
+# Arbitrary constant shared by every process that runs migrations.
+MIGRATION_LOCK_KEY = 7314001
+
+
+def _add_event_indexes(cur):
+    # The dashboard, health score and recent-readings queries all filter on
+    # (user_id, recent timestamp); INCLUDE lets the glucose ones run index-only.
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_glucose_readings_user_ts
+        ON glucose_readings (user_id, timestamp DESC) INCLUDE (glucose_value);
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_meal_logs_user_ts
+        ON meal_logs (user_id, timestamp DESC);
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_insulin_doses_user_ts
+        ON insulin_doses (user_id, timestamp DESC);
+    """)
+
+
+def _partition_glucose_readings(cur):
+    """
+    Rebuilds glucose_readings as a table range-partitioned by month.
+
+    The copy runs in this migration's single transaction, holding the
+    migration lock and an exclusive lock on glucose_readings until every row
+    is rewritten, so writes to the table wait for the whole copy. When
+    GLUCOSE_PARTITIONING is switched on after later migrations were applied,
+    this one runs after them; it only touches glucose_readings, so that
+    order is safe.
+    """
+    if _is_partitioned(cur, "glucose_readings"):
+        return
+
+    cur.execute("ALTER TABLE glucose_readings RENAME TO glucose_readings_unpartitioned;")
+    cur.execute("ALTER INDEX IF EXISTS idx_glucose_readings_user_ts RENAME TO idx_glucose_readings_unpartitioned_user_ts;")
+    cur.execute("""
+        CREATE TABLE glucose_readings (
+            id INTEGER NOT NULL DEFAULT nextval('glucose_readings_id_seq'),
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+            glucose_value REAL NOT NULL,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp);
+    """)
+    cur.execute("ALTER SEQUENCE glucose_readings_id_seq OWNED BY glucose_readings.id;")
+    cur.execute("""
+        CREATE INDEX idx_glucose_readings_user_ts
+        ON glucose_readings (user_id, timestamp DESC) INCLUDE (glucose_value);
+    """)
+    # Anything outside the monthly partitions (e.g. backfilled history) lands here.
+    cur.execute("CREATE TABLE glucose_readings_default PARTITION OF glucose_readings DEFAULT;")
+
+    # Create a partition for every month that already holds data, then copy.
+    cur.execute("SELECT MIN(timestamp), MAX(timestamp) FROM glucose_readings_unpartitioned;")
+    first_ts, last_ts = cur.fetchone()
+    now = datetime.now(timezone.utc)
+    start = _month_start(first_ts or now)
+    end = _add_months(_month_start(max(last_ts or now, now)), GLUCOSE_PARTITION_MONTHS_AHEAD)
+    month = start
+    while month <= end:
+        _create_month_partition(cur, month)
+        month = _add_months(month, 1)
+
+    cur.execute("""
+        INSERT INTO glucose_readings (id, user_id, timestamp, glucose_value)
+        SELECT id, user_id, timestamp, glucose_value FROM glucose_readings_unpartitioned;
+    """)
+    logger.info("Copied %d glucose readings into monthly partitions", cur.rowcount)
+    cur.execute("DROP TABLE glucose_readings_unpartitioned;")
+
+
+def _add_training_jobs(cur):
+    # One row per calibration request. The partial unique index allows at most
+    # one queued/running job per user, which is what deduplicates requests
+    # across every web worker.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS training_jobs (
+            id UUID PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            status VARCHAR(16) NOT NULL,
+            progress REAL NOT NULL DEFAULT 0,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+            started_at TIMESTAMP WITH TIME ZONE,
+            finished_at TIMESTAMP WITH TIME ZONE,
+            updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+            val_loss REAL,
+            error TEXT
+        );
+    """)
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_training_jobs_one_active_per_user
+        ON training_jobs (user_id) WHERE status IN ('queued', 'running');
+    """)
+
+
+def _add_training_job_mode_and_result(cur):
+    cur.execute("ALTER TABLE training_jobs ADD COLUMN IF NOT EXISTS mode VARCHAR(16) NOT NULL DEFAULT 'incremental';")
+    cur.execute("ALTER TABLE training_jobs ADD COLUMN IF NOT EXISTS result JSONB;")
+
+
+# (version, name, apply function, enabled?) -- never edit or reorder applied entries.
+MIGRATIONS = [
+    (1, "event_table_user_timestamp_indexes", _add_event_indexes, lambda: True),
+    (2, "partition_glucose_readings_by_month", _partition_glucose_readings, lambda: GLUCOSE_PARTITIONING),
+    (3, "training_jobs", _add_training_jobs, lambda: True),
+    (4, "training_job_mode_and_result", _add_training_job_mode_and_result, lambda: True),
+]
+
+
+def _is_partitioned(cur, table: str) -> bool:
+    cur.execute(
+        """
+        SELECT 1 FROM pg_partitioned_table p
+        JOIN pg_class c ON c.oid = p.partrelid
+        WHERE c.relname = %s AND pg_table_is_visible(c.oid);
+        """,
+        (table,)
+    )
+    return cur.fetchone() is not None
+
+
+def _month_start(ts: datetime) -> datetime:
+    ts = ts.astimezone(timezone.utc)
+    return datetime(ts.year, ts.month, 1, tzinfo=timezone.utc)
+
+
+def _add_months(month: datetime, count: int) -> datetime:
+    index = month.year * 12 + (month.month - 1) + count
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def _create_month_partition(cur, month: datetime):
+    name = f"glucose_readings_p{month:%Y%m}"
+    bounds = (month, _add_months(month, 1))
+    cur.execute("SELECT to_regclass(%s);", (name,))
+    if cur.fetchone()[0] is not None:
+        return
+    cur.execute(
+        "SELECT 1 FROM glucose_readings_default WHERE timestamp >= %s AND timestamp < %s LIMIT 1;",
+        bounds
+    )
+    if cur.fetchone() is None:
+        cur.execute(
+            f"CREATE TABLE {name} PARTITION OF glucose_readings FOR VALUES FROM (%s) TO (%s);",
+            bounds
+        )
+        return
+
+    # The month already has rows in the default partition (e.g. a missed
+    # `maintain` run), where Postgres refuses to create its partition. Move
+    # them into a standalone table, then attach it as the month's partition.
+    cur.execute(f"CREATE TABLE {name} (LIKE glucose_readings INCLUDING DEFAULTS);")
+    cur.execute(
+        f"""
+        WITH moved AS (
+            DELETE FROM glucose_readings_default WHERE timestamp >= %s AND timestamp < %s
+            RETURNING id, user_id, timestamp, glucose_value
+        )
+        INSERT INTO {name} (id, user_id, timestamp, glucose_value) SELECT * FROM moved;
+        """,
+        bounds
+    )
+    logger.warning("Moved %d readings for %s out of glucose_readings_default", cur.rowcount, f"{month:%Y-%m}")
+    cur.execute(
+        f"ALTER TABLE glucose_readings ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s);",
+        bounds
+    )
+
+
+def ensure_glucose_partitions(months_ahead: int = GLUCOSE_PARTITION_MONTHS_AHEAD) -> int:
+    """
+    Makes sure monthly partitions exist from the current month up to
+    `months_ahead` months in the future. No-op on an unpartitioned table.
+    Returns the number of months checked.
+    """
+    with db_connection() as conn:
+        cur = conn.cursor()
+        # Serialized with migrations and with other `maintain` runs.
+        cur.execute("SELECT pg_advisory_xact_lock(%s);", (MIGRATION_LOCK_KEY,))
+        if not _is_partitioned(cur, "glucose_readings"):
+            cur.close()
+            return 0
+        month = _month_start(datetime.now(timezone.utc))
+        for _ in range(months_ahead + 1):
+            _create_month_partition(cur, month)
+            month = _add_months(month, 1)
+        cur.close()
+    return months_ahead + 1
+
+
+def run_migrations() -> list:
+    """Applies every pending, enabled migration in version order."""
+    applied_now = []
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name VARCHAR(200) NOT NULL,
+                applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        cur.close()
+
+    for version, name, apply, enabled in MIGRATIONS:
+        if not enabled():
+            continue
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT pg_advisory_xact_lock(%s);", (MIGRATION_LOCK_KEY,))
+            cur.execute("SELECT 1 FROM schema_migrations WHERE version = %s;", (version,))
+            if cur.fetchone() is None:
+                logger.info("Applying migration %04d_%s", version, name)
+                apply(cur)
+                cur.execute(
+                    "INSERT INTO schema_migrations (version, name) VALUES (%s, %s);",
+                    (version, name)
+                )
+                applied_now.append(version)
+            cur.close()
+
+    ensure_glucose_partitions()
+    return applied_now
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == "maintain":
+        print(f"Checked {ensure_glucose_partitions()} monthly glucose partitions.")
+    else:
+        applied = run_migrations()
+        print(f"Applied migrations: {applied or 'none (schema is up to date)'}")
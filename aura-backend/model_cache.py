@@ -0,0 +1,155 @@
+# file: model_cache.py
+#
+# Bounded LRU cache for (model, scaler) pairs loaded from disk.
+# Each entry remembers the mtime/size of both files it was loaded from; when
+# either changes (e.g. after a recalibration) the first request to notice
+# reloads the pair and swaps it in atomically. Until the new pair has loaded
+# successfully, the previous one keeps being served. Files that never change
+# (model registry bundles) are looked up by their known version instead,
+# without touching the filesystem. For the others (the shared default model)
+# the stat result is reused for `stat_ttl` seconds, so a request served by
+# the default model does not stat two files every time.
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class ModelEntry:
+    """One loaded model/scaler pair and the file version it came from."""
+
+    __slots__ = ("model_path", "scaler_path", "model", "scaler", "version", "size_bytes", "rollout")
+
+    def __init__(self, model_path, scaler_path, model, scaler, version, size_bytes):
+        self.model_path = model_path
+        self.scaler_path = scaler_path
+        self.model = model
+        self.scaler = scaler
+        self.version = version
+        self.size_bytes = size_bytes
+        self.rollout = None  # Compiled forecast function, built on first use
+
+
+def file_version(*paths) -> tuple:
+    """(mtime_ns, size) for each path; raises OSError if any is missing."""
+    version = []
+    for path in paths:
+        st = os.stat(path)
+        version.append((st.st_mtime_ns, st.st_size))
+    return tuple(version)
+
+
+def estimate_model_bytes(model, model_path: str) -> int:
+    """Rough resident size: float32 weights if the model can tell us, else file size."""
+    count_params = getattr(model, "count_params", None)
+    if callable(count_params):
+        try:
+            return int(count_params()) * 4
+        except Exception:
+            pass
+    return os.path.getsize(model_path)
+
+
+class ModelCache:
+    """
+    LRU keyed by (model_path, scaler_path), bounded by entry count and by the
+    estimated bytes of the loaded models. Pinned keys (the shared default
+    model) are never evicted.
+    """
+
+    def __init__(self, loader, max_entries: int = 8, max_bytes: int = 256 * 1024 * 1024, stat_ttl: float = 0.0):
+        self._loader = loader  # (model_path, scaler_path) -> (model, scaler)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stat_ttl = stat_ttl
+        self._checked = {}  # key -> (recheck_at, file version)
+        self._entries = OrderedDict()
+        self._pinned = set()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self.stats = {"hits": 0, "misses": 0, "reloads": 0, "evictions": 0, "load_errors": 0}
+
+    def pin(self, model_path: str, scaler_path: str):
+        with self._lock:
+            self._pinned.add((model_path, scaler_path))
+
+    def get(self, model_path: str, scaler_path: str, version=None) -> ModelEntry:
+        """`version`: the known version of immutable files; skips the stat calls."""
+        key = (model_path, scaler_path)
+        immutable = version is not None
+        if not immutable:
+            version = self._current_version(key)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Only one thread loads a given key; the others wait and reuse its result.
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry.version == version:
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return entry
+                stale = entry
+                self.stats["reloads" if stale is not None else "misses"] += 1
+
+            try:
+                model, scaler = self._loader(model_path, scaler_path)
+                # Re-stat after loading: if the files changed mid-read, record the
+                # older version so the next request triggers another reload.
+                loaded_version = version if immutable or file_version(model_path, scaler_path) == version else None
+            except Exception:
+                with self._lock:
+                    self.stats["load_errors"] += 1
+                if stale is not None:
+                    return stale  # Keep serving the last good pair.
+                raise
+
+            new_entry = ModelEntry(
+                model_path, scaler_path, model, scaler, loaded_version,
+                estimate_model_bytes(model, model_path),
+            )
+            with self._lock:
+                self._entries[key] = new_entry
+                self._entries.move_to_end(key)
+                self._evict_locked()
+            return new_entry
+
+    def _current_version(self, key: tuple) -> tuple:
+        checked = self._checked.get(key)
+        now = time.monotonic()
+        if checked is not None and now < checked[0]:
+            return checked[1]
+        version = file_version(*key)
+        if self.stat_ttl > 0:
+            self._checked[key] = (now + self.stat_ttl, version)
+        return version
+
+    def _evict_locked(self):
+        total = sum(e.size_bytes for e in self._entries.values())
+        for key in list(self._entries):
+            if len(self._entries) <= self.max_entries and total <= self.max_bytes:
+                break
+            if key in self._pinned:
+                continue
+            total -= self._entries.pop(key).size_bytes
+            self._load_locks.pop(key, None)
+            self._checked.pop(key, None)
+            self.stats["evictions"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "bytes": sum(e.size_bytes for e in self._entries.values()),
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
@@ -0,0 +1,297 @@
+# file: model_registry.py
+#
+# Versioned store for personalized (model, scaler) bundles:
+#
+#   model_registry/
+#     index.json                 {"users": {"<id>": "<version>"}}, the pointer index
+#     users/<id>/manifest.json   published versions, newest last, with calibration state
+#                                (or only "state" while the user has no model of their own)
+#     users/<id>/<version>/      model.h5 + scaler.gz, never modified once published
+#
+# A version is the content hash of its bundle, so a model always travels with
+# the scaler it was trained with. Publishing writes the bundle under a
+# temporary name, renames it into place and then swaps the manifest and the
+# index with os.replace: readers see the old version or the new one, never a
+# half-written file or a mixed pair. Rollback only moves the pointer back.
+#
+# Serving workers keep the index in memory and re-read it only when it
+# changes (checked at most every MODEL_REGISTRY_REFRESH_SECONDS), so finding
+# a user's model is a dict lookup instead of filesystem stats per request.
+# Because a worker may still resolve (and then load) a version for a while
+# after it stops being current, retired bundles stay on disk for
+# MODEL_REGISTRY_RETIRE_SECONDS (at least two refresh intervals) before a
+# later publish deletes them.
+#
+#   python model_registry.py list <user_id>
+#   python model_registry.py rollback <user_id>
+#   python model_registry.py import-legacy   # glucose_predictor_user_<id>.h5 + scaler_user_<id>.gz
+
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from logging_config import get_logger
+
+logger = get_logger("model_registry")
+
+MODEL_REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", "model_registry")
+MODEL_REGISTRY_REFRESH_SECONDS = float(os.getenv("MODEL_REGISTRY_REFRESH_SECONDS", "2"))
+MODEL_REGISTRY_KEEP_VERSIONS = int(os.getenv("MODEL_REGISTRY_KEEP_VERSIONS", "5"))
+MODEL_REGISTRY_RETIRE_SECONDS = float(os.getenv("MODEL_REGISTRY_RETIRE_SECONDS", "60"))
+
+MODEL_FILE = "model.h5"
+SCALER_FILE = "scaler.gz"
+_LEGACY_MODEL = re.compile(r"^glucose_predictor_user_(\d+)\.h5$")
+
+
+def _bundle_hash(bundle_dir: str) -> str:
+    digest = hashlib.sha256()
+    for name in (MODEL_FILE, SCALER_FILE):
+        with open(os.path.join(bundle_dir, name), "rb") as f:
+            data = f.read()
+        digest.update(len(data).to_bytes(8, "little"))
+        digest.update(data)
+    return digest.hexdigest()[:16]
+
+
+def _read_json(path: str, default: dict) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def _write_json(path: str, data: dict):
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class ModelRegistry:
+    """Publishes, resolves and rolls back per-user model bundles under `root`."""
+
+    def __init__(self, root: str, refresh_seconds: float = 2.0, keep_versions: int = 5, retire_seconds: float = 60.0):
+        self.root = root
+        self.refresh_seconds = refresh_seconds
+        self.keep_versions = max(1, keep_versions)
+        self.retire_seconds = max(retire_seconds, 2 * refresh_seconds)
+        self._index_path = os.path.join(root, "index.json")
+        self._pointers = {}  # user_id -> (model_path, scaler_path, version)
+        self._index_stamp = None
+        self._next_refresh = 0.0
+        self._refresh_lock = threading.Lock()
+
+    # --- Serving (hot path) ---
+
+    def current(self, user_id: int):
+        """(model_path, scaler_path, version) of the user's published model, or None."""
+        if time.monotonic() >= self._next_refresh:
+            self._refresh()
+        return self._pointers.get(user_id)
+
+    def _refresh(self):
+        with self._refresh_lock:
+            now = time.monotonic()
+            if now < self._next_refresh:
+                return
+            self._next_refresh = now + self.refresh_seconds
+            try:
+                st = os.stat(self._index_path)
+                stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+            except FileNotFoundError:
+                stamp = None
+            if stamp != self._index_stamp:
+                index = _read_json(self._index_path, {"users": {}}) if stamp else {"users": {}}
+                self._load_pointers(index)
+                self._index_stamp = stamp
+
+    def _load_pointers(self, index: dict):
+        # Swapped in as a whole, so lock-free readers see the old or the new map.
+        self._pointers = {int(user_id): self._bundle(int(user_id), version) for user_id, version in index["users"].items()}
+
+    def _bundle(self, user_id: int, version: str) -> tuple:
+        bundle_dir = os.path.join(self._user_dir(user_id), version)
+        return os.path.join(bundle_dir, MODEL_FILE), os.path.join(bundle_dir, SCALER_FILE), version
+
+    # --- Publishing ---
+
+    def _user_dir(self, user_id: int) -> str:
+        return os.path.join(self.root, "users", str(user_id))
+
+    def _manifest_path(self, user_id: int) -> str:
+        return os.path.join(self._user_dir(user_id), "manifest.json")
+
+    @contextmanager
+    def _locked(self):
+        # One writer at a time across processes (training pool, nightly job, CLI).
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _set_pointer_locked(self, user_id: int, version):
+        index = _read_json(self._index_path, {"users": {}})
+        if version is None:
+            index["users"].pop(str(user_id), None)
+        else:
+            index["users"][str(user_id)] = version
+        _write_json(self._index_path, index)
+        # This process sees its own publish immediately; others on their next refresh.
+        self._load_pointers(index)
+
+    def manifest(self, user_id: int) -> dict:
+        """
+        {"versions": [{"version", "published_at", "state"}, ...]}, newest (current)
+        last; with no versions, a "state" key may hold the state set by update_state.
+        """
+        return _read_json(self._manifest_path(user_id), {"versions": []})
+
+    def latest(self, user_id: int):
+        """The current version's manifest entry plus "model_path"/"scaler_path", or None."""
+        versions = self.manifest(user_id)["versions"]
+        if not versions:
+            return None
+        model_path, scaler_path, _ = self._bundle(user_id, versions[-1]["version"])
+        return {**versions[-1], "model_path": model_path, "scaler_path": scaler_path}
+
+    def publish(self, user_id: int, write_model, write_scaler, state: dict = None) -> str:
+        """
+        Stores a new bundle and makes it the user's current model.
+        `write_model(path)` / `write_scaler(path)` save the files; `state`
+        (e.g. the calibration watermark) is kept with this version. Returns the version.
+        """
+        user_dir = self._user_dir(user_id)
+        os.makedirs(user_dir, exist_ok=True)
+        tmp_dir = os.path.join(user_dir, f".tmp-{os.getpid()}-{uuid.uuid4().hex[:8]}")
+        os.makedirs(tmp_dir)
+        try:
+            write_model(os.path.join(tmp_dir, MODEL_FILE))
+            write_scaler(os.path.join(tmp_dir, SCALER_FILE))
+            version = _bundle_hash(tmp_dir)
+            with self._locked():
+                if not os.path.isdir(os.path.join(user_dir, version)):
+                    os.rename(tmp_dir, os.path.join(user_dir, version))
+                versions = [v for v in self.manifest(user_id)["versions"] if v["version"] != version]
+                versions.append({"version": version, "published_at": datetime.now().astimezone().isoformat(), "state": state or {}})
+                self._retire_locked(user_id, versions[:-self.keep_versions])
+                versions = versions[-self.keep_versions:]
+                _write_json(self._manifest_path(user_id), {"versions": versions})
+                self._set_pointer_locked(user_id, version)
+                self._prune_locked(user_id, {v["version"] for v in versions})
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        logger.info("Published model %s for user %s", version, user_id)
+        return version
+
+    def update_state(self, user_id: int, state: dict):
+        """
+        Replaces the current version's state without publishing a new bundle.
+        A user without a version keeps the state on its own (they go on being
+        served the population model); the next publish supersedes it.
+        """
+        with self._locked():
+            versions = self.manifest(user_id)["versions"]
+            if versions:
+                versions[-1]["state"] = state
+                manifest = {"versions": versions}
+            else:
+                os.makedirs(self._user_dir(user_id), exist_ok=True)
+                manifest = {"versions": [], "state": state}
+            _write_json(self._manifest_path(user_id), manifest)
+
+    def state(self, user_id: int) -> dict:
+        """The current version's state, or the state stored without a version ({} if none)."""
+        manifest = self.manifest(user_id)
+        return manifest["versions"][-1]["state"] if manifest["versions"] else manifest.get("state", {})
+
+    def rollback(self, user_id: int):
+        """
+        Drops the user's current version and serves the previous one again
+        (or the population model if it was the only one). Returns the new
+        current version or None.
+        """
+        with self._locked():
+            versions = self.manifest(user_id)["versions"]
+            if not versions:
+                raise LookupError(f"User {user_id} has no published model")
+            dropped = versions.pop()
+            _write_json(self._manifest_path(user_id), {"versions": versions})
+            current = versions[-1]["version"] if versions else None
+            self._set_pointer_locked(user_id, current)
+            self._retire_locked(user_id, [dropped])
+        logger.info("Rolled back user %s from %s to %s", user_id, dropped["version"], current or "the population model")
+        return current
+
+    def _retire_locked(self, user_id: int, entries: list):
+        # The bundle's mtime marks when it left the manifest; see _prune_locked.
+        for entry in entries:
+            try:
+                os.utime(os.path.join(self._user_dir(user_id), entry["version"]))
+            except FileNotFoundError:
+                pass
+
+    def _prune_locked(self, user_id: int, keep: set):
+        # Other workers may resolve a retired version until their next index
+        # refresh and then still be loading it, so it outlives retire_seconds.
+        user_dir = self._user_dir(user_id)
+        retired_before = time.time() - self.retire_seconds
+        for name in os.listdir(user_dir):
+            path = os.path.join(user_dir, name)
+            if os.path.isdir(path) and name not in keep and not name.startswith(".") and os.path.getmtime(path) < retired_before:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def import_legacy(self, directory: str = ".") -> list:
+        """Publishes glucose_predictor_user_<id>.h5 + scaler_user_<id>.gz pairs for users not in the registry yet."""
+        imported = []
+        for name in sorted(os.listdir(directory)):
+            match = _LEGACY_MODEL.match(name)
+            if not match:
+                continue
+            user_id = int(match.group(1))
+            scaler_path = os.path.join(directory, f"scaler_user_{user_id}.gz")
+            if not os.path.exists(scaler_path) or self.manifest(user_id)["versions"]:
+                continue
+            state = _read_json(os.path.join(directory, f"calibration_user_{user_id}.json"), {})
+            self.publish(
+                user_id,
+                lambda p: shutil.copyfile(os.path.join(directory, name), p),
+                lambda p: shutil.copyfile(scaler_path, p),
+                state,
+            )
+            imported.append(user_id)
+        return imported
+
+
+REGISTRY = ModelRegistry(MODEL_REGISTRY_DIR, MODEL_REGISTRY_REFRESH_SECONDS, MODEL_REGISTRY_KEEP_VERSIONS, MODEL_REGISTRY_RETIRE_SECONDS)
+
+
+if __name__ == '__main__':
+    command, args = (sys.argv[1], sys.argv[2:]) if len(sys.argv) > 1 else (None, [])
+    if command == "list" and len(args) == 1:
+        user_id = int(args[0])
+        for entry in REGISTRY.manifest(user_id)["versions"]:
+            print(f"{entry['version']}  {entry['published_at']}  {json.dumps(entry['state'])}")
+    elif command == "rollback" and len(args) == 1:
+        print(f"User {args[0]} now serves: {REGISTRY.rollback(int(args[0])) or 'the population model'}")
+    elif command == "import-legacy" and len(args) <= 1:
+        print(f"Imported users: {REGISTRY.import_legacy(*args)}")
+    else:
+        print("Usage: python model_registry.py list <user_id> | rollback <user_id> | import-legacy [directory]")
+        sys.exit(2)
@@ -1,61 +1,205 @@
 # file: model_trainer.py
+#
+# Per-user calibration of the glucose predictor. Two modes:
+#   incremental (default) -- warm-starts from the user's current model (or the
+#       population glucose_predictor.h5), keeps that model's scaler, and trains
+#       only on readings newer than the user's watermark, so it takes seconds
+#       and can run nightly for every user.
+#   full -- fits a new scaler and a new LSTM from scratch on the whole history.
+# Both hold out the most recent readings and stop early once they stop helping.
+# Results are published to the model registry (model_registry.py) as a new
+# model+scaler version; the watermark is stored with that version (or on its
+# own when the population model is kept, so the same readings are not retried).
 
-import pandas as pd
+from datetime import datetime, timedelta, timezone
 import numpy as np
-from sklearn.preprocessing import MinMaxScaler
-from keras.models import Sequential
-from keras.layers import LSTM, Dense
 import joblib
-import os
 import database as db
+from prediction_service import DEFAULT_MODEL_PATH, DEFAULT_SCALER_PATH, LOOK_BACK
+from model_registry import REGISTRY
+from sequence_windows import sliding_windows, WindowBatches
+from logging_config import get_logger
 
-def create_sequences(dataset, look_back=12):
-    dataX, dataY = [], []
-    for i in range(len(dataset) - look_back - 1):
-        a = dataset[i:(i + look_back), 0]
-        dataX.append(a)
-        dataY.append(dataset[i + look_back, 0])
-    return np.array(dataX), np.array(dataY)
+logger = get_logger("trainer")
 
-def fine_tune_model_for_user(user_id: int):
+MIN_TRAINING_READINGS = 200  # Need a minimum amount of data to train
+MIN_NEW_READINGS = 48        # 4 hours of CGM data before an incremental update is worthwhile
+FULL_TRAINING_EPOCHS = 5
+INCREMENTAL_MAX_EPOCHS = 20
+INCREMENTAL_LEARNING_RATE = 1e-4  # Small steps: adapt the model, don't overwrite it
+EARLY_STOPPING_PATIENCE = 2
+VALIDATION_SPLIT = 0.1  # The most recent 10% of sequences are held out
+BATCH_SIZE = 32
+
+def load_calibration_state(user_id: int) -> dict:
+    """The user's watermark and last-calibration summary ({} if never calibrated)."""
+    return REGISTRY.state(user_id)
+
+def _save_calibration(user_id: int, model, scaler, state: dict):
+    """
+    Publishes model+scaler as the user's new version. Model None only updates
+    the state; returns the current version (None while on the population model).
+    """
+    if model is None:
+        REGISTRY.update_state(user_id, state)
+        current = REGISTRY.latest(user_id)
+        return current["version"] if current else None
+    return REGISTRY.publish(user_id, model.save, lambda p: joblib.dump(scaler, p), state)
+
+def release_training_memory():
+    """Drops Keras' global graph state so a reused training process does not grow job by job."""
+    import sys
+    if "keras" in sys.modules:  # Nothing to release if no job got as far as training
+        import gc
+        from keras.backend import clear_session
+        clear_session()
+        gc.collect()
+
+def _as_datetime64(moment: datetime) -> np.datetime64:
+    """Aware datetime -> naive UTC datetime64[us], the form load_glucose_history returns."""
+    return np.datetime64(moment.astimezone(timezone.utc).replace(tzinfo=None), "us")
+
+def _holdout_batches(dataset) -> tuple:
+    """(shuffled training batches, held-out tail batches) streamed from window views of `dataset`."""
+    inputs, targets = sliding_windows(dataset, LOOK_BACK)
+    split_at = min(max(1, int(len(inputs) * (1 - VALIDATION_SPLIT))), len(inputs) - 1)
+    return (
+        _keras_batches(WindowBatches(inputs, targets, BATCH_SIZE, stop=split_at, shuffle=True)),
+        _keras_batches(WindowBatches(inputs, targets, BATCH_SIZE, start=split_at)),
+    )
+
+def _keras_batches(batches: WindowBatches):
+    # Keras only streams from its own dataset type; this one just delegates.
+    from keras.utils import PyDataset
+
+    class _WindowDataset(PyDataset):
+        def __len__(self):
+            return len(batches)
+
+        def __getitem__(self, index):
+            return batches[index]
+
+        def on_epoch_end(self):
+            batches.on_epoch_end()
+
+    return _WindowDataset()
+
+def _fit(model, train, validation, max_epochs: int, progress_callback):
+    """Trains with early stopping on the held-out tail. Returns (Keras history, cancelled?)."""
+    from keras.callbacks import EarlyStopping, LambdaCallback
+
+    cancelled = []
+    def on_epoch_end(epoch, logs):
+        if progress_callback is not None and progress_callback((epoch + 1) / max_epochs) is False:
+            cancelled.append(epoch)
+            model.stop_training = True
+
+    history = model.fit(
+        train, validation_data=validation, epochs=max_epochs, verbose=0,
+        callbacks=[
+            EarlyStopping(monitor="val_loss", patience=EARLY_STOPPING_PATIENCE, restore_best_weights=True),
+            LambdaCallback(on_epoch_end=on_epoch_end),
+        ]
+    )
+    return history, bool(cancelled)
+
+def fine_tune_model_for_user(user_id: int, progress_callback=None, mode: str = "incremental") -> dict:
     """
-    Fetches a user's entire glucose history and fine-tunes a new
-    prediction model specifically for them.
+    Fine-tunes the user's personalized prediction model ("incremental" or
+    "full", see above).
+
+    `progress_callback(fraction)` is called after every epoch and once more
+    right before publishing; returning False stops training without saving
+    anything. Returns a summary dict
+    with "status" ("succeeded", "up_to_date", "insufficient_data" or
+    "cancelled").
     """
-    print(f"--- [Trainer] Starting fine-tuning for user {user_id}... ---")
-    
-    # 1. Fetch all data for the user
-    glucose_history = db.get_recent_glucose_readings(user_id, limit=9999) # Get all data
-    
-    if len(glucose_history) < 200: # Need a minimum amount of data to train
-        print(f"--- [Trainer] User {user_id} has insufficient data ({len(glucose_history)} readings). Aborting. ---")
-        return
-
-    print(f"--- [Trainer] Fetched {len(glucose_history)} readings from database. ---")
-    
-    # 2. Preprocess the data (similar to Colab)
-    dataset = np.array(glucose_history).reshape(-1, 1).astype('float32')
-    scaler = MinMaxScaler(feature_range=(0, 1))
-    dataset = scaler.fit_transform(dataset)
-    
-    trainX, trainY = create_sequences(dataset)
-    trainX = np.reshape(trainX, (trainX.shape[0], trainX.shape[1], 1))
-
-    # 3. Build and train a new model
-    model = Sequential()
-    model.add(LSTM(16, input_shape=(trainX.shape[1], trainX.shape[2])))
-    model.add(Dense(1))
-    model.compile(loss='mean_squared_error', optimizer='adam')
-    
-    print(f"--- [Trainer] Training new model on user data... ---")
-    # In a real app, this might be more epochs, but 5 is fast for a demo.
-    model.fit(trainX, trainY, epochs=5, batch_size=32, verbose=0)
-    
-    # 4. Save the personalized model and scaler
-    user_model_path = f'glucose_predictor_user_{user_id}.h5'
-    user_scaler_path = f'scaler_user_{user_id}.gz'
-    
-    model.save(user_model_path)
-    joblib.dump(scaler, user_scaler_path)
-    
-    print(f"--- [Trainer] SUCCESS: Saved personalized model to {user_model_path} ---")
\ No newline at end of file
+    logger.info("Starting %s fine-tuning for user %s...", mode, user_id)
+    current = REGISTRY.latest(user_id)
+    has_user_model = current is not None
+    state = current["state"] if has_user_model else REGISTRY.state(user_id)
+    incremental = mode == "incremental"
+    watermark = datetime.fromisoformat(state["watermark"]) if incremental and state.get("watermark") else None
+
+    # 1. Stream the readings to learn from: the whole history, or (incremental)
+    # only those after the watermark plus look-back context. Postgres keeps
+    # microseconds, so +1us is "strictly after".
+    start = watermark + timedelta(microseconds=1) if watermark is not None else None
+    timestamps, glucose_history = db.load_glucose_history(user_id, start=start, context=LOOK_BACK)
+    new_readings = len(timestamps) if start is None else int(np.count_nonzero(timestamps > _as_datetime64(watermark)))
+
+    if watermark is None and len(glucose_history) < MIN_TRAINING_READINGS:
+        logger.warning("User %s has insufficient data (%d readings). Aborting.", user_id, len(glucose_history))
+        return {"status": "insufficient_data", "mode": mode, "readings": len(glucose_history)}
+    if watermark is not None and new_readings < MIN_NEW_READINGS:
+        logger.info("User %s has only %d new readings since %s. Nothing to do.", user_id, new_readings, watermark)
+        return {"status": "up_to_date", "mode": mode, "readings": new_readings}
+
+    logger.info("Fetched %d readings (%d new) from database.", len(glucose_history), new_readings)
+
+    # Heavy ML imports happen here, in the training process, not at app import.
+    from sklearn.preprocessing import MinMaxScaler
+    from keras.models import Sequential, load_model
+    from keras.layers import LSTM, Dense
+    from keras.optimizers import Adam
+
+    # 2. Start from the current model and its scaler, or from scratch
+    dataset = glucose_history.reshape(-1, 1)
+    if incremental:
+        base_model_path, base_scaler_path = (current["model_path"], current["scaler_path"]) if has_user_model else (DEFAULT_MODEL_PATH, DEFAULT_SCALER_PATH)
+        scaler = joblib.load(base_scaler_path)  # Stable scale: the model's inputs keep their meaning
+        model = load_model(base_model_path, compile=False)
+        model.compile(loss='mean_squared_error', optimizer=Adam(learning_rate=INCREMENTAL_LEARNING_RATE))
+        max_epochs = INCREMENTAL_MAX_EPOCHS
+    else:
+        base_model_path = None
+        scaler = MinMaxScaler(feature_range=(0, 1))
+        scaler.fit(dataset)
+        model = Sequential()
+        model.add(LSTM(16, input_shape=(LOOK_BACK, 1)))
+        model.add(Dense(1))
+        model.compile(loss='mean_squared_error', optimizer='adam')
+        max_epochs = FULL_TRAINING_EPOCHS
+    dataset = scaler.transform(dataset)
+
+    train, validation = _holdout_batches(dataset)
+    baseline_val_loss = float(model.evaluate(validation, verbose=0)) if incremental else None
+
+    # 3. Train until the held-out loss stops improving
+    logger.info("Training on user data (up to %d epochs)...", max_epochs)
+    history, cancelled = _fit(model, train, validation, max_epochs, progress_callback)
+    if cancelled:
+        logger.info("Training for user %s cancelled; nothing saved.", user_id)
+        return {"status": "cancelled", "mode": mode, "readings": new_readings}
+
+    val_loss = float(min(history.history["val_loss"]))
+    # A warm start that did not beat the model it started from is discarded.
+    kept_previous = baseline_val_loss is not None and val_loss >= baseline_val_loss
+    summary = {
+        "status": "succeeded",
+        "mode": mode,
+        "base_model": base_model_path,
+        "readings": new_readings,
+        "epochs": len(history.history["loss"]),
+        "val_loss": baseline_val_loss if kept_previous else val_loss,
+        "baseline_val_loss": baseline_val_loss,
+        "kept_previous": kept_previous,
+    }
+
+    # 4. Publish the personalized model and scaler, then advance the watermark,
+    # unless the job was cancelled after its last epoch
+    if progress_callback is not None and progress_callback(1.0) is False:
+        logger.info("Training for user %s cancelled before publishing; nothing saved.", user_id)
+        return {"status": "cancelled", "mode": mode, "readings": new_readings}
+    summary["version"] = _save_calibration(user_id, None if kept_previous else model, scaler, {
+        "watermark": np.datetime_as_string(timestamps[-1], unit="us") + "+00:00",
+        "calibrated_at": datetime.now().astimezone().isoformat(),
+        **{k: summary[k] for k in ("mode", "readings", "epochs", "val_loss")},
+    })
+    if kept_previous and not has_user_model:
+        logger.info("Fine-tuning did not improve on %s for user %s; keeping the population model.", base_model_path, user_id)
+    elif kept_previous:
+        logger.info("Fine-tuning did not improve the model for user %s (val_loss %.5f >= %.5f); kept it.", user_id, val_loss, baseline_val_loss)
+    else:
+        logger.info("Published personalized model %s for user %s (val_loss %.5f)", summary["version"], user_id, val_loss)
+    return summary
@@ -1,9 +1,17 @@
 # file: enhanced_natural_language_processor.py
+import os
 import re
 import json
+import threading
+import time
+from collections import OrderedDict
 from typing import Dict, List, Tuple, Optional
 from datetime import datetime, timedelta
 import math
+from text_matcher import AhoCorasick
+from logging_config import get_logger
+
+logger = get_logger("nlp")
 
 # --- Enhanced Food Database with Portions and Variations ---
 FOOD_CARB_DATABASE = {
@@ -95,14 +103,68 @@ TIME_KEYWORDS = {
 
 # (Keep all your database definitions at the top of the file the same)
 
+# Optional large food table compiled by food_index.py at deploy time. When the
+# directory exists it replaces FOOD_CARB_DATABASE for food matching (the index
+# includes the built-in foods too).
+FOOD_INDEX_PATH = os.getenv("FOOD_INDEX_PATH", "food_index")
+# Parsed results kept per processor, keyed by normalized text (0 disables)
+NLP_PARSE_CACHE_SIZE = int(os.getenv("NLP_PARSE_CACHE_SIZE", "4096"))
+_WORD_PATTERN = re.compile(r'\w+')
+
+# Fixed extraction patterns, compiled once at import
+_TRAILING_NUMBER_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*$')
+EXPLICIT_CARB_PATTERNS = [
+    re.compile(r'(\d+)\s*(?:g|grams?)\s*(?:of\s*)?carbs?'),
+    re.compile(r'(\d+)\s*carbs?\s*(?:g|grams?)'),
+    re.compile(r'(\d+)\s*(?:g|grams?)\s*carbohydrates?'),
+]
+# (pattern, minutes per unit), tried in order
+DURATION_PATTERNS = [
+    (re.compile(r'(\d+)\s*(?:minutes?|mins?)'), 1),
+    (re.compile(r'(\d+)\s*(?:hours?|hrs?)'), 60),
+    (re.compile(r'(\d+)\s*h'), 60),
+    (re.compile(r'(\d+)\s*m'), 1),
+]
+
+FOOD_INDEX_RETRY_SECONDS = 60
+
+_food_index = None
+_food_index_checked_at = None
+_food_index_lock = threading.Lock()
+
+def _get_food_index():
+    """
+    Memory-maps the food index once per process; None while there is no index.
+    A missing or unreadable index is looked for again every FOOD_INDEX_RETRY_SECONDS.
+    """
+    global _food_index, _food_index_checked_at
+    if _food_index is not None:
+        return _food_index
+    checked_at = _food_index_checked_at
+    if checked_at is not None and time.monotonic() - checked_at < FOOD_INDEX_RETRY_SECONDS:
+        return None
+    with _food_index_lock:
+        if _food_index is None and _food_index_checked_at == checked_at:
+            _food_index_checked_at = time.monotonic()
+            if FOOD_INDEX_PATH and os.path.isdir(FOOD_INDEX_PATH):
+                try:
+                    from food_index import FoodIndex
+                    _food_index = FoodIndex(FOOD_INDEX_PATH)
+                    logger.info("Using food index %s (%s foods, %d names).", FOOD_INDEX_PATH, _food_index.meta['foods'], len(_food_index))
+                except Exception as e:
+                    logger.warning("Could not open food index %s (%s). Using built-in foods.", FOOD_INDEX_PATH, e)
+    return _food_index
+
 class EnhancedNLPProcessor:
     """
     Advanced Natural Language Processor for diabetes management
     Handles complex food descriptions, quantities, activities, and timing
     """
     
-    def __init__(self):
+    def __init__(self, food_index=None, cache_size: int = None):
         self.food_db = FOOD_CARB_DATABASE
+        self._food_index = food_index  # None: the process-wide index, once it exists
+        self._resolved_food_index = None
         self.activity_db = ACTIVITY_DATABASE
         self.quantity_words = QUANTITY_WORDS
         self.time_keywords = TIME_KEYWORDS
@@ -112,6 +174,23 @@ class EnhancedNLPProcessor:
         # Sort food variations by length (longest first) to fix substring bugs
         self._sorted_food_keys = sorted(self.food_variations.keys(), key=len, reverse=True)
         self._build_variation_maps()
+        self._compile_keyword_patterns()
+        
+        # Bounded LRU of parse results; shared by all request threads
+        self.cache_size = NLP_PARSE_CACHE_SIZE if cache_size is None else cache_size
+        self._parse_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @property
+    def food_index(self):
+        index = self._food_index if self._food_index is not None else _get_food_index()
+        if index is not self._resolved_food_index:
+            # Parses cached without the index would keep its foods out
+            self._resolved_food_index = index
+            with self._cache_lock:
+                self._parse_cache.clear()
+        return index
 
     def _build_variation_maps(self):
         for food, data in self.food_db.items():
@@ -126,13 +205,113 @@ class EnhancedNLPProcessor:
         
         # ** FIX **: Sort the keys by length, descending. This is crucial.
         self._sorted_food_keys = sorted(self.food_variations.keys(), key=len, reverse=True)
+        
+        # One automaton per vocabulary, built once; a pattern's index is its priority.
+        self._food_matcher = AhoCorasick(self._sorted_food_keys)
+        self._activity_patterns = list(dict.fromkeys(
+            pattern
+            for activity, data in self.activity_db.items()
+            for pattern in [activity] + data.get("variations", [])
+        ))
+        self._activity_pattern_ids = {pattern: i for i, pattern in enumerate(self._activity_patterns)}
+        self._activity_matcher = AhoCorasick(self._activity_patterns)
+
+    def _compile_keyword_patterns(self):
+        # All quantity words in one alternation, anchored to the end of the
+        # window before a food (only the last word can match there).
+        words = sorted(self.quantity_words, key=len, reverse=True)
+        self._quantity_pattern = re.compile(r'\b(' + '|'.join(map(re.escape, words)) + r')\b\s*$')
+        
+        # Timing keywords: one scan reporting, at every position, the
+        # highest-priority keyword starting there (a zero-width lookahead, so
+        # overlapping keywords are all seen). Matching stays substring-based.
+        self._timing_keywords = list(self.time_keywords)
+        self._timing_priority = {keyword: i for i, keyword in enumerate(self._timing_keywords)}
+        self._timing_pattern = re.compile(
+            '(?=(' + '|'.join(map(re.escape, self._timing_keywords)) + '))'
+        )
 
     def parse_user_text(self, text: str) -> Dict:
         lower_text = text.lower().strip()
-        
+        entities = self._cache_get(lower_text)
+        if entities is None:
+            entities = self._parse_normalized(lower_text)
+            self._cache_put(lower_text, entities)
+        return self._result_for(entities, text)
+
+    def parse_many(self, texts: List[str], populate_cache: bool = False) -> List[Dict]:
+        """
+        Parses a batch (e.g. bulk re-parsing of historical meal descriptions).
+        Each distinct normalized text is parsed once per batch; results already
+        in the LRU are reused. By default the batch does not fill the LRU, so
+        a bulk job cannot evict the phrases live chat traffic keeps hitting.
+        """
+        parsed = {}
+        results = []
+        for text in texts:
+            lower_text = text.lower().strip()
+            entities = parsed.get(lower_text)
+            if entities is None:
+                entities = self._cache_get(lower_text)
+                if entities is None:
+                    entities = self._parse_normalized(lower_text)
+                    if populate_cache:
+                        self._cache_put(lower_text, entities)
+                parsed[lower_text] = entities
+            results.append(self._result_for(entities, text))
+        return results
+
+    def cache_stats(self) -> Dict:
+        """Hit/miss/eviction counters and current size of the parse cache."""
+        with self._cache_lock:
+            lookups = self._cache_stats["hits"] + self._cache_stats["misses"]
+            return {
+                **self._cache_stats,
+                "entries": len(self._parse_cache),
+                "max_entries": self.cache_size,
+                "hit_rate": round(self._cache_stats["hits"] / lookups, 4) if lookups else 0.0,
+            }
+
+    def clear_cache(self):
+        with self._cache_lock:
+            self._parse_cache.clear()
+
+    def _cache_get(self, key: str) -> Optional[Dict]:
+        if self.cache_size <= 0:
+            return None
+        with self._cache_lock:
+            entities = self._parse_cache.get(key)
+            if entities is None:
+                self._cache_stats["misses"] += 1
+                return None
+            self._parse_cache.move_to_end(key)
+            self._cache_stats["hits"] += 1
+            return entities
+
+    def _cache_put(self, key: str, entities: Dict):
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._parse_cache[key] = entities
+            self._parse_cache.move_to_end(key)
+            while len(self._parse_cache) > self.cache_size:
+                self._parse_cache.popitem(last=False)
+                self._cache_stats["evictions"] += 1
+
+    @staticmethod
+    def _result_for(entities: Dict, text: str) -> Dict:
+        """A private copy of a (possibly cached) parse, carrying the caller's original text."""
+        result = dict(entities)
+        for key in ("foods_detected", "activities_detected"):
+            result[key] = [dict(item) for item in entities[key]]
+        result["warnings"] = list(entities["warnings"])
+        result["original_text"] = text
+        return result
+
+    def _parse_normalized(self, lower_text: str) -> Dict:
         entities = {
             "carbs": 0, "foods_detected": [], "activities_detected": [], "timing": None,
-            "confidence": 0.0, "original_text": text, "warnings": [], "meal_type": None
+            "confidence": 0.0, "original_text": lower_text, "warnings": [], "meal_type": None
         }
         
         entities.update(self._extract_timing(lower_text))
@@ -157,84 +336,113 @@ class EnhancedNLPProcessor:
     def _extract_foods_with_quantities(self, text: str) -> Tuple[Dict, str]:
         foods_found = []
         total_carbs = 0
-        text_copy = " " + text + " " # Pad text for easier regex matching at edges
+        text_copy = " " + text + " " # Pad text for easier edge matching
 
-        for pattern in self._sorted_food_keys:
-            # Use regex to find whole words to avoid matching 'apple' in 'grapple'
-            pattern_regex = r'\b' + re.escape(pattern) + r'\b'
+        # Candidates are claimed in priority order (longest pattern first, then
+        # left to right); an occurrence overlapping one already claimed is skipped.
+        chars = list(text_copy)
+        claimed = bytearray(len(text_copy))
+        
+        for start_pos, end_pos, pattern, main_food_key, food_data in self._food_candidates(text_copy):
+            if claimed.find(1, start_pos, end_pos) != -1:
+                continue
+
+            # The quantity is read from the text as it stands at this point,
+            # with higher-priority foods already blocked out.
+            window_text = "".join(chars[max(0, start_pos - 20):start_pos])
+            quantity = self._find_quantity_near_food(window_text, len(window_text))
+            carbs = food_data["carbs_per_serving"] * quantity
+            
+            foods_found.append({
+                "food": main_food_key, "quantity": quantity, "carbs": carbs,
+                "serving_size": food_data["serving_size"], "matched_pattern": pattern
+            })
             
-            # Find all occurrences of the pattern in the text
-            for match in re.finditer(pattern_regex, text_copy):
-                start_pos = match.start()
-                
-                # Check if this position has already been processed
-                if text_copy[start_pos] == '#':
-                    continue
+            total_carbs += carbs
+            
+            # ** FIX **: "Block out" the matched food to prevent re-matching
+            chars[start_pos:end_pos] = "#" * (end_pos - start_pos)
+            claimed[start_pos:end_pos] = b"\x01" * (end_pos - start_pos)
+        
+        return {"foods": foods_found, "total_carbs": total_carbs}, "".join(chars)
 
+    def _food_candidates(self, text: str) -> List[Tuple]:
+        """Every whole-word food occurrence as (start, end, pattern, food name, food data), in claim order."""
+        if self.food_index is None:
+            # All occurrences of the built-in vocabulary in one automaton pass
+            matches = sorted(self._food_matcher.iter_word_matches(text), key=lambda m: (m[2], m[0]))
+            candidates = []
+            for start_pos, end_pos, pattern_id in matches:
+                pattern = self._sorted_food_keys[pattern_id]
                 main_food_key = self.food_variations[pattern]
-                food_data = self.food_db[main_food_key]
-                
-                quantity = self._find_quantity_near_food(text_copy, start_pos)
-                carbs = food_data["carbs_per_serving"] * quantity
-                
-                foods_found.append({
-                    "food": main_food_key, "quantity": quantity, "carbs": carbs,
-                    "serving_size": food_data["serving_size"], "matched_pattern": pattern
-                })
-                
-                total_carbs += carbs
-                
-                # ** FIX **: "Block out" the matched food to prevent re-matching
-                text_copy = text_copy[:start_pos] + "#" * len(pattern) + text_copy[match.end():]
-        
-        return {"foods": foods_found, "total_carbs": total_carbs}, text_copy
+                candidates.append((start_pos, end_pos, pattern, main_food_key, self.food_db[main_food_key]))
+            return candidates
+
+        # Large index: look up every run of up to max_key_words words in one batch
+        from food_index import normalize_key
+        index = self.food_index
+        words = [(m.start(), m.end()) for m in _WORD_PATTERN.finditer(text)]
+        spans = []
+        for i, (start_pos, _) in enumerate(words):
+            for _, end_pos in words[i:i + index.max_key_words]:
+                # Runs of whitespace collapse in the index keys, so measure the normalized span
+                if len(normalize_key(text[start_pos:end_pos])) > index.max_key_chars:
+                    break
+                spans.append((start_pos, end_pos))
+        food_ids, ranks = index.lookup([text[start:end] for start, end in spans])
+        found = sorted((rank, start, end, food_id) for (start, end), food_id, rank in zip(spans, food_ids, ranks) if food_id >= 0)
+        candidates = []
+        for _, start_pos, end_pos, food_id in found:
+            food_data = index.food(int(food_id))
+            candidates.append((start_pos, end_pos, text[start_pos:end_pos], food_data["name"], food_data))
+        return candidates
 
     def _find_quantity_near_food(self, text: str, food_pos: int) -> float:
         # ** FIX **: Search in a much smaller, more specific window BEFORE the food
         window_text = text[max(0, food_pos - 20):food_pos]
         
         # Look for number patterns like "2 ", "3.5 ", "two "
-        number_match = re.search(r'(\d+(?:\.\d+)?)\s*$', window_text)
+        number_match = _TRAILING_NUMBER_PATTERN.search(window_text)
         if number_match:
             try:
                 return float(number_match.group(1))
             except (ValueError, IndexError):
                 pass
         
-        for word, value in self.quantity_words.items():
-            # Use word boundaries for more precise matching
-            if re.search(r'\b' + word + r'\b\s*$', window_text):
-                return value
+        # Use word boundaries for more precise matching
+        word_match = self._quantity_pattern.search(window_text)
+        if word_match:
+            return self.quantity_words[word_match.group(1)]
         
         return 1.0 # Default to a single serving
 
     # (The rest of your functions: _extract_explicit_carbs, _extract_activities, etc., can remain the same)
     # ... PASTE THE REST OF YOUR CLASS FUNCTIONS HERE ...
     def _extract_explicit_carbs(self, text: str) -> int:
-        # ... (no changes needed)
-        patterns = [
-            r'(\d+)\s*(?:g|grams?)\s*(?:of\s*)?carbs?',
-            r'(\d+)\s*carbs?\s*(?:g|grams?)',
-            r'(\d+)\s*(?:g|grams?)\s*carbohydrates?'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text)
+        for pattern in EXPLICIT_CARB_PATTERNS:
+            match = pattern.search(text)
             if match:
                 return int(match.group(1))
         
         return 0
 
     def _extract_activities(self, text: str) -> List[Dict]:
-        # ... (no changes needed)
         activities = []
         
+        # First position of every activity pattern present (substring match), in one pass
+        first_seen = {}
+        for start_pos, _, pattern_id in self._activity_matcher.iter_matches(text):
+            first_seen.setdefault(pattern_id, start_pos)
+        if not first_seen:
+            return activities
+        
         for activity_key, activity_data in self.activity_db.items():
             patterns_to_check = [activity_key] + activity_data.get("variations", [])
             
             for pattern in patterns_to_check:
-                if pattern in text:
-                    duration = self._extract_duration_near_activity(text, pattern)
+                pattern_id = self._activity_pattern_ids[pattern]
+                if pattern_id in first_seen:
+                    duration = self._extract_duration_near_activity(text, pattern, first_seen[pattern_id])
                     
                     activities.append({
                         "activity": activity_key,
@@ -247,9 +455,9 @@ class EnhancedNLPProcessor:
         
         return activities
 
-    def _extract_duration_near_activity(self, text: str, activity_pattern: str) -> int:
-        # ... (no changes needed)
-        activity_pos = text.find(activity_pattern)
+    def _extract_duration_near_activity(self, text: str, activity_pattern: str, activity_pos: Optional[int] = None) -> int:
+        if activity_pos is None:
+            activity_pos = text.find(activity_pattern)
         if activity_pos == -1:
             return 30  # Default 30 minutes
         
@@ -257,20 +465,10 @@ class EnhancedNLPProcessor:
         window_end = min(len(text), activity_pos + len(activity_pattern) + 20)
         window_text = text[window_start:window_end]
         
-        duration_patterns = [
-            r'(\d+)\s*(?:minutes?|mins?)',
-            r'(\d+)\s*(?:hours?|hrs?)',
-            r'(\d+)\s*h',
-            r'(\d+)\s*m',
-        ]
-        
-        for pattern in duration_patterns:
-            match = re.search(pattern, window_text)
+        for pattern, minutes_per_unit in DURATION_PATTERNS:
+            match = pattern.search(window_text)
             if match:
-                value = int(match.group(1))
-                if 'hour' in pattern or 'hr' in pattern or 'h' in pattern:
-                    return value * 60
-                return value
+                return int(match.group(1)) * minutes_per_unit
         
         activity_info = self.activity_db.get(self.activity_variations.get(activity_pattern, ""), {})
         intensity = activity_info.get("intensity", "moderate")
@@ -280,14 +478,14 @@ class EnhancedNLPProcessor:
         else: return 25
 
     def _extract_timing(self, text: str) -> Dict:
-        # ... (no changes needed)
         timing_info = {"timing": None, "meal_type": None}
         
-        for keyword, data in self.time_keywords.items():
-            if keyword in text:
-                timing_info["timing"] = data["time"]
-                timing_info["meal_type"] = data["meal_type"]
-                break
+        # Earliest keyword in TIME_KEYWORDS order that appears anywhere, in one scan
+        found = self._timing_pattern.findall(text)
+        if found:
+            data = self.time_keywords[min(found, key=self._timing_priority.__getitem__)]
+            timing_info["timing"] = data["time"]
+            timing_info["meal_type"] = data["meal_type"]
         
         return timing_info
 
@@ -0,0 +1,153 @@
+# file: numpy_dqn.py
+#
+# Torch-free evaluation of the Stable-Baselines3 DQN dosing agent.
+# The Q-network (an MLP over the 5-float observation) is read straight out of
+# aura_dqn_agent.zip -- policy.pth is unpickled without importing torch -- or
+# from a compact .npz exported at deploy time:
+#
+#   python numpy_dqn.py aura_dqn_agent.zip     -> writes aura_dqn_agent.npz
+
+import base64
+import io
+import json
+import os
+import pickle
+import sys
+import zipfile
+from collections import OrderedDict
+import numpy as np
+
+_STORAGE_DTYPES = {
+    "FloatStorage": np.float32,
+    "DoubleStorage": np.float64,
+    "HalfStorage": np.float16,
+    "LongStorage": np.int64,
+    "IntStorage": np.int32,
+}
+
+Q_NET_PREFIX = "q_net.q_net."
+
+
+class UnsupportedPolicyError(ValueError):
+    """The saved agent is not a plain ReLU MLP Q-network this engine can run."""
+    pass
+
+
+class _StateDictUnpickler(pickle.Unpickler):
+    """Rebuilds a torch state_dict as NumPy arrays from a torch.save() zip archive."""
+
+    def __init__(self, data: bytes, archive: zipfile.ZipFile, root: str):
+        super().__init__(io.BytesIO(data))
+        self._archive = archive
+        self._root = root
+
+    def find_class(self, module, name):
+        if module == "collections" and name == "OrderedDict":
+            return OrderedDict
+        if module == "torch._utils" and name == "_rebuild_tensor_v2":
+            return self._rebuild_tensor
+        if module == "torch" and name in _STORAGE_DTYPES:
+            return name
+        raise pickle.UnpicklingError(f"Unexpected object in policy weights: {module}.{name}")
+
+    def persistent_load(self, pid):
+        # ('storage', storage_type, key, location, numel)
+        _, storage_type, key, _, _ = pid
+        raw = self._archive.read(f"{self._root}/data/{key}")
+        return np.frombuffer(raw, dtype=np.dtype(_STORAGE_DTYPES[storage_type]).newbyteorder("<"))
+
+    @staticmethod
+    def _rebuild_tensor(storage, storage_offset, size, stride, *_):
+        itemsize = storage.itemsize
+        return np.lib.stride_tricks.as_strided(
+            storage[storage_offset:], shape=tuple(size), strides=tuple(s * itemsize for s in stride)
+        ).copy()
+
+
+def _read_state_dict(pth_bytes: bytes) -> OrderedDict:
+    with zipfile.ZipFile(io.BytesIO(pth_bytes)) as archive:
+        pkl_name = next(n for n in archive.namelist() if n.endswith("/data.pkl"))
+        root = pkl_name[:-len("/data.pkl")]
+        byteorder = f"{root}/byteorder"
+        if byteorder in archive.namelist() and archive.read(byteorder).strip() != b"little":
+            raise UnsupportedPolicyError("Only little-endian policy weights are supported")
+        return _StateDictUnpickler(archive.read(pkl_name), archive, root).load()
+
+
+def _read_sb3_zip(zip_path: str) -> dict:
+    with zipfile.ZipFile(zip_path) as agent:
+        data = json.loads(agent.read("data"))
+        state_dict = _read_state_dict(agent.read("policy.pth"))
+
+    policy_kwargs = data.get("policy_kwargs") or {}
+    activation = policy_kwargs.get("activation_fn")
+    if activation is not None and b"ReLU" not in base64.b64decode(activation.get(":serialized:", "")):
+        raise UnsupportedPolicyError("Only the default ReLU activation is supported")
+    if policy_kwargs.get("normalize_images") is False or "features_extractor_class" in policy_kwargs:
+        raise UnsupportedPolicyError("Custom feature extractors are not supported")
+
+    layer_ids = sorted({int(k[len(Q_NET_PREFIX):].split(".")[0]) for k in state_dict if k.startswith(Q_NET_PREFIX)})
+    if not layer_ids:
+        raise UnsupportedPolicyError("No Q-network weights found in policy.pth")
+    arrays = {}
+    for n, layer_id in enumerate(layer_ids):
+        # torch Linear stores (out, in); keep (in, out) so the forward pass is x @ W + b
+        arrays[f"w{n}"] = np.ascontiguousarray(state_dict[f"{Q_NET_PREFIX}{layer_id}.weight"].T, dtype=np.float32)
+        arrays[f"b{n}"] = np.asarray(state_dict[f"{Q_NET_PREFIX}{layer_id}.bias"], dtype=np.float32)
+    return arrays
+
+
+def npz_path_for(zip_path: str) -> str:
+    return os.path.splitext(zip_path)[0] + ".npz"
+
+
+def export_npz(zip_path: str, npz_path: str = None) -> str:
+    """Extracts the Q-network once so serving never has to open the SB3 archive."""
+    npz_path = npz_path or npz_path_for(zip_path)
+    np.savez(npz_path, **_read_sb3_zip(zip_path))
+    return npz_path
+
+
+class NumpyDQNPolicy:
+    """Greedy DQN policy: ReLU MLP forward pass and argmax over Q-values."""
+
+    def __init__(self, arrays: dict):
+        n_layers = len([k for k in arrays if k.startswith("w")])
+        self.weights = [np.asarray(arrays[f"w{n}"], dtype=np.float32) for n in range(n_layers)]
+        self.biases = [np.asarray(arrays[f"b{n}"], dtype=np.float32) for n in range(n_layers)]
+        self.obs_dim = self.weights[0].shape[0]
+        self.n_actions = self.weights[-1].shape[1]
+
+    @classmethod
+    def from_file(cls, path: str):
+        """Loads from a .npz, preferring an exported sibling .npz over the .zip when it is up to date."""
+        if path.endswith(".npz"):
+            with np.load(path) as data:
+                return cls(dict(data))
+        npz_path = npz_path_for(path)
+        if os.path.exists(npz_path) and os.path.getmtime(npz_path) >= os.path.getmtime(path):
+            with np.load(npz_path) as data:
+                return cls(dict(data))
+        return cls(_read_sb3_zip(path))
+
+    def q_values(self, obs: np.ndarray) -> np.ndarray:
+        """(batch, obs_dim) -> (batch, n_actions) Q-values."""
+        x = np.asarray(obs, dtype=np.float32).reshape(-1, self.obs_dim)
+        for w, b in zip(self.weights[:-1], self.biases[:-1]):
+            x = np.maximum(x @ w + b, 0.0)
+        return x @ self.weights[-1] + self.biases[-1]
+
+    def predict_many(self, obs_matrix: np.ndarray) -> np.ndarray:
+        """Greedy actions for a batch of observations: (batch, obs_dim) -> (batch,) int64."""
+        return np.argmax(self.q_values(obs_matrix), axis=1)
+
+    def predict(self, observation, state=None, episode_start=None, deterministic: bool = True):
+        """Same call shape as SB3's DQN.predict() for a single or batched observation."""
+        observation = np.asarray(observation, dtype=np.float32)
+        actions = self.predict_many(observation)
+        return (actions[0] if observation.ndim == 1 else actions), state
+
+
+if __name__ == '__main__':
+    for path in sys.argv[1:] or ["aura_dqn_agent.zip"]:
+        print(f"Exported {path} -> {export_npz(path)}")
@@ -0,0 +1,161 @@
+# file: numpy_lstm.py
+#
+# TensorFlow-free inference for the glucose predictor (LSTM -> Dense).
+# Weights are read straight from the Keras .h5 file with h5py, or from a
+# compact .npz exported at deploy time:
+#
+#   python numpy_lstm.py glucose_predictor.h5     -> writes glucose_predictor.npz
+
+import json
+import os
+import sys
+import numpy as np
+
+_ACTIVATIONS = {
+    "sigmoid": lambda x: 0.5 * (1.0 + np.tanh(0.5 * x)),  # Overflow-free form
+    "tanh": np.tanh,
+    "relu": lambda x: np.maximum(x, 0.0),
+    "linear": lambda x: x,
+    None: lambda x: x,
+}
+
+
+class UnsupportedModelError(ValueError):
+    """The saved model is not a plain LSTM -> Dense stack this engine can run."""
+    pass
+
+
+def _activation(name):
+    if name not in _ACTIVATIONS:
+        raise UnsupportedModelError(f"Unsupported activation '{name}'")
+    return _ACTIVATIONS[name]
+
+
+def _read_h5(h5_path: str) -> dict:
+    import h5py  # Small dependency, already required to save Keras models
+
+    with h5py.File(h5_path, "r") as f:
+        config = json.loads(f.attrs["model_config"])
+        layer_configs = {
+            layer["config"].get("name"): layer for layer in config["config"]["layers"]
+        }
+        weights_root = f["model_weights"]
+        layer_names = [n.decode() if isinstance(n, bytes) else n for n in weights_root.attrs["layer_names"]]
+
+        trainable = []
+        for name in layer_names:
+            group = weights_root[name]
+            weight_names = [n.decode() if isinstance(n, bytes) else n for n in group.attrs["weight_names"]]
+            if weight_names:
+                trainable.append((layer_configs.get(name), [np.asarray(group[w], dtype=np.float32) for w in weight_names]))
+
+    if len(trainable) != 2 or trainable[0][0] is None or trainable[1][0] is None:
+        raise UnsupportedModelError("Expected exactly one LSTM layer followed by one Dense layer")
+    (lstm_layer, lstm_weights), (dense_layer, dense_weights) = trainable
+    if lstm_layer["class_name"] != "LSTM" or dense_layer["class_name"] != "Dense":
+        raise UnsupportedModelError(f"Unsupported layers: {lstm_layer['class_name']}, {dense_layer['class_name']}")
+    lstm_config = lstm_layer["config"]
+    if lstm_config.get("return_sequences") or lstm_config.get("go_backwards") or lstm_config.get("stateful"):
+        raise UnsupportedModelError("Only stateless, forward, last-output LSTMs are supported")
+
+    return {
+        "lstm_kernel": lstm_weights[0],
+        "lstm_recurrent_kernel": lstm_weights[1],
+        "lstm_bias": lstm_weights[2] if len(lstm_weights) > 2 else np.zeros(lstm_weights[0].shape[1], np.float32),
+        "dense_kernel": dense_weights[0],
+        "dense_bias": dense_weights[1] if len(dense_weights) > 1 else np.zeros(dense_weights[0].shape[1], np.float32),
+        "activation": np.array(lstm_config.get("activation", "tanh")),
+        "recurrent_activation": np.array(lstm_config.get("recurrent_activation", "sigmoid")),
+        "dense_activation": np.array(dense_layer["config"].get("activation", "linear")),
+    }
+
+
+def npz_path_for(h5_path: str) -> str:
+    return os.path.splitext(h5_path)[0] + ".npz"
+
+
+def export_npz(h5_path: str, npz_path: str = None) -> str:
+    """Extracts the weights once so serving never has to parse the .h5."""
+    npz_path = npz_path or npz_path_for(h5_path)
+    np.savez(npz_path, **_read_h5(h5_path))
+    return npz_path
+
+
+class NumpyLSTMForecaster:
+    """Vectorized forward pass and autoregressive rollout over a batch of windows."""
+
+    def __init__(self, arrays: dict):
+        self.kernel = np.asarray(arrays["lstm_kernel"], dtype=np.float32)
+        self.recurrent_kernel = np.asarray(arrays["lstm_recurrent_kernel"], dtype=np.float32)
+        self.bias = np.asarray(arrays["lstm_bias"], dtype=np.float32)
+        self.dense_kernel = np.asarray(arrays["dense_kernel"], dtype=np.float32)
+        self.dense_bias = np.asarray(arrays["dense_bias"], dtype=np.float32)
+        self.units = self.recurrent_kernel.shape[0]
+        self.input_dim = self.kernel.shape[0]
+        self._activation = _activation(str(arrays["activation"]))
+        self._recurrent_activation = _activation(str(arrays["recurrent_activation"]))
+        self._dense_activation = _activation(str(arrays["dense_activation"]))
+
+    @classmethod
+    def from_file(cls, model_path: str):
+        """Loads from a .npz, preferring an exported sibling .npz over the .h5 when it is up to date."""
+        if model_path.endswith(".npz"):
+            with np.load(model_path) as data:
+                return cls(dict(data))
+        npz_path = npz_path_for(model_path)
+        if os.path.exists(npz_path) and os.path.getmtime(npz_path) >= os.path.getmtime(model_path):
+            with np.load(npz_path) as data:
+                return cls(dict(data))
+        return cls(_read_h5(model_path))
+
+    def count_params(self) -> int:
+        return sum(a.size for a in (self.kernel, self.recurrent_kernel, self.bias, self.dense_kernel, self.dense_bias))
+
+    def _run_lstm(self, projected: np.ndarray) -> np.ndarray:
+        """projected: (batch, steps, 4*units) input projections -> last hidden state."""
+        u = self.units
+        batch = projected.shape[0]
+        h = np.zeros((batch, u), dtype=np.float32)
+        c = np.zeros((batch, u), dtype=np.float32)
+        for t in range(projected.shape[1]):
+            z = projected[:, t] + h @ self.recurrent_kernel
+            i = self._recurrent_activation(z[:, :u])
+            f = self._recurrent_activation(z[:, u:2 * u])
+            g = self._activation(z[:, 2 * u:3 * u])
+            o = self._recurrent_activation(z[:, 3 * u:])
+            c = f * c + i * g
+            h = o * self._activation(c)
+        return h
+
+    def predict(self, windows: np.ndarray) -> np.ndarray:
+        """(batch, steps, input_dim) -> (batch, dense_units), like model.predict()."""
+        windows = np.asarray(windows, dtype=np.float32)
+        projected = windows @ self.kernel + self.bias
+        h = self._run_lstm(projected)
+        return self._dense_activation(h @ self.dense_kernel + self.dense_bias)
+
+    def rollout(self, windows: np.ndarray, horizon: int) -> np.ndarray:
+        """
+        Feeds each prediction back as the newest reading.
+        windows: (batch, look_back) scaled values -> (batch, horizon) float32.
+        """
+        if self.input_dim != 1:
+            raise UnsupportedModelError("Autoregressive rollout needs a single-input-channel model")
+        windows = np.asarray(windows, dtype=np.float32)
+        batch, look_back = windows.shape
+        # Input projections are per-reading, so they are computed once per
+        # value into one preallocated buffer and reused by every later window.
+        projected = np.empty((batch, look_back + horizon, self.kernel.shape[1]), dtype=np.float32)
+        projected[:, :look_back] = windows[:, :, None] * self.kernel[0] + self.bias
+        outputs = np.empty((batch, horizon), dtype=np.float32)
+        for step in range(horizon):
+            h = self._run_lstm(projected[:, step:step + look_back])
+            pred = self._dense_activation(h @ self.dense_kernel + self.dense_bias)[:, 0]
+            outputs[:, step] = pred
+            projected[:, look_back + step] = pred[:, None] * self.kernel[0] + self.bias
+        return outputs
+
+
+if __name__ == '__main__':
+    for path in sys.argv[1:] or ["glucose_predictor.h5"]:
+        print(f"Exported {path} -> {export_npz(path)}")
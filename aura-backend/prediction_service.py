@@ -4,60 +4,172 @@ import os
 import numpy as np
 import joblib
 # NOTE: We have REMOVED "from keras.models import load_model" from the top of the file.
-from scipy import stats
 import warnings
+from functools import lru_cache
+from model_cache import ModelCache, ModelEntry
+from model_registry import REGISTRY
+from forecast_cache import ForecastCache, window_key
+from micro_batcher import MicroBatcher
+from numpy_lstm import NumpyLSTMForecaster, UnsupportedModelError
+from logging_config import get_logger
+
+logger = get_logger("predictor")
 
 warnings.filterwarnings('ignore', category=UserWarning, module='keras')
 warnings.filterwarnings('ignore', category=FutureWarning, module='keras')
 
 # --- UPGRADED DYNAMIC MODEL LOADING & CACHING SYSTEM ---
-MODEL_CACHE = {}
-SCALER_CACHE = {}
 DEFAULT_MODEL_PATH = 'glucose_predictor.h5'
 DEFAULT_SCALER_PATH = 'scaler.gz'
 
+# Bounds for the loaded-model LRU (per worker process)
+MODEL_CACHE_MAX_ENTRIES = int(os.getenv("MODEL_CACHE_MAX_ENTRIES", "8"))
+MODEL_CACHE_MAX_BYTES = int(os.getenv("MODEL_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
 LOOK_BACK = 12
+FORECAST_HORIZON = 12  # 12 x 5-minute steps = 1 hour ahead
 
-def get_model_for_user(user_id: int):
+# Inference backend: "numpy" runs the LSTM in NumPy (no TensorFlow import),
+# "keras" loads the full Keras model.
+PREDICTION_BACKEND = os.getenv("PREDICTION_BACKEND", "numpy").lower()
+
+def _load_model_and_scaler(model_path: str, scaler_path: str):
     """
-    Dynamically loads and caches a user's personalized model.
-    This function LAZY LOADS Keras/TensorFlow to ensure fast server startup.
+    Loads one model/scaler pair from disk with the configured backend.
+    Models the NumPy engine cannot run fall back to Keras.
     """
+    logger.info("Loading model into cache (%s): %s", PREDICTION_BACKEND, model_path)
+    scaler = joblib.load(scaler_path)
+    if PREDICTION_BACKEND == "numpy":
+        try:
+            return NumpyLSTMForecaster.from_file(model_path), scaler
+        except (UnsupportedModelError, KeyError, ImportError) as e:
+            logger.warning("NumPy engine cannot run %s (%s). Using Keras.", model_path, e)
     # --- LAZY LOADING PATTERN ---
-    # By importing here, TensorFlow is only loaded when a prediction is
-    # actually requested, not when the application first starts.
+    # By importing here, TensorFlow is only loaded when a Keras model is
+    # actually needed, not when the application first starts.
     from keras.models import load_model
     # --- END OF PATTERN ---
+    return load_model(model_path), scaler
 
-    user_model_path = f'glucose_predictor_user_{user_id}.h5'
-    user_scaler_path = f'scaler_user_{user_id}.gz'
-    
-    if os.path.exists(user_model_path) and os.path.exists(user_scaler_path):
-        model_path_to_load = user_model_path
-        scaler_path_to_load = user_scaler_path
-        print(f"--- [Predictor] Found personalized model for user {user_id}. ---")
-    else:
-        model_path_to_load = DEFAULT_MODEL_PATH
-        scaler_path_to_load = DEFAULT_SCALER_PATH
-        
-    if model_path_to_load in MODEL_CACHE:
-        return MODEL_CACHE[model_path_to_load], SCALER_CACHE[scaler_path_to_load]
-    else:
-        print(f"--- [Predictor] Loading model into cache for the first time: {model_path_to_load} ---")
+# The default files are re-checked for a redeploy as often as the registry index.
+MODEL_CACHE = ModelCache(_load_model_and_scaler, MODEL_CACHE_MAX_ENTRIES, MODEL_CACHE_MAX_BYTES, stat_ttl=REGISTRY.refresh_seconds)
+# Every user without a personalized model shares this single loaded copy.
+MODEL_CACHE.pin(DEFAULT_MODEL_PATH, DEFAULT_SCALER_PATH)
+
+def get_model_entry_for_user(user_id: int) -> ModelEntry:
+    """
+    Resolves the user's personalized model from the registry's in-memory
+    pointer index (or the shared default) and returns its cache entry.
+    """
+    bundle = REGISTRY.current(user_id)
+    if bundle is not None:
+        user_model_path, user_scaler_path, version = bundle
         try:
-            model = load_model(model_path_to_load)
-            scaler = joblib.load(scaler_path_to_load)
-            
-            MODEL_CACHE[model_path_to_load] = model
-            SCALER_CACHE[scaler_path_to_load] = scaler
-            
-            return model, scaler
+            return MODEL_CACHE.get(user_model_path, user_scaler_path, version=version)
         except Exception as e:
-            print(f"--- [Predictor] FATAL ERROR: Could not load model file {model_path_to_load}. Error: {e} ---")
-            if model_path_to_load == DEFAULT_MODEL_PATH:
-                 raise IOError(f"Default model '{DEFAULT_MODEL_PATH}' is missing or corrupted.")
-            else:
-                 return get_model_for_user(0)
+            logger.error("Could not load personalized model %s. Falling back to default. Error: %s", user_model_path, e)
+
+    try:
+        return MODEL_CACHE.get(DEFAULT_MODEL_PATH, DEFAULT_SCALER_PATH)
+    except Exception as e:
+        logger.critical("Could not load model file %s. Error: %s", DEFAULT_MODEL_PATH, e)
+        raise IOError(f"Default model '{DEFAULT_MODEL_PATH}' is missing or corrupted.")
+
+def get_model_for_user(user_id: int):
+    """Returns the (model, scaler) pair to use for this user."""
+    entry = get_model_entry_for_user(user_id)
+    return entry.model, entry.scaler
+
+def get_model_cache_stats() -> dict:
+    """Hit/miss/reload/eviction counters and current size of the model cache."""
+    return MODEL_CACHE.snapshot()
+
+# --- Baseline Forecast Memoization ---
+# Keyed by (model file, model version, last LOOK_BACK readings); a TTL of 0
+# disables it. The default TTL matches the 5-minute CGM interval.
+FORECAST_CACHE_TTL = float(os.getenv("FORECAST_CACHE_TTL", "300"))
+FORECAST_CACHE_MAX_ENTRIES = int(os.getenv("FORECAST_CACHE_MAX_ENTRIES", "4096"))
+FORECAST_CACHE = ForecastCache(FORECAST_CACHE_TTL, FORECAST_CACHE_MAX_ENTRIES)
+
+def get_forecast_cache_stats() -> dict:
+    """Hit/miss/eviction counters and current size of the forecast cache."""
+    return FORECAST_CACHE.snapshot()
+
+# --- Fast Multi-step Rollout ---
+# The model predicts one step ahead; a forecast feeds each prediction back in
+# as the newest reading. Calling model.predict() once per step pays Keras'
+# per-call setup 12 times, so the whole loop is compiled into one graph.
+
+def _build_keras_rollout(model, horizon: int):
+    """Returns fn(scaled windows (batch, LOOK_BACK) float32) -> (batch, horizon) float32."""
+    try:
+        import tensorflow as tf
+    except ImportError:
+        return lambda windows: _eager_rollout(model, windows, horizon)
+
+    @tf.function(input_signature=[tf.TensorSpec([None, LOOK_BACK, 1], tf.float32)])
+    def rollout(window):
+        outputs = []
+        for _ in range(horizon):  # Unrolled at trace time
+            pred = model(window, training=False)
+            outputs.append(pred)
+            window = tf.concat([window[:, 1:, :], pred[:, :, None]], axis=1)
+        return tf.concat(outputs, axis=1)
+
+    return lambda windows: rollout(windows[:, :, None]).numpy()
+
+def _eager_rollout(model, windows: np.ndarray, horizon: int) -> np.ndarray:
+    """Fallback without tf.function: direct model calls over one preallocated buffer."""
+    batch = windows.shape[0]
+    buffer = np.empty((batch, LOOK_BACK + horizon, 1), dtype=np.float32)
+    buffer[:, :LOOK_BACK, 0] = windows
+    for step in range(horizon):
+        pred = model(buffer[:, step:step + LOOK_BACK], training=False)
+        buffer[:, LOOK_BACK + step, 0] = np.asarray(pred).reshape(batch)
+    return buffer[:, LOOK_BACK:, 0].copy()
+
+def rollout_scaled(entry: ModelEntry, scaled_windows: np.ndarray, horizon: int = FORECAST_HORIZON) -> np.ndarray:
+    """Runs the autoregressive forecast for a batch of already-scaled windows."""
+    if entry.rollout is None:
+        if isinstance(entry.model, NumpyLSTMForecaster):
+            entry.rollout = lambda windows: entry.model.rollout(windows, horizon)
+        else:
+            entry.rollout = _build_keras_rollout(entry.model, horizon)
+    windows = np.ascontiguousarray(scaled_windows, dtype=np.float32).reshape(-1, LOOK_BACK)
+    return entry.rollout(windows)
+
+# --- Cross-request Micro-batching ---
+# With several request threads per worker, concurrent forecasts for the same
+# model are stacked and rolled out together instead of one at a time.
+PREDICTION_MICROBATCH = str(os.getenv("PREDICTION_MICROBATCH", "false")).lower() in ("1", "true", "yes", "on")
+PREDICTION_BATCH_WINDOW_MS = float(os.getenv("PREDICTION_BATCH_WINDOW_MS", "3"))
+PREDICTION_MAX_BATCH = int(os.getenv("PREDICTION_MAX_BATCH", "32"))
+# A request waits this long for its batch before running its forecast directly.
+PREDICTION_BATCH_TIMEOUT_MS = float(os.getenv("PREDICTION_BATCH_TIMEOUT_MS", "1000"))
+
+def _run_rollout_batch(entry: ModelEntry, windows: list) -> list:
+    return list(rollout_scaled(entry, np.stack(windows)))
+
+_ROLLOUT_BATCHER = MicroBatcher(_run_rollout_batch, PREDICTION_BATCH_WINDOW_MS, PREDICTION_MAX_BATCH)
+
+def get_batcher_stats() -> dict:
+    """Batches run, items, batch sizes and queue depth of the forecast micro-batcher."""
+    return {"enabled": PREDICTION_MICROBATCH, **_ROLLOUT_BATCHER.snapshot()}
+
+def forecast_glucose_values(entry: ModelEntry, glucose_window: list) -> np.ndarray:
+    """Unconstrained 12-step forecast (mg/dL, float32) from the last LOOK_BACK readings."""
+    input_data = np.asarray(glucose_window[-LOOK_BACK:], dtype=np.float64).reshape(-1, 1)
+    scaled_input = entry.scaler.transform(input_data).reshape(LOOK_BACK).astype(np.float32)
+    if PREDICTION_MICROBATCH:
+        try:
+            scaled_predictions = _ROLLOUT_BATCHER.submit(entry, scaled_input, timeout=PREDICTION_BATCH_TIMEOUT_MS / 1000)
+        except TimeoutError as e:
+            logger.warning("Forecast micro-batch timed out (%s); predicting directly.", e)
+            scaled_predictions = rollout_scaled(entry, scaled_input)
+    else:
+        scaled_predictions = rollout_scaled(entry, scaled_input)
+    return entry.scaler.inverse_transform(np.reshape(scaled_predictions, (-1, 1))).reshape(-1)
 
 class GlucosePredictionError(Exception):
     """Custom exception for prediction errors"""
@@ -66,7 +178,11 @@ class GlucosePredictionError(Exception):
 def validate_glucose_history(glucose_history: list) -> list:
     if not glucose_history or len(glucose_history) < LOOK_BACK:
         raise GlucosePredictionError(f"Insufficient history: need at least {LOOK_BACK} readings.")
-    return [float(v) for v in glucose_history]
+    cleaned = [float(v) for v in glucose_history]
+    # JSON bodies may carry NaN/Infinity, which would poison the scaler and int() casts.
+    if not np.all(np.isfinite(cleaned)):
+        raise GlucosePredictionError("Glucose history must contain only finite numbers.")
+    return cleaned
 
 def apply_physiological_constraints(predictions: list, last_known_value: float) -> list:
     constrained = []
@@ -79,7 +195,64 @@ def apply_physiological_constraints(predictions: list, last_known_value: float)
         prev_value = pred
     return constrained
 
+def apply_physiological_constraints_batch(predictions: np.ndarray, last_known_values: np.ndarray) -> np.ndarray:
+    """
+    Vectorized apply_physiological_constraints over (n_users, horizon):
+    the same per-step rate limit against the previous (rate-limited) value,
+    then the 40-400 mg/dL clamp. Loops over the horizon only.
+    """
+    MAX_CHANGE_RATE = 4
+    predictions = np.asarray(predictions, dtype=np.float64)
+    constrained = np.empty_like(predictions)
+    prev_values = np.asarray(last_known_values, dtype=np.float64).reshape(-1)
+    for step in range(predictions.shape[1]):
+        limited = np.clip(predictions[:, step], prev_values - MAX_CHANGE_RATE, prev_values + MAX_CHANGE_RATE)
+        constrained[:, step] = np.clip(limited, 40, 400)
+        prev_values = limited
+    return constrained
+
+# --- Vectorized Hybrid Adjustments ---
+# Effect curves over the forecast horizon, built once: carbs raise glucose
+# linearly from step 3 on, activity lowers it by a flat amount from step 2 on.
+
+@lru_cache(maxsize=None)
+def carb_effect_kernel(horizon: int = FORECAST_HORIZON) -> np.ndarray:
+    steps = np.arange(horizon)
+    kernel = np.where(steps >= 3, steps - 2, 0).astype(np.float64)
+    kernel.setflags(write=False)
+    return kernel
+
+@lru_cache(maxsize=None)
+def activity_effect_kernel(horizon: int = FORECAST_HORIZON) -> np.ndarray:
+    kernel = (np.arange(horizon) >= 2).astype(np.float64)
+    kernel.setflags(write=False)
+    return kernel
+
+def apply_future_event_adjustments_batch(predictions: np.ndarray, carbs: np.ndarray, has_activity: np.ndarray) -> np.ndarray:
+    """
+    Shifts baseline forecasts (n_users, horizon) for planned carbs and activity.
+    carbs: (n_users,) grams; has_activity: (n_users,) bool.
+    """
+    predictions = np.asarray(predictions, dtype=np.float64)
+    horizon = predictions.shape[1]
+    carbs = np.asarray(carbs, dtype=np.float64).reshape(-1)
+    carb_impact = np.where(carbs > 0, (carbs / 10) * 3.5 / 12, 0.0)
+    activity_impact = np.where(np.asarray(has_activity, dtype=bool).reshape(-1), 25 / 12, 0.0)
+    adjusted = predictions + carb_impact[:, None] * carb_effect_kernel(horizon)
+    adjusted -= activity_impact[:, None] * activity_effect_kernel(horizon)
+    return adjusted
+
+def prediction_bounds_batch(final_predictions: np.ndarray, variability) -> tuple:
+    """Upper/lower integer bands that widen 10% per step: ((n, horizon), (n, horizon))."""
+    final_predictions = np.asarray(final_predictions, dtype=np.float64)
+    variability = np.asarray(variability, dtype=np.float64).reshape(-1, 1)
+    offsets = variability * (1 + np.arange(final_predictions.shape[1]) * 0.1)
+    upper = np.rint(final_predictions + offsets).astype(int)
+    lower = np.rint(final_predictions - offsets).astype(int)
+    return upper, lower
+
 def calculate_trend_confidence(glucose_history: list) -> dict:
+    from scipy import stats  # Deferred: scipy.stats is slow to import
     recent_values = glucose_history[-LOOK_BACK:]
     slope, _, _, _, _ = stats.linregress(np.arange(len(recent_values)), recent_values)
     trend = "stable"
@@ -87,35 +260,44 @@ def calculate_trend_confidence(glucose_history: list) -> dict:
     elif slope < -0.5: trend = "falling"
     return {"trend": trend, "slope": round(slope, 2)}
 
+def _baseline_forecast(entry: ModelEntry, cleaned_history: list) -> dict:
+    """
+    Constrained integer forecast (and, once asked for, the trend analysis) for
+    the last LOOK_BACK readings, served from FORECAST_CACHE when possible.
+    The returned dict is shared; callers must copy what they hand out.
+    """
+    window = cleaned_history[-LOOK_BACK:]
+    # A None version means the files changed while loading; never cache that.
+    key = window_key(entry.model_path, entry.version, window) if FORECAST_CACHE.enabled and entry.version is not None else None
+    if key is not None:
+        baseline = FORECAST_CACHE.get(key)
+        if baseline is not None:
+            return baseline
+
+    # One compiled call for all 12 steps (values stay float32, as before)
+    predictions = forecast_glucose_values(entry, window)
+    final_predictions = apply_physiological_constraints_batch(predictions[None, :], [window[-1]])[0]
+    baseline = {"prediction": np.rint(final_predictions).astype(int).tolist(), "analysis": None}
+    if key is not None:
+        FORECAST_CACHE.set(key, baseline)
+    return baseline
+
 def predict_future_glucose(user_id: int, recent_glucose_history: list, include_analysis: bool = False) -> dict:
     try:
-        model, scaler = get_model_for_user(user_id)
+        entry = get_model_entry_for_user(user_id)
         cleaned_history = validate_glucose_history(recent_glucose_history)
-        
-        input_data = np.array(cleaned_history[-LOOK_BACK:]).reshape(-1, 1)
-        scaled_input = scaler.transform(input_data)
-        
-        predictions = []
-        current_sequence = scaled_input.reshape((1, LOOK_BACK, 1))
-        
-        for _ in range(12):
-            pred_scaled = model.predict(current_sequence, verbose=0)
-            pred_glucose = scaler.inverse_transform(pred_scaled)[0][0]
-            predictions.append(pred_glucose)
-            new_sequence = np.append(current_sequence[0][1:], pred_scaled)
-            current_sequence = new_sequence.reshape((1, LOOK_BACK, 1))
+        baseline = _baseline_forecast(entry, cleaned_history)
         
         last_known = cleaned_history[-1]
-        final_predictions = apply_physiological_constraints(predictions, last_known)
-        int_predictions = [int(round(p)) for p in final_predictions]
-        
         response = {
-            "prediction": int_predictions, "status": "success",
+            "prediction": list(baseline["prediction"]), "status": "success",
             "last_known_glucose": int(last_known)
         }
         
         if include_analysis:
-            response["analysis"] = calculate_trend_confidence(cleaned_history)
+            if baseline["analysis"] is None:
+                baseline["analysis"] = calculate_trend_confidence(cleaned_history)
+            response["analysis"] = dict(baseline["analysis"])
         
         return response
         
@@ -124,36 +306,77 @@ def predict_future_glucose(user_id: int, recent_glucose_history: list, include_a
     except Exception as e:
         return {"prediction": [], "status": "error", "error_message": f"Unexpected prediction error: {str(e)}"}
 
+# Max windows per rollout call in predict_batch (bounds peak memory)
+PREDICTION_BULK_CHUNK = int(os.getenv("PREDICTION_BULK_CHUNK", "2048"))
+
+def predict_batch(user_ids: list, histories: list) -> list:
+    """
+    12-step forecasts for many users at once. Inputs are grouped by resolved
+    model (shared default vs personalized), scaled in one pass per group,
+    rolled out in chunks and constrained in vectorized form.
+    Returns one result dict per input, in input order, shaped like
+    predict_future_glucose() plus "user_id".
+    """
+    if len(user_ids) != len(histories):
+        raise ValueError("user_ids and histories must have the same length")
+
+    results = [None] * len(user_ids)
+    groups = {}
+    entries_by_user = {}
+    for index, (user_id, history) in enumerate(zip(user_ids, histories)):
+        try:
+            cleaned = validate_glucose_history(history)
+            if user_id not in entries_by_user:
+                entries_by_user[user_id] = get_model_entry_for_user(user_id)
+        except (GlucosePredictionError, IOError, TypeError, ValueError) as e:
+            results[index] = {"user_id": user_id, "prediction": [], "status": "error", "error_message": str(e)}
+            continue
+        group = groups.setdefault(id(entries_by_user[user_id]), (entries_by_user[user_id], [], []))
+        group[1].append(index)
+        group[2].append(cleaned[-LOOK_BACK:])
+
+    for entry, indices, windows in groups.values():
+        windows = np.asarray(windows, dtype=np.float64)
+        scaled = entry.scaler.transform(windows.reshape(-1, 1)).reshape(-1, LOOK_BACK).astype(np.float32)
+        scaled_predictions = np.empty((len(indices), FORECAST_HORIZON), dtype=np.float32)
+        for start in range(0, len(indices), PREDICTION_BULK_CHUNK):
+            stop = start + PREDICTION_BULK_CHUNK
+            scaled_predictions[start:stop] = rollout_scaled(entry, scaled[start:stop])
+        predictions = entry.scaler.inverse_transform(scaled_predictions.reshape(-1, 1)).reshape(-1, FORECAST_HORIZON)
+
+        last_known = windows[:, -1]
+        constrained = np.rint(apply_physiological_constraints_batch(predictions, last_known)).astype(int)
+        for row, index in enumerate(indices):
+            results[index] = {
+                "user_id": user_ids[index],
+                "prediction": constrained[row].tolist(),
+                "status": "success",
+                "last_known_glucose": int(last_known[row]),
+            }
+    return results
+
 def generate_hybrid_prediction(user_id: int, recent_glucose_history: list, future_events: dict = None) -> dict:
     baseline_response = predict_future_glucose(user_id, recent_glucose_history, include_analysis=True)
     
     if baseline_response["status"] == "error":
         return baseline_response
         
-    adjusted_predictions = list(baseline_response["prediction"])
-    if future_events:
-        carbs = future_events.get("carbs", 0)
-        if carbs > 0:
-            carb_impact = (carbs / 10) * 3.5 / 12
-            for i in range(len(adjusted_predictions)):
-                if i >= 3: adjusted_predictions[i] += carb_impact * (i - 2)
-        
-        activity_type = future_events.get("activity_type")
-        if activity_type:
-            activity_impact = 25 / 12
-            for i in range(len(adjusted_predictions)):
-                if i >= 2: adjusted_predictions[i] -= activity_impact
+    baseline = np.asarray([baseline_response["prediction"]], dtype=np.float64)
+    future_events = future_events or {}
+    adjusted_predictions = apply_future_event_adjustments_batch(
+        baseline,
+        [future_events.get("carbs", 0)],
+        [bool(future_events.get("activity_type"))],
+    )
 
     last_known = baseline_response["last_known_glucose"]
-    final_predictions = apply_physiological_constraints(adjusted_predictions, last_known)
+    final_predictions = apply_physiological_constraints_batch(adjusted_predictions, [last_known])
     
-    baseline_response["adjusted_prediction"] = [int(round(p)) for p in final_predictions]
+    baseline_response["adjusted_prediction"] = np.rint(final_predictions[0]).astype(int).tolist()
     baseline_response["original_prediction"] = baseline_response.pop("prediction")
     
     variability = baseline_response.get("analysis", {}).get("variability", 5)
-    baseline_response["prediction_bounds"] = {
-        "upper": [int(round(p + (variability * (1 + i*0.1)))) for i, p in enumerate(final_predictions)],
-        "lower": [int(round(p - (variability * (1 + i*0.1)))) for i, p in enumerate(final_predictions)]
-    }
+    upper, lower = prediction_bounds_batch(final_predictions, variability)
+    baseline_response["prediction_bounds"] = {"upper": upper[0].tolist(), "lower": lower[0].tolist()}
 
     return baseline_response
\ No newline at end of file
@@ -2,12 +2,28 @@
 
 import numpy as np
 import os
+from logging_config import get_logger
+
+logger = get_logger("recommender")
 
 # --- Lazy Loading Configuration ---
 # The model is not loaded at startup. It will be loaded on the first API call.
 _rl_model = None 
 MODEL_PATH = "aura_dqn_agent"
 DEVICE = "cpu"
+# Policy backend: "numpy" evaluates the exported Q-network without importing
+# torch or stable_baselines3; "sb3" loads the full agent.
+RECOMMENDER_BACKEND = os.getenv("RECOMMENDER_BACKEND", "numpy").lower()
+
+def _load_numpy_policy(load_path: str):
+    from numpy_dqn import NumpyDQNPolicy, UnsupportedPolicyError
+    try:
+        policy = NumpyDQNPolicy.from_file(load_path)
+        logger.info("RL agent loaded (NumPy Q-network).")
+        return policy
+    except (UnsupportedPolicyError, KeyError, ValueError) as e:
+        logger.warning("NumPy engine cannot run %s (%s). Using stable_baselines3.", load_path, e)
+        return None
 
 def _get_rl_model():
     """
@@ -20,7 +36,15 @@ def _get_rl_model():
         return _rl_model
 
     # --- First-time loading logic ---
-    print("--- [Recommender] Loading RL agent for the first time... ---")
+    logger.info("Loading RL agent for the first time...")
+    if RECOMMENDER_BACKEND == "numpy":
+        candidate_paths = [f"{MODEL_PATH}.npz", MODEL_PATH, f"{MODEL_PATH}.zip"]
+        load_path = next((p for p in candidate_paths if os.path.isfile(p)), None)
+        if load_path:
+            _rl_model = _load_numpy_policy(load_path)
+            if _rl_model is not None:
+                return _rl_model
+
     try:
         # Dynamically import to avoid loading the library at startup
         import importlib
@@ -35,16 +59,16 @@ def _get_rl_model():
             if load_path:
                 # Load the trained agent and cache it in the global variable
                 _rl_model = DQN.load(load_path, device=DEVICE)
-                print("--- [Recommender] RL agent loaded successfully. ---")
+                logger.info("RL agent loaded successfully.")
                 return _rl_model
             else:
-                print(f"--- [Recommender] WARNING: RL model file not found at '{MODEL_PATH}'. ---")
+                logger.warning("RL model file not found at '%s'.", MODEL_PATH)
                 return None
         else:
-            print("--- [Recommender] WARNING: stable_baselines3 library not available. ---")
+            logger.warning("stable_baselines3 library not available.")
             return None
     except Exception as e:
-        print(f"--- [Recommender] CRITICAL ERROR: Could not load RL agent model. Error: {e} ---")
+        logger.critical("Could not load RL agent model. Error: %s", e)
         return None
 
 # --- The Main API Function ---
@@ -107,4 +131,71 @@ def get_insulin_recommendation(
         }
 
     except Exception as e:
-        return {"error": str(e)}
\ No newline at end of file
+        return {"error": str(e)}
+
+# --- Batched Recommendations ---
+def recommend_batch(
+    glucose,
+    carbs=0,
+    time_hour=12,
+    last_insulin_hours=4,
+    exercise_recent=False,
+    stress_level=0
+) -> dict:
+    """
+    Vectorized get_insulin_recommendation for many patients or what-if points.
+    Every argument is a scalar or an array; they are broadcast together.
+    Runs one batched policy evaluation and returns arrays of the broadcast shape:
+    {"recommended_dose", "meal_bolus", "correction_dose", "rl_base_dose"}.
+    """
+    model = _get_rl_model()
+    if model is None:
+        return {
+            "error": "RL model is not available. Cannot provide AI recommendation."
+        }
+
+    glucose, carbs, time_hour, last_insulin_hours, exercise_recent, stress_level = np.broadcast_arrays(
+        np.asarray(glucose, dtype=np.float64),
+        np.asarray(carbs, dtype=np.float64),
+        np.asarray(time_hour, dtype=np.float64),
+        np.asarray(last_insulin_hours, dtype=np.float64),
+        np.asarray(exercise_recent, dtype=bool),
+        np.asarray(stress_level, dtype=np.float64),
+    )
+    shape = glucose.shape
+
+    # --- 1. RL Model Base Recommendation (one batched call) ---
+    active_insulin_estimate = np.maximum(0, 4 - last_insulin_hours * 2)
+    obs = np.stack([
+        glucose, np.zeros(shape), time_hour, active_insulin_estimate, last_insulin_hours
+    ], axis=-1).reshape(-1, 5).astype(np.float32)
+    if hasattr(model, "predict_many"):
+        actions = model.predict_many(obs)
+    else:
+        actions, _ = model.predict(obs, deterministic=True)
+    rl_base_dose = np.asarray(actions, dtype=np.float64).reshape(shape) * 0.5
+
+    # --- 2. Standard Calculation (Heuristics) ---
+    carb_ratio = 12
+    insulin_sensitivity = 50
+    target_glucose = 110
+    meal_bolus = np.where(carbs > 0, carbs / carb_ratio, 0.0)
+    correction_dose = np.maximum(0, (glucose - target_glucose) / insulin_sensitivity)
+
+    # --- 3./4. Hybrid Dose with Context Adjustments ---
+    total_dose = meal_bolus + correction_dose
+    total_dose = np.where(exercise_recent, total_dose * 0.7, total_dose)
+    total_dose = np.where(stress_level > 5, total_dose * (1 + stress_level * 0.05), total_dose)
+
+    final_dose = np.clip(total_dose, 0, 20)  # Safety clamp
+
+    # Python's round() is correctly rounded in decimal; np.round(x, 1) can land
+    # on the other side of a tie, so the scalar rule is kept for parity.
+    recommended_dose = np.array([round(v, 1) for v in final_dose.ravel().tolist()]).reshape(shape)
+
+    return {
+        "recommended_dose": recommended_dose,
+        "meal_bolus": meal_bolus,
+        "correction_dose": correction_dose,
+        "rl_base_dose": rl_base_dose,
+    }
@@ -3,16 +3,19 @@
 import os
 from fpdf import FPDF
 from datetime import datetime, timedelta
+import matplotlib
+matplotlib.use('Agg')  # Use a non-GUI backend for matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 
 # We need to talk to the database to get all the user's data
 import database as db
+from logging_config import get_logger
 
-# --- Helper to create a temporary folder for our generated files ---
+logger = get_logger("report")
+
+# --- Temporary folder for our generated files (created on first use) ---
 TEMP_FOLDER = 'temp_reports'
-if not os.path.exists(TEMP_FOLDER):
-    os.makedirs(TEMP_FOLDER)
 
 
 def create_glucose_chart_image(glucose_readings: list, user_id: int) -> str:
@@ -60,8 +63,10 @@ def create_user_report(user_id: int) -> str:
     Generates a comprehensive PDF report for a user.
     Returns the path to the generated PDF file.
     """
-    print(f"--- [Report Gen] Creating report for user {user_id} ---")
+    logger.info("Creating report for user %s", user_id)
     
+    os.makedirs(TEMP_FOLDER, exist_ok=True)
+
     # 1. Fetch all necessary data from the database
     dashboard_data = db.get_dashboard_data_for_user(user_id)
     user_profile = dashboard_data.get('user_profile', {})
@@ -129,5 +134,5 @@ def create_user_report(user_id: int) -> str:
     pdf_path = os.path.join(TEMP_FOLDER, pdf_filename)
     pdf.output(pdf_path)
     
-    print(f"--- [Report Gen] SUCCESS: Saved PDF to {pdf_path} ---")
+    logger.info("Saved PDF to %s", pdf_path)
     return pdf_path, pdf_filename
\ No newline at end of file
@@ -0,0 +1,99 @@
+# file: sequence_windows.py
+#
+# Training windows over CGM series without copying them. sliding_window_view
+# returns strided views into the (scaled) series, so a year of 5-minute data
+# (~105k points) costs no extra memory however many windows it holds; only
+# the batch currently being trained on is materialized.
+#
+#   inputs, targets = sliding_windows(series, look_back=12, horizon=1)
+#   batches = WindowBatches(inputs, targets, batch_size=32, shuffle=True)
+#
+# `series` is (T,) for glucose only or (T, channels), e.g. glucose, carbs and
+# insulin per reading (see events_per_step / stack_channels).
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def sliding_windows(series, look_back: int, horizon: int = 1, target_channel: int = 0) -> tuple:
+    """
+    Zero-copy (inputs, targets) views over the series:
+    inputs (n, look_back, channels) and targets (n, horizon) of `target_channel`,
+    where window i sees series[i:i + look_back] and predicts the next `horizon` steps.
+    """
+    series = np.asarray(series)
+    if series.ndim == 1:
+        series = series[:, np.newaxis]
+    n = len(series) - look_back - horizon + 1
+    if n <= 0:
+        return (np.empty((0, look_back, series.shape[1]), dtype=series.dtype),
+                np.empty((0, horizon), dtype=series.dtype))
+    # (T - look_back + 1, channels, look_back) -> (n, look_back, channels), still a view
+    inputs = sliding_window_view(series, look_back, axis=0)[:n].transpose(0, 2, 1)
+    targets = sliding_window_view(series[look_back:, target_channel], horizon)[:n]
+    return inputs, targets
+
+
+def _seconds(times) -> np.ndarray:
+    return np.array([t.timestamp() if hasattr(t, "timestamp") else float(t) for t in times], dtype=np.float64)
+
+
+def events_per_step(reading_times, event_times, event_values) -> np.ndarray:
+    """
+    Sums events (meal carbs, insulin units) onto the reading grid: each reading
+    gets the events after the previous reading, up to and including itself.
+    Events after the last reading are dropped. Times must be sorted ascending.
+    """
+    readings = _seconds(reading_times)
+    per_step = np.zeros(len(readings), dtype=np.float32)
+    if not len(readings) or not len(event_times):
+        return per_step
+    slots = np.searchsorted(readings, _seconds(event_times), side="left")
+    keep = slots < len(readings)
+    per_step += np.bincount(slots[keep], weights=np.asarray(event_values, dtype=np.float64)[keep], minlength=len(readings)).astype(np.float32)
+    return per_step
+
+
+def stack_channels(*channels) -> np.ndarray:
+    """(T, channels) float32 array from equal-length 1-D series (glucose first)."""
+    return np.column_stack([np.asarray(c, dtype=np.float32) for c in channels])
+
+
+class WindowBatches:
+    """
+    Indexable, re-iterable batches of (inputs, targets) over window views.
+    Each batch is copied out on demand, so peak memory is one batch; with
+    shuffle=True the window order is re-drawn every epoch (call on_epoch_end).
+    """
+
+    def __init__(self, inputs, targets, batch_size: int = 32, start: int = 0, stop: int = None,
+                 shuffle: bool = False, seed: int = None):
+        self.inputs = inputs
+        self.targets = targets
+        self.batch_size = batch_size
+        self.indices = np.arange(start, len(inputs) if stop is None else stop)
+        self.shuffle = shuffle
+        self._rng = np.random.default_rng(seed)
+        if shuffle:
+            self._rng.shuffle(self.indices)
+
+    def __len__(self) -> int:
+        return -(-len(self.indices) // self.batch_size)
+
+    def __getitem__(self, i: int) -> tuple:
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        window_ids = self.indices[i * self.batch_size:(i + 1) * self.batch_size]
+        if not self.shuffle:
+            # Contiguous range: slice the views, then copy just this batch
+            window_ids = slice(window_ids[0], window_ids[-1] + 1)
+        return (np.ascontiguousarray(self.inputs[window_ids], dtype=np.float32),
+                np.ascontiguousarray(self.targets[window_ids], dtype=np.float32))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            self._rng.shuffle(self.indices)
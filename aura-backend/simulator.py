@@ -2,27 +2,26 @@ import random
 import psycopg2
 from psycopg2.extras import execute_values
 from datetime import datetime, timedelta, timezone
-from database import get_db_connection
+from database import db_connection
+import dashboard_cache
+from logging_config import get_logger
+
+logger = get_logger("simulator")
 
 def clear_user_data(user_id):
     """Deletes all non-user data for a specific user to ensure a clean slate."""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("DELETE FROM meal_logs WHERE user_id = %s;", (user_id,))
-        cur.execute("DELETE FROM insulin_doses WHERE user_id = %s;", (user_id,))
-        cur.execute("DELETE FROM glucose_readings WHERE user_id = %s;", (user_id,))
-        conn.commit()
-        print(f"Cleared existing data for user_id: {user_id}")
-    except Exception as e:
-        print(f"An error occurred while clearing data: {e}")
-        if conn:
-            conn.rollback()
-    finally:
-        if conn:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM meal_logs WHERE user_id = %s;", (user_id,))
+            cur.execute("DELETE FROM insulin_doses WHERE user_id = %s;", (user_id,))
+            cur.execute("DELETE FROM glucose_readings WHERE user_id = %s;", (user_id,))
             cur.close()
-            conn.close()
+        logger.info("Cleared existing data for user_id: %s", user_id)
+    except Exception:
+        logger.exception("An error occurred while clearing data")
+    finally:
+        dashboard_cache.invalidate(user_id)
 
 # In simulator.py
 
@@ -33,8 +32,6 @@ def generate_and_insert_data(user_id, days_of_data=3):
     Generates and inserts more realistic time-series data.
     """
     clear_user_data(user_id)
-    conn = get_db_connection()
-    cur = conn.cursor()
 
     now = datetime.now(timezone.utc)
     start_time = now - timedelta(days=days_of_data)
@@ -46,7 +43,9 @@ def generate_and_insert_data(user_id, days_of_data=3):
     active_insulin_effect = 0 
     
     glucose_readings_to_insert = []
-    print(f"Generating data from {start_time} to {now}...")
+    meals_to_insert = []
+    doses_to_insert = []
+    logger.info("Generating data from %s to %s...", start_time, now)
 
     while current_time < now:
         # --- NEW REALISTIC LOGIC ---
@@ -68,16 +67,10 @@ def generate_and_insert_data(user_id, days_of_data=3):
         if is_meal_time and random.random() < 0.15: # Less frequent but adds up
             meal_carbs = random.randint(30, 80)
             meal_description = f"Simulated Meal ({meal_carbs}g)"
-            cur.execute(
-                "INSERT INTO meal_logs (user_id, timestamp, meal_description, carb_count) VALUES (%s, %s, %s, %s)",
-                (user_id, current_time, meal_description, meal_carbs)
-            )
+            meals_to_insert.append((user_id, current_time, meal_description, meal_carbs))
             
             insulin_dose = round(meal_carbs / 12, 1) # Using a 1:12 ratio
-            cur.execute(
-                "INSERT INTO insulin_doses (user_id, timestamp, dose_amount, dose_type) VALUES (%s, %s, %s, %s)",
-                (user_id, current_time, insulin_dose, 'bolus')
-            )
+            doses_to_insert.append((user_id, current_time, insulin_dose, 'bolus'))
 
             # Carbs cause a rise, but insulin will cause a drop.
             # We model the total effect of insulin over the next few hours.
@@ -95,26 +88,37 @@ def generate_and_insert_data(user_id, days_of_data=3):
         glucose_readings_to_insert.append((user_id, current_time, round(current_glucose, 2)))
         current_time += timedelta(minutes=5)
     
-    # --- The insertion logic remains the same ---
-    print(f"Inserting {len(glucose_readings_to_insert)} glucose readings...")
+    # --- All rows go in on one pooled connection, in a single transaction ---
+    logger.info("Inserting %d glucose readings...", len(glucose_readings_to_insert))
     try:
-        # Bulk insert in chunks for performance & lower memory/CPU pressure
-        chunk_size = 1000
-        for i in range(0, len(glucose_readings_to_insert), chunk_size):
-            chunk = glucose_readings_to_insert[i:i+chunk_size]
-            execute_values(
-                cur,
-                "INSERT INTO glucose_readings (user_id, timestamp, glucose_value) VALUES %s",
-                chunk
-            )
-        conn.commit()
-        print(f"Successfully inserted {len(glucose_readings_to_insert)} readings.")
-    except Exception as e:
-        print(f"An error occurred during insert: {e}")
-        conn.rollback()
+        with db_connection() as conn:
+            cur = conn.cursor()
+            if meals_to_insert:
+                execute_values(
+                    cur,
+                    "INSERT INTO meal_logs (user_id, timestamp, meal_description, carb_count) VALUES %s",
+                    meals_to_insert
+                )
+                execute_values(
+                    cur,
+                    "INSERT INTO insulin_doses (user_id, timestamp, dose_amount, dose_type) VALUES %s",
+                    doses_to_insert
+                )
+            # Bulk insert in chunks for performance & lower memory/CPU pressure
+            chunk_size = 1000
+            for i in range(0, len(glucose_readings_to_insert), chunk_size):
+                chunk = glucose_readings_to_insert[i:i+chunk_size]
+                execute_values(
+                    cur,
+                    "INSERT INTO glucose_readings (user_id, timestamp, glucose_value) VALUES %s",
+                    chunk
+                )
+            cur.close()
+        logger.info("Successfully inserted %d readings.", len(glucose_readings_to_insert))
+    except Exception:
+        logger.exception("An error occurred during insert")
     finally:
-        cur.close()
-        conn.close()
+        dashboard_cache.invalidate(user_id)
 
 # ... (keep the if __name__ == '__main__' block) ...
 
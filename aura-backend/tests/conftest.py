@@ -0,0 +1,15 @@
+# file: tests/conftest.py
+#
+# Run from aura-backend/:  python -m pytest -q tests
+# Modules resolve model files relative to aura-backend/, and config.py needs
+# its required settings even when no database is used.
+
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/aura_test")
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret-key-with-at-least-32-chars")
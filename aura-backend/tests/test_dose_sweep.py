@@ -0,0 +1,27 @@
+# file: tests/test_dose_sweep.py
+
+import pytest
+
+import app
+
+
+def test_range_stops_at_or_below_stop():
+    values = app._sweep_axis({"start": 60, "stop": 400, "step": 7}, "glucose", 1000)
+    assert values[0] == 60 and values[-1] == 396
+    assert max(values) <= 400
+
+
+def test_range_includes_a_stop_on_the_step():
+    assert app._sweep_axis({"start": 0, "stop": 0.3, "step": 0.1}, "carbs", 1000) == [0.0, 0.1, 0.2, 0.3]
+
+
+def test_oversized_range_is_rejected_before_allocating():
+    with pytest.raises(app._SweepTooLarge):
+        app._sweep_axis({"start": 0, "stop": 1e12, "step": 1}, "glucose", 1000)
+
+
+@pytest.mark.parametrize("value", ["false", "0", 0, 1, None])
+def test_exercise_flag_accepts_only_booleans(value):
+    with pytest.raises(ValueError):
+        app._sweep_flag(value, "exercise_recent")
+    assert app._sweep_flag(False, "exercise_recent") is False
@@ -0,0 +1,37 @@
+# file: tests/test_food_index.py
+
+import os
+
+import food_index
+from natural_language_processor import EnhancedNLPProcessor
+
+
+def _build(tmp_path):
+    csv_path = tmp_path / "foods.csv"
+    csv_path.write_text("food,carbs_per_serving,serving_size,synonyms\nQuinoa Bowl,52,1 bowl,grain bowl|quinoa  salad\n")
+    out_dir = str(tmp_path / "food_index")
+    food_index.build_food_index(str(csv_path), out_dir)
+    return out_dir
+
+
+def test_lookup_normalizes_keys_like_the_index(tmp_path):
+    index = food_index.FoodIndex(_build(tmp_path))
+    ids, _ = index.lookup(["quinoa bowl", "Quinoa  Bowl", " grain\tbowl ", "quinoa salad", "kale bowl"])
+    assert ids[0] >= 0
+    assert list(ids[1:4]) == [ids[0]] * 3
+    assert ids[4] == -1
+
+
+def test_parser_finds_foods_with_extra_whitespace(tmp_path):
+    processor = EnhancedNLPProcessor(food_index=food_index.FoodIndex(_build(tmp_path)), cache_size=0)
+    parsed = processor.parse_user_text("I had 2 Quinoa   Bowl for lunch")
+    assert [food["food"] for food in parsed["foods_detected"]] == ["quinoa bowl"]
+    assert parsed["carbs"] == 104
+
+
+def test_rebuild_swaps_the_published_version(tmp_path):
+    out_dir = _build(tmp_path)
+    first = os.path.realpath(out_dir)
+    _build(tmp_path)
+    assert os.path.islink(out_dir) and os.path.realpath(out_dir) != first
+    assert os.path.isdir(first)  # Kept for workers still opening it
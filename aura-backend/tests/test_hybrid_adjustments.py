@@ -0,0 +1,40 @@
+# file: tests/test_hybrid_adjustments.py
+#
+# The vectorized hybrid adjustments, constraints and bounds must reproduce
+# the original scalar loops (kept in benchmarks.py as the oracle) exactly.
+
+import numpy as np
+import pytest
+
+import benchmarks
+from prediction_service import FORECAST_HORIZON
+
+try:
+    from hypothesis import given, settings, strategies as st
+except ImportError:  # Optional: the seeded cases below still run
+    given = None
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_vectorized_matches_scalar_on_random_cases(seed):
+    cases = benchmarks.random_hybrid_cases(2000, seed=seed)
+    assert benchmarks.hybrid_mismatches(*cases) == []
+
+
+if given is not None:
+    glucose = st.floats(min_value=0, max_value=600, allow_nan=False)
+
+    @settings(max_examples=500, deadline=None)
+    @given(
+        last_known=glucose,
+        predictions=st.lists(glucose, min_size=FORECAST_HORIZON, max_size=FORECAST_HORIZON),
+        carbs=st.one_of(st.just(0.0), st.floats(min_value=-50, max_value=300, allow_nan=False)),
+        has_activity=st.booleans(),
+        variability=st.floats(min_value=0, max_value=60, allow_nan=False),
+    )
+    def test_vectorized_matches_scalar_property(last_known, predictions, carbs, has_activity, variability):
+        mismatches = benchmarks.hybrid_mismatches(
+            np.array([predictions]), np.array([last_known]), np.array([carbs]),
+            np.array([has_activity]), np.array([variability]),
+        )
+        assert mismatches == []
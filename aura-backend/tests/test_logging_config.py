@@ -0,0 +1,51 @@
+# file: tests/test_logging_config.py
+
+import logging
+
+import logging_config
+
+
+class _Collect(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def _logger(handler, name):
+    logger = logging.getLogger(f"test.{name}")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    return logger
+
+
+def test_records_keep_the_values_they_were_logged_with():
+    target = _Collect()
+    handler = logging_config._NonBlockingQueueHandler(10, target)
+    logger = _logger(handler, "snapshot")
+    payload = {"carbs": 40}
+    logger.info("meal %s", payload, extra={"payload": payload})
+    payload["carbs"] = 90
+    handler.stop()
+
+    (record,) = target.records
+    assert record.getMessage() == "meal {'carbs': 40}"
+    assert record.payload == {"carbs": 40}
+
+
+def test_full_queue_drops_records_and_still_stops():
+    target = _Collect()
+    handler = logging_config._NonBlockingQueueHandler(2, target)
+    handler._ensure_listener()
+    handler._listener.stop()  # Nothing drains the queue, so it fills up
+    logger = _logger(handler, "full")
+    for i in range(5):
+        logger.info("record %d", i)
+    assert handler.dropped == 3
+
+    handler._listener.start()
+    handler.stop()  # Must not raise with the queue at its limit
+    assert [r.getMessage() for r in target.records] == ["record 0", "record 1"]
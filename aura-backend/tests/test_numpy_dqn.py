@@ -0,0 +1,23 @@
+# file: tests/test_numpy_dqn.py
+
+import json
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("stable_baselines3")
+
+import benchmarks
+
+# torch and TensorFlow crash when loaded into one process, so the parity
+# check runs in its own interpreter (the app itself never imports torch).
+_PARITY = "import json, benchmarks; m, d, _, _, obs = benchmarks.dqn_parity(); print(json.dumps([m, d, len(obs)]))"
+
+
+def test_numpy_policy_picks_the_same_actions_as_sb3():
+    result = subprocess.run([sys.executable, "-c", _PARITY], capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stderr
+    mismatches, max_diff, observations = json.loads(result.stdout.strip().splitlines()[-1])
+    assert mismatches == 0, f"{mismatches} of {observations} actions differ"
+    assert max_diff <= benchmarks.DQN_PARITY_TOLERANCE
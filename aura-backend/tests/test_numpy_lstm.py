@@ -0,0 +1,28 @@
+# file: tests/test_numpy_lstm.py
+
+import numpy as np
+import pytest
+
+pytest.importorskip("keras")
+
+import benchmarks
+from numpy_lstm import NumpyLSTMForecaster
+
+
+def test_default_model_rollout_matches_keras():
+    max_diff = benchmarks.lstm_parity()[0]
+    assert max_diff <= benchmarks.LSTM_PARITY_TOLERANCE
+
+
+def test_h5_reader_matches_keras_one_step(tmp_path):
+    from keras.layers import LSTM, Dense, Input
+    from keras.models import Sequential
+
+    model = Sequential([Input((12, 1)), LSTM(8), Dense(1)])
+    path = str(tmp_path / "model.h5")
+    model.save(path)
+
+    windows = np.random.default_rng(1).uniform(0, 1, size=(32, 12, 1)).astype(np.float32)
+    expected = model.predict(windows, verbose=0)
+    actual = NumpyLSTMForecaster.from_file(path).predict(windows)
+    np.testing.assert_allclose(np.ravel(actual), np.ravel(expected), atol=1e-5)
@@ -0,0 +1,23 @@
+# file: tests/test_prediction_service.py
+
+import math
+
+import pytest
+
+import prediction_service as ps
+
+HISTORY = [120.0, 122, 125, 126, 128, 129, 130, 131, 130, 128, 126, 124]
+
+
+@pytest.mark.parametrize("bad", [math.nan, math.inf, -math.inf])
+def test_validate_rejects_non_finite_readings(bad):
+    with pytest.raises(ps.GlucosePredictionError):
+        ps.validate_glucose_history(HISTORY[:-1] + [bad])
+
+
+def test_predict_batch_reports_non_finite_history_per_item():
+    results = ps.predict_batch([0, 0], [HISTORY, HISTORY[:-1] + [math.nan]])
+    assert results[0]["status"] == "success"
+    assert len(results[0]["prediction"]) == ps.FORECAST_HORIZON
+    assert results[1]["status"] == "error"
+    assert "finite" in results[1]["error_message"]
@@ -0,0 +1,37 @@
+# file: tests/test_recommendation_service.py
+
+import itertools
+
+import numpy as np
+import pytest
+
+import recommendation_service as rs
+
+
+@pytest.fixture(scope="module")
+def policy():
+    if rs._get_rl_model() is None:
+        pytest.skip("dosing agent not available")
+
+
+def test_recommend_batch_matches_scalar_recommendations(policy):
+    grid = list(itertools.product(
+        [40, 95, 110, 180, 260, 400],  # glucose
+        [0, 12, 45, 150],              # carbs
+        [0, 12, 23],                   # time_hour
+        [0, 1, 4],                     # last_insulin_hours
+        [False, True],                 # exercise_recent
+        [0, 6, 10],                    # stress_level
+    ))
+    columns = [np.array(c) for c in zip(*grid)]
+    batch = rs.recommend_batch(*columns)
+    expected = [rs.get_insulin_recommendation(*args)["recommended_dose"] for args in grid]
+    np.testing.assert_array_equal(batch["recommended_dose"], expected)
+
+
+def test_recommend_batch_broadcasts_a_sweep_grid(policy):
+    glucose = np.arange(60, 401, 20)[:, None]
+    carbs = np.array([0, 30, 60, 90])[None, :]
+    result = rs.recommend_batch(glucose, carbs)
+    assert result["recommended_dose"].shape == (len(glucose), carbs.shape[1])
+    assert np.all((result["recommended_dose"] >= 0) & (result["recommended_dose"] <= 20))
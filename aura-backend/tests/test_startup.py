@@ -0,0 +1,9 @@
+# file: tests/test_startup.py
+
+import benchmarks
+
+
+def test_booting_the_app_imports_no_heavy_packages():
+    loaded, best_ms, _ = benchmarks.startup_imports(runs=2)
+    assert not loaded, f"booting wsgi:app imports {', '.join(loaded)}"
+    assert best_ms <= benchmarks.STARTUP_IMPORT_BUDGET_MS, f"import wsgi took {best_ms:.0f} ms"
@@ -0,0 +1,17 @@
+# file: tests/test_text_matcher.py
+
+import pytest
+
+import benchmarks
+
+
+def test_matcher_parses_the_test_sentences_like_the_original():
+    sentences, mismatches, _, _ = benchmarks.nlp_mismatches()
+    assert len(sentences) == len(benchmarks.NLP_TEST_SENTENCES)
+    assert mismatches == []
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_matcher_parses_random_sentences_like_the_original(seed):
+    _, mismatches, _, _ = benchmarks.nlp_mismatches(cases=500, seed=seed)
+    assert mismatches == []
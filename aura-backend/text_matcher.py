@@ -0,0 +1,72 @@
+# file: text_matcher.py
+#
+# Multi-pattern string matching (Aho-Corasick). The automaton is built once
+# from a fixed vocabulary; each search then walks the text a single time,
+# however many patterns there are, and reports every occurrence.
+
+from collections import deque
+
+
+def _is_word_char(ch: str) -> bool:
+    # Same notion of a word character as the regex \b / \w on str patterns
+    return ch.isalnum() or ch == "_"
+
+
+class AhoCorasick:
+    """Finds all occurrences of a fixed set of patterns in one pass over the text."""
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._goto = [{}]     # state -> {char: next state}
+        self._fail = [0]
+        self._outputs = [()]  # state -> pattern indices ending here (longest first)
+        for index, pattern in enumerate(self.patterns):
+            self._add(pattern, index)
+        self._link()
+
+    def _add(self, pattern: str, index: int):
+        state = 0
+        for ch in pattern:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][ch] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append(())
+            state = next_state
+        self._outputs[state] = (index,) + self._outputs[state]
+
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(ch, 0)
+                self._outputs[next_state] = self._outputs[next_state] + self._outputs[self._fail[next_state]]
+
+    def iter_matches(self, text: str):
+        """Yields (start, end, pattern_index) for every occurrence, ordered by end position."""
+        goto, fail, outputs, patterns = self._goto, self._fail, self._outputs, self.patterns
+        state = 0
+        for position, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for index in outputs[state]:
+                end = position + 1
+                yield end - len(patterns[index]), end, index
+
+    def iter_word_matches(self, text: str):
+        """Like iter_matches, but only occurrences bounded by \\b on both sides."""
+        last = len(text)
+        for start, end, index in self.iter_matches(text):
+            pattern = self.patterns[index]
+            before = start > 0 and _is_word_char(text[start - 1])
+            after = end < last and _is_word_char(text[end])
+            if before != _is_word_char(pattern[0]) and after != _is_word_char(pattern[-1]):
+                yield start, end, index
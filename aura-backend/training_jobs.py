@@ -0,0 +1,167 @@
+# file: training_jobs.py
+#
+# Calibration (per-user fine-tuning) as managed background jobs. Requests
+# only insert a row in `training_jobs` and hand the job id to a small
+# process pool, so Keras training never runs inside a web worker and never
+# competes with request threads for the GIL. Job state lives in Postgres:
+# every worker can answer status requests, and the partial unique index on
+# active jobs deduplicates repeat requests from the same user.
+#
+# Job lifecycle: queued -> running -> succeeded | failed | cancelled
+#
+# Nightly recalibration of every user (incremental, so only new readings):
+#   python training_jobs.py nightly
+
+import multiprocessing
+import os
+import sys
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+import database as db
+from config import TRAINING_WORKERS, TRAINING_JOBS_PER_PROCESS, TRAINING_JOB_STALE_AFTER
+from logging_config import get_logger
+
+logger = get_logger("training_jobs")
+
+ACTIVE_STATUSES = ("queued", "running")
+TRAINING_MODES = ("incremental", "full")
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+def _get_executor(replace_broken: bool = False) -> ProcessPoolExecutor:
+    """Bounded training pool for this web worker (recreated after fork or a crashed child)."""
+    global _executor, _executor_pid
+    if _executor is not None and _executor_pid == os.getpid() and not replace_broken:
+        return _executor
+    with _executor_lock:
+        if replace_broken or _executor is None or _executor_pid != os.getpid():
+            # spawn: children start clean instead of inheriting the web worker's
+            # threads and sockets. A child keeps TensorFlow loaded across jobs
+            # (clearing the Keras session after each) and is replaced after
+            # TRAINING_JOBS_PER_PROCESS jobs to bound slow memory growth.
+            _executor = ProcessPoolExecutor(
+                max_workers=TRAINING_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                max_tasks_per_child=TRAINING_JOBS_PER_PROCESS,
+            )
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def _run_job(job_id: str, user_id: int, mode: str):
+    """Runs in a training process: moves the job through its states and trains."""
+    if not db.update_training_job(job_id, ("queued",), status="running", started=True):
+        return  # Cancelled (or abandoned) while waiting in the queue
+
+    import model_trainer
+    def report_progress(fraction: float) -> bool:
+        # False once the job is no longer running, i.e. it was cancelled. The
+        # conditional update is also the last check before a model is published.
+        return db.update_training_job(job_id, ("running",), progress=round(fraction, 4))
+
+    try:
+        result = model_trainer.fine_tune_model_for_user(user_id, progress_callback=report_progress, mode=mode)
+    except Exception as e:
+        logger.exception("Training job %s for user %s failed", job_id, user_id)
+        db.update_training_job(job_id, ("running",), status="failed", error=str(e), finished=True)
+        return
+    finally:
+        model_trainer.release_training_memory()
+
+    if result["status"] in ("succeeded", "up_to_date"):
+        db.update_training_job(
+            job_id, ("running",), status="succeeded", progress=1.0, val_loss=result.get("val_loss"), result=result, finished=True
+        )
+    elif result["status"] == "insufficient_data":
+        db.update_training_job(
+            job_id, ("running",), status="failed", result=result, finished=True,
+            error=f"Not enough glucose readings to train ({result['readings']} of {model_trainer.MIN_TRAINING_READINGS})",
+        )
+
+
+def _on_job_done(job_id: str, future):
+    # A child that dies (e.g. OOM-killed) cannot record its own failure.
+    error = future.exception()
+    if error is not None:
+        logger.error("Training process for job %s exited abnormally: %s", job_id, error)
+        db.update_training_job(job_id, ACTIVE_STATUSES, status="failed", error=f"Training process crashed: {error}", finished=True)
+
+
+def submit_calibration(user_id: int, mode: str = "incremental") -> tuple:
+    """
+    Queues fine-tuning for the user, or returns their job that is already
+    queued/running. Returns (job status dict, created?).
+    """
+    if mode not in TRAINING_MODES:
+        raise ValueError(f"mode must be one of {TRAINING_MODES}")
+    row, created = db.create_training_job(user_id, str(uuid.uuid4()), TRAINING_JOB_STALE_AFTER, mode)
+    if created:
+        job_id = row["job_id"]
+        try:
+            future = _get_executor().submit(_run_job, job_id, user_id, mode)
+        except BrokenProcessPool:
+            future = _get_executor(replace_broken=True).submit(_run_job, job_id, user_id, mode)
+        future.add_done_callback(lambda f: _on_job_done(job_id, f))
+        logger.info("Queued training job %s for user %s", job_id, user_id)
+    else:
+        logger.info("User %s already has training job %s (%s)", user_id, row["job_id"], row["status"])
+    return job_status(row), created
+
+
+def get_job(job_id: str):
+    """The job's status dict, or None for an unknown (or malformed) id."""
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        return None
+    row = db.get_training_job(job_id)
+    return job_status(row) if row else None
+
+
+def cancel_job(job_id: str) -> bool:
+    """Cancels a queued or running job; a running one stops after its current epoch."""
+    return db.update_training_job(job_id, ACTIVE_STATUSES, status="cancelled", finished=True)
+
+
+def job_status(row: dict) -> dict:
+    started, finished = row["started_at"], row["finished_at"]
+    duration = None
+    if started is not None:
+        duration = round(((finished or datetime.now(timezone.utc)) - started).total_seconds(), 1)
+    return {
+        "job_id": row["job_id"],
+        "user_id": row["user_id"],
+        "mode": row["mode"],
+        "status": row["status"],
+        "progress": row["progress"],
+        "created_at": row["created_at"].isoformat(),
+        "started_at": started.isoformat() if started else None,
+        "finished_at": finished.isoformat() if finished else None,
+        "duration_seconds": duration,
+        "val_loss": row["val_loss"],
+        "error": row["error"],
+        "result": row["result"],
+    }
+
+
+def recalibrate_all_users() -> dict:
+    """Queues an incremental job for every user and waits for the pool to finish. Returns status counts."""
+    job_ids = [submit_calibration(user_id)[0]["job_id"] for user_id in db.get_all_user_ids()]
+    _get_executor().shutdown(wait=True)
+    counts = {}
+    for job_id in job_ids:
+        status = get_job(job_id)["status"]
+        counts[status] = counts.get(status, 0) + 1
+    return counts
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ["nightly"]:
+        print("Usage: python training_jobs.py nightly")
+        sys.exit(2)
+    print(f"Recalibration finished: {recalibrate_all_users()}")